@@ -1,33 +1,76 @@
-from fastapi import APIRouter, File, UploadFile, HTTPException, Query
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, BackgroundTasks, File, UploadFile, HTTPException, Query
+from fastapi.responses import JSONResponse, StreamingResponse
 from typing import List, Literal, Optional
 from utils.s3_service import s3_service
+from utils.worker_pool import pool_stats, extraction_pool
+from services.extraction_cache import extraction_cache, hash_file
+from services.llm_cache import llm_cache
+from services.prompt_encoding import encoding_stats
 from datetime import datetime
 import asyncio
 import os
 import json
 import shutil
 import tempfile
+import time
 
-from services.extract import process_file_async, poll_until_ready, get_latest_json_files
+from services.extract import (
+    process_saved_file_async,
+    save_upload,
+    get_latest_json_files,
+    load_page_ranges,
+    record_pages,
+    pdf_routing_stats
+)
+from services.jobs import job_store
+from services.manifest import classify_uploads, unchanged_result, remove_stale_analyses, record_batch
 from services.analyze import (
-    get_individual_analysis_prompt,
-    get_consolidated_analysis_prompt,
-    analyze_with_claude,
-    extract_json_from_response,
-    validate_analysis_schema
+    get_individual_analysis_prompt_parts,
+    analyze_structured,
+    analyze_with_claude_stream,
+    ANALYSIS_TOOL,
+    validate_analysis_schema,
+    record_prompt_metrics,
+    prompt_metrics_snapshot,
+    structured_output_snapshot,
+    analysis_prompt_version,
+    bedrock_usage_stats
+)
+from services.chunked_analysis import needs_map_reduce, map_reduce_analysis, map_reduce_prompt_version
+from services.consolidation import consolidate_analyses, prepare_consolidation_prompt, CONSOLIDATION_MAX_TOKENS
+from services.doc_classification import classification_index, detect_document_type, verification_dir_for
+from services.user_kyc import run_kyc_pipeline
+from services.structured_summary import (
+    run_structured_summary_prompt,
+    consolidate_structured_summaries,
+    normalize_summary,
+    summary_file_path,
+    save_file_summary,
+    load_stored_summary
+)
+from services.fused_analysis import run_fused_analysis, fused_prompt_version
+from services.summary_merge import merge_structured_summaries
+from services.summary_prefill import summary_prefill_stats
+from services.incremental import (
+    fetch_from_s3_if_missing,
+    load_reusable_analysis,
+    consolidation_fingerprint,
+    consolidation_record_path,
+    load_consolidation,
+    save_consolidation
 )
-from services.doc_classification import classify_verification_documents
-from services.user_kyc import generate_user_kyc
-from services.structured_summary import run_structured_summary_prompt, consolidate_structured_summaries
 from services.chat import answer_query
-from models.schemas import LifeSummary, PropertyCasualtySummary
 from config.settings import (
     NANONETS_API_KEY,
     AWS_ACCESS_KEY_ID,
     AWS_SECRET_ACCESS_KEY,
     OUTPUT_DIR,
-    ANALYSIS_OUTPUT_DIR
+    ANALYSIS_OUTPUT_DIR,
+    MAX_WORKERS,
+    DOC_TYPE_AWARE_PROMPTS,
+    FUSED_ANALYSIS_SUMMARY,
+    SUMMARY_LOCAL_MERGE,
+    CONSOLIDATION_FAN_IN
 )
 
 router = APIRouter()
@@ -38,10 +81,11 @@ async def root():
         "message": "File Extraction & Analysis API",
         "version": "2.0.0",
         "endpoints": {
-            "extraction": ["/extract"],
-            "analysis": ["/analysis"],
+            "extraction": ["/extract", "/extract/stream", "/jobs/{job_id}"],
+            "analysis": ["/analysis", "/analysis/stream"],
             "kyc": ["/get_kyc"],
-            "chat": ["/chat"]
+            "chat": ["/chat"],
+            "metrics": ["/metrics"]
         }
     }
 
@@ -55,21 +99,27 @@ async def health():
         "aws_bedrock_configured": bool(AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY)
     }
 
-@router.post("/extract")
-async def extract_files(
-    files: List[UploadFile] = File(...),
-    submission_id: Optional[str] = Query(None, description="Submission ID for organizing files in S3")
-):
-    """
-    Extract files (PDF, images, Excel, CSV) to JSON and optionally upload to S3
-    
-    Args:
-        files: List of files to extract (PDF, images, Excel, CSV)
-        submission_id: Optional submission ID for organizing files in S3
-    
-    Returns:
-        JSON response with extraction results
-    """
+@router.get("/metrics")
+async def metrics():
+    """Queue depth for the shared upstream worker pools, cache hit/miss and PDF routing counters."""
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "worker_pools": pool_stats(),
+        "extraction_cache": extraction_cache.stats(),
+        "llm_cache": llm_cache.stats(),
+        "prompt_encoding": encoding_stats(),
+        "analysis_prompts": prompt_metrics_snapshot(),
+        "structured_output": structured_output_snapshot(),
+        "bedrock_usage": dict(bedrock_usage_stats),
+        "summary_prefill": dict(summary_prefill_stats),
+        "kyc_classification": classification_index.stats(),
+        "pdf_routing": dict(pdf_routing_stats)
+    }
+
+# Allowed file extensions
+ALLOWED_EXTENSIONS = {'.pdf', '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.xlsx', '.xls', '.csv'}
+
+def _clear_previous_outputs(submission_id: Optional[str]) -> None:
     # If submission_id provided, clear only that submission's directory; otherwise clear all
     if submission_id:
         # Clear only submission-specific directory
@@ -95,14 +145,20 @@ async def extract_files(
                 if os.path.isfile(file_path):
                     os.remove(file_path)
 
-    # Allowed file extensions
-    ALLOWED_EXTENSIONS = {'.pdf', '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.xlsx', '.xls', '.csv'}
-    
+def _validate_uploads(files: List[UploadFile]) -> None:
     if not files:
         raise HTTPException(
             status_code=400, 
             detail="No files provided. Upload at least one file (PDF, images, Excel, CSV) in the 'files' field."
         )
+    names = [os.path.basename(f.filename or "") for f in files]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        # outputs, manifest entries and job progress are all keyed by file name
+        raise HTTPException(
+            status_code=400,
+            detail=f"Duplicate file names in one upload: {', '.join(duplicates)}. Rename or upload them separately."
+        )
     for f in files:
         file_ext = os.path.splitext(f.filename.lower())[1] if f.filename else ""
         if file_ext not in ALLOWED_EXTENSIONS:
@@ -110,23 +166,194 @@ async def extract_files(
                 status_code=400, 
                 detail=f"Invalid file type: {f.filename}. Allowed types: PDF, images (JPG, PNG, GIF, BMP), Excel (XLSX, XLS), CSV."
             )
+
+async def _plan_batch(temp_paths: List[str], submission_id: Optional[str], mode: str) -> dict:
+    """
+    Decide per upload whether it must be extracted.
+
+    In append mode uploads are compared with the submission manifest: identical files
+    are skipped and the stale analyses of replaced files are removed. In replace mode
+    every upload is new.
+    """
+    file_hashes = {}
+    for temp_path in temp_paths:
+        file_hashes[os.path.basename(temp_path)] = await extraction_pool.run(hash_file, temp_path)
+    if mode != "append":
+        return {name: "new" for name in file_hashes}
+    statuses = await asyncio.to_thread(classify_uploads, file_hashes, submission_id)
+    changed = [name for name, status in statuses.items() if status == "changed"]
+    if changed:
+        await asyncio.to_thread(remove_stale_analyses, changed, submission_id)
+    return statuses
+
+async def _extract_planned(temp_path: str, statuses: dict, submission_id: Optional[str]) -> dict:
+    filename = os.path.basename(temp_path)
+    status = statuses.get(filename, "new")
+    if status == "unchanged":
+        os.remove(temp_path)
+        result = unchanged_result(filename, submission_id)
+    else:
+        result = await process_saved_file_async(temp_path, NANONETS_API_KEY, submission_id, upload_to_s3=True)
+    result["manifest_status"] = status
+    return result
+
+def _spool_uploads(files: List[UploadFile]) -> tuple:
+    # Uploads are spooled to disk up front; the request's file handles are not ours once we respond
     temp_dir = tempfile.mkdtemp()
     try:
-        # Pass submission_id to process_file_async for S3 upload
-        tasks = [process_file_async(f, NANONETS_API_KEY, temp_dir, submission_id, upload_to_s3=True) for f in files]
-        results = await asyncio.gather(*tasks)
+        return temp_dir, [save_upload(f, temp_dir) for f in files]
+    except Exception:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+
+async def _start_batch(files: List[UploadFile], submission_id: Optional[str], mode: str) -> tuple:
+    if mode == "append" and not submission_id:
+        raise HTTPException(status_code=400, detail="mode=append requires a submission_id.")
+    if mode == "replace":
+        await asyncio.to_thread(_clear_previous_outputs, submission_id)
+    _validate_uploads(files)
+    return await asyncio.to_thread(_spool_uploads, files)
+
+async def _run_extraction_job(job_id: str, temp_paths: List[str], temp_dir: str, submission_id: Optional[str], mode: str) -> None:
+    """Background body of an async /extract call; progress is written to the job store."""
+    # job-state writes are file I/O under the store lock; keep them off the event loop
+    await asyncio.to_thread(job_store.mark_running, job_id)
+
+    async def run_one(temp_path: str, statuses: dict) -> dict:
+        result = await _extract_planned(temp_path, statuses, submission_id)
+        await asyncio.to_thread(job_store.record_file_result, job_id, os.path.basename(temp_path), result)
+        return result
+
+    try:
+        statuses = await _plan_batch(temp_paths, submission_id, mode)
+        results = await asyncio.gather(*(run_one(p, statuses) for p in temp_paths))
+        batch = await asyncio.to_thread(record_batch, results, statuses, submission_id)
+        await asyncio.to_thread(job_store.complete, job_id, {
+            "total_files": len(results),
+            "results": results,
+            "success_count": sum(1 for r in results if r.get("success")),
+            "failure_count": sum(1 for r in results if not r.get("success")),
+            "manifest": batch,
+            "timestamp": datetime.now().isoformat()
+        })
+    except Exception as e:
+        await asyncio.to_thread(job_store.fail, job_id, str(e))
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+@router.post("/extract")
+async def extract_files(
+    background_tasks: BackgroundTasks,
+    files: List[UploadFile] = File(...),
+    submission_id: Optional[str] = Query(None, description="Submission ID for organizing files in S3"),
+    async_mode: bool = Query(False, description="Return a job ID immediately and extract in the background; poll /jobs/{job_id}"),
+    mode: Literal["replace", "append"] = Query("replace", description="'replace' wipes prior outputs; 'append' keeps them and re-extracts only new or changed files")
+):
+    """
+    Extract files (PDF, images, Excel, CSV) to JSON and optionally upload to S3
+    
+    Args:
+        files: List of files to extract (PDF, images, Excel, CSV)
+        submission_id: Optional submission ID for organizing files in S3
+        async_mode: If True, respond 202 with a job ID instead of waiting for extraction
+        mode: 'replace' (default) clears previous outputs and analyses first; 'append' keeps
+              them, skips uploads identical to the manifest and replaces only new/changed files
+    
+    Returns:
+        JSON response with extraction results and the manifest batch summary, or the job ID in async mode
+    """
+    temp_dir, temp_paths = await _start_batch(files, submission_id, mode)
+
+    if async_mode:
+        job = await asyncio.to_thread(
+            job_store.create, "extract", [os.path.basename(p) for p in temp_paths], submission_id=submission_id
+        )
+        background_tasks.add_task(_run_extraction_job, job["job_id"], temp_paths, temp_dir, submission_id, mode)
+        return JSONResponse(content={
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "status_url": f"/jobs/{job['job_id']}",
+            "total_files": len(files),
+            "timestamp": datetime.now().isoformat()
+        }, status_code=202)
+
+    try:
+        # Pass submission_id through for S3 upload
+        statuses = await _plan_batch(temp_paths, submission_id, mode)
+        results = await asyncio.gather(*(_extract_planned(p, statuses, submission_id) for p in temp_paths))
+        batch = await asyncio.to_thread(record_batch, results, statuses, submission_id)
 
         response_data = {
             "total_files": len(files),
             "results": results,
             "success_count": sum(1 for r in results if r.get("success")),
             "failure_count": sum(1 for r in results if not r.get("success")),
+            "manifest": batch,
             "timestamp": datetime.now().isoformat()
         }
         return JSONResponse(content=response_data, status_code=200)
     finally:
         shutil.rmtree(temp_dir, ignore_errors=True)
 
+@router.post("/extract/stream")
+async def extract_files_stream(
+    files: List[UploadFile] = File(...),
+    submission_id: Optional[str] = Query(None, description="Submission ID for organizing files in S3"),
+    mode: Literal["replace", "append"] = Query("replace", description="'replace' wipes prior outputs; 'append' keeps them and re-extracts only new or changed files")
+):
+    """
+    Extract files like /extract, streaming each file's result as NDJSON the moment it finishes
+
+    Each line is a JSON object: {"type": "result", "index": <upload position>, "result": {...}}
+    per file in completion order, followed by a final {"type": "summary", ...} line with the counts.
+    """
+    temp_dir, temp_paths = await _start_batch(files, submission_id, mode)
+
+    async def run_one(index: int, temp_path: str, statuses: dict):
+        result = await _extract_planned(temp_path, statuses, submission_id)
+        return index, result
+
+    async def ndjson_stream():
+        tasks = []
+        results = []
+        try:
+            statuses = await _plan_batch(temp_paths, submission_id, mode)
+            tasks = [asyncio.create_task(run_one(i, p, statuses)) for i, p in enumerate(temp_paths)]
+            for next_done in asyncio.as_completed(tasks):
+                index, result = await next_done
+                results.append(result)
+                yield json.dumps({"type": "result", "index": index, "result": result}, ensure_ascii=False) + "\n"
+            batch = await asyncio.to_thread(record_batch, results, statuses, submission_id)
+            success_count = sum(1 for r in results if r.get("success"))
+            yield json.dumps({
+                "type": "summary",
+                "total_files": len(temp_paths),
+                "success_count": success_count,
+                "failure_count": len(temp_paths) - success_count,
+                "manifest": batch,
+                "timestamp": datetime.now().isoformat()
+            }) + "\n"
+        finally:
+            # Client went away mid-stream: stop outstanding extractions
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson")
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Status of a background job started with async_mode=true.
+
+    Returns per-file progress while running and the full extraction results once completed.
+    """
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return JSONResponse(content=job, status_code=200)
+
 @router.post("/get_kyc")
 async def get_kyc(
     submission_id: Optional[str] = Query(None, description="Optional submission ID for organizing files per submission")
@@ -134,62 +361,215 @@ async def get_kyc(
     """
     Run document classification over outputs and then build user_kyc.json.
     
+    Files are classified as they are extracted, so only outputs not seen since
+    (or changed) are parsed here, each once; user_kyc.json is built from the
+    parsed content without re-reading the copies.
+
     If submission_id is provided:
     - Reads JSON files from outputs/{submission_id}/
-    - Moves classified files to verification_documents/{submission_id}/
+    - Copies classified files to verification_documents/{submission_id}/ (originals are kept)
     - Generates user_kyc.json in verification_documents/{submission_id}/
     
     If submission_id is not provided (backward compatible):
     - Reads JSON files from outputs/
-    - Moves classified files to verification_documents/
+    - Copies classified files to verification_documents/ (originals are kept)
     - Generates user_kyc.json in verification_documents/
     """
     classification_status = "success"
     kyc_status = "success"
     
-    # Determine verification directory based on submission_id
-    base_root = os.path.abspath(os.path.join(OUTPUT_DIR, os.pardir))
-    if submission_id:
-        verification_dir = os.path.join(base_root, "verification_documents", submission_id)
-    else:
-        verification_dir = os.path.join(base_root, "verification_documents")
-    
+    verification_dir = verification_dir_for(submission_id)
     kyc_file = os.path.join(verification_dir, "user_kyc.json")
+    documents = {}
 
     try:
-        classify_verification_documents(submission_id=submission_id)
+        result = await asyncio.to_thread(run_kyc_pipeline, submission_id)
+        documents = result["documents"]
     except Exception as e:
-        classification_status = f"error: {str(e)}"
-
-    try:
-        generate_user_kyc(submission_id=submission_id)
-    except Exception as e:
-        kyc_status = f"error: {str(e)}"
+        classification_status = kyc_status = f"error: {str(e)}"
 
     return JSONResponse(content={
         "submission_id": submission_id,
         "classification": classification_status,
         "kyc": kyc_status,
+        "documents": documents,
         "verification_dir": verification_dir,
         "kyc_file": kyc_file,
         "timestamp": datetime.now().isoformat()
     }, status_code=200)
 
-@router.post("/analysis")
-async def analyze_documents(
-    insurance_type: Literal["life", "property_casualty"] = Query(..., description="Type of insurance analysis"),
-    submission_id: Optional[str] = Query(None, description="Submission ID for organizing files in S3")
-):
+async def _analyze_json_file(
+    json_file: str,
+    insurance_type: str,
+    analysis_output_dir: str,
+    submission_id: Optional[str] = None,
+    use_cache: bool = True,
+    fused: bool = False,
+    force: bool = False
+) -> dict:
     """
-    Analyze extracted documents and optionally upload to S3
-    
-    Args:
-        insurance_type: Type of insurance analysis ('life' or 'property_casualty')
-        submission_id: Optional submission ID for organizing files in S3
-    
-    Returns:
-        JSON response with analysis results
+    Run the individual Claude analysis for one extracted JSON file and persist it.
+
+    A stored analysis produced from the same extracted content with the same prompt
+    version is reused (reported with "reused": True) unless `force` is set. The version
+    names the prompt path (single call, fused or map-reduce), so switching paths re-analyzes.
+
+    With `fused`, the same call also returns the file's structured summary, which is
+    stored as {base}_summary_{insurance_type}.json for /structured_summary to serve; a
+    fused run is only reused while a current stored summary exists as well.
+    Oversized (map-reduce) files are analyzed without the summary.
+
+    Never raises: failures are reported in the returned result dict so that one
+    bad file does not abort the rest of the submission.
     """
+    try:
+        with open(json_file, 'r', encoding='utf-8') as f:
+            extracted_data = f.read()
+        extracted_data = json.loads(extracted_data)
+        doc_type = detect_document_type(extracted_data)
+        source_sha256 = await asyncio.to_thread(hash_file, json_file)
+        prompt_doc_type = doc_type if DOC_TYPE_AWARE_PROMPTS else None
+        map_reduce = needs_map_reduce(extracted_data)
+        fused = fused and not map_reduce
+        if map_reduce:
+            prompt_version = map_reduce_prompt_version(insurance_type, prompt_doc_type)
+        elif fused:
+            prompt_version = fused_prompt_version(insurance_type, prompt_doc_type)
+        else:
+            prompt_version = analysis_prompt_version(insurance_type, prompt_doc_type)
+        base_name = os.path.splitext(os.path.basename(json_file))[0]
+        analysis_file = os.path.join(analysis_output_dir, f"{base_name}_analysis_{insurance_type}.json")
+        s3_key = f"lnh-submissions/{submission_id}/analysis/{base_name}_analysis_{insurance_type}.json" if submission_id else None
+
+        if not force:
+            await asyncio.to_thread(fetch_from_s3_if_missing, analysis_file, submission_id, "analysis")
+            stored = load_reusable_analysis(analysis_file, source_sha256, prompt_version)
+            stored_summary_file = None
+            if stored is not None and fused:
+                # fusing is only worth skipping while the summary half is stored too
+                stored_summary_file = summary_file_path(analysis_output_dir, json_file, insurance_type)
+                await asyncio.to_thread(fetch_from_s3_if_missing, stored_summary_file, submission_id, "summary")
+                if load_stored_summary(stored_summary_file, source_sha256, insurance_type) is None:
+                    stored = None
+            if stored is not None:
+                return {
+                    "file": os.path.basename(json_file),
+                    "status": "success",
+                    "reused": True,
+                    "document_type": stored.get("document_type"),
+                    "map_reduce": stored.get("map_reduce"),
+                    "analysis": stored["analysis"],
+                    "analysis_saved_to": analysis_file,
+                    "summary_saved_to": stored_summary_file,
+                    "s3_url": s3_service.url_for(s3_key) if s3_key else None,
+                    "s3_key": s3_key,
+                    "source_sha256": source_sha256,
+                    "prompt_version": prompt_version
+                }
+
+        map_reduce_stats = None
+        if map_reduce:
+            ranges = await asyncio.to_thread(load_page_ranges, json_file)
+            result = await map_reduce_analysis(
+                insurance_type, extracted_data, prompt_doc_type, use_cache,
+                source_pages=record_pages(ranges, len(extracted_data)) if ranges else None
+            )
+            map_reduce_stats = result.get("map_reduce")
+        elif fused:
+            result = await run_fused_analysis(insurance_type, extracted_data, prompt_doc_type, use_cache)
+        else:
+            prefix, suffix = get_individual_analysis_prompt_parts(insurance_type, extracted_data, prompt_doc_type)
+            started = time.perf_counter()
+            result = await analyze_structured(
+                suffix, ANALYSIS_TOOL, validate_analysis_schema, use_cache=use_cache, cacheable_prefix=prefix
+            )
+            if result["success"]:
+                record_prompt_metrics(
+                    doc_type, len(prefix) + len(suffix), (time.perf_counter() - started) * 1000, result.get("cached", False)
+                )
+        if not result["success"]:
+            return {
+                "file": os.path.basename(json_file),
+                "status": "error",
+                "error": result.get("error", "Unknown error"),
+                "raw_response": result.get("raw_response")
+            }
+        try:
+            analysis_json = result["analysis"]
+            is_valid, validation_error = validate_analysis_schema(analysis_json)
+            if not is_valid:
+                return {
+                    "file": os.path.basename(json_file),
+                    "status": "error",
+                    "error": f"Schema validation failed: {validation_error}",
+                    "raw_response": str(result["analysis"])[:500]
+                }
+            analysis_with_metadata = {
+                "source_file": os.path.basename(json_file),
+                "analysis_timestamp": datetime.now().isoformat(),
+                "insurance_type": insurance_type,
+                "document_type": doc_type,
+                "source_sha256": source_sha256,
+                "prompt_version": prompt_version,
+                "map_reduce": map_reduce_stats,
+                "analysis": analysis_json
+            }
+
+            # Save locally first
+            with open(analysis_file, 'w', encoding='utf-8') as f:
+                json.dump(analysis_with_metadata, f, ensure_ascii=False, indent=2)
+
+            # Upload to S3 if submission_id provided
+            s3_url = None
+            if submission_id:
+                s3_url = await asyncio.to_thread(
+                    s3_service.upload_file, analysis_file, s3_key, content_type="application/json"
+                )
+
+            summary_file = None
+            if result.get("structured_summary") is not None:
+                summary_file = await asyncio.to_thread(
+                    save_file_summary, analysis_output_dir, json_file, insurance_type,
+                    result["structured_summary"], source_sha256, doc_type, "fused"
+                )
+                if submission_id:
+                    await asyncio.to_thread(
+                        s3_service.upload_file, summary_file,
+                        f"lnh-submissions/{submission_id}/summary/{os.path.basename(summary_file)}",
+                        content_type="application/json"
+                    )
+
+            return {
+                "file": os.path.basename(json_file),
+                "status": "success",
+                "reused": False,
+                "document_type": doc_type,
+                "map_reduce": map_reduce_stats,
+                "analysis": analysis_json,  # Include the actual analysis JSON data
+                "analysis_saved_to": analysis_file,
+                "summary_saved_to": summary_file,
+                "s3_url": s3_url,
+                "s3_key": s3_key,
+                "source_sha256": source_sha256,
+                "prompt_version": prompt_version
+            }
+        except Exception as e:
+            return {
+                "file": os.path.basename(json_file),
+                "status": "error",
+                "error": f"Failed to parse Claude response as JSON: {str(e)}",
+                "raw_response": str(result["analysis"])[:500]
+            }
+    except Exception as e:
+        return {
+            "file": os.path.basename(json_file),
+            "status": "error",
+            "error": str(e)
+        }
+
+
+def _analysis_inputs(submission_id: Optional[str]) -> tuple:
+    """Resolve the extracted JSON files and analysis output directory, or raise HTTPException."""
     if not (AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY):
         raise HTTPException(
             status_code=500,
@@ -204,110 +584,168 @@ async def analyze_documents(
             detail="No JSON files found. Please extract files first."
         )
     
-    individual_analyses = []
-    analysis_results = []
-    
     # Create submission-specific analysis directory if needed
     analysis_output_dir = ANALYSIS_OUTPUT_DIR
     if submission_id:
         analysis_output_dir = os.path.join(ANALYSIS_OUTPUT_DIR, submission_id)
         os.makedirs(analysis_output_dir, exist_ok=True)
+    return json_files, analysis_output_dir
+
+
+async def _run_individual_analyses(
+    json_files: List[str],
+    insurance_type: str,
+    analysis_output_dir: str,
+    submission_id: Optional[str],
+    use_cache: bool,
+    fused: bool = False,
+    force: bool = False
+) -> List[dict]:
+    # Fan out per-file analyses under a bounded limit; gather keeps input order
+    semaphore = asyncio.Semaphore(MAX_WORKERS)
+
+    async def run_bounded(json_file: str) -> dict:
+        async with semaphore:
+            return await _analyze_json_file(
+                json_file, insurance_type, analysis_output_dir, submission_id, use_cache, fused, force
+            )
+
+    return list(await asyncio.gather(*(run_bounded(f) for f in json_files)))
+
+
+def _reuse_report(analysis_results: List[dict]) -> dict:
+    return {
+        "reused_files": [r["file"] for r in analysis_results if r.get("reused")],
+        "recomputed_files": [r["file"] for r in analysis_results if r["status"] == "success" and not r.get("reused")]
+    }
+
+
+async def _recorded_consolidation(
+    insurance_type: str,
+    analysis_results: List[dict],
+    analysis_output_dir: str,
+    submission_id: Optional[str],
+    force: bool
+) -> tuple:
+    """(record path, inputs fingerprint, recorded consolidation or None) for the successful analyses."""
+    inputs = [r for r in analysis_results if r["status"] == "success"]
+    fingerprint = consolidation_fingerprint(insurance_type, inputs, CONSOLIDATION_FAN_IN)
+    record_path = consolidation_record_path(analysis_output_dir, insurance_type)
+    if force:
+        return record_path, fingerprint, None
+    await asyncio.to_thread(fetch_from_s3_if_missing, record_path, submission_id, "analysis")
+    return record_path, fingerprint, load_consolidation(record_path, fingerprint)
+
+
+def _record_consolidation(
+    record_path: str,
+    fingerprint: str,
+    consolidated_analysis: str,
+    analysis_results: List[dict],
+    consolidated_s3_url: Optional[str],
+    consolidation_stats: Optional[dict],
+    submission_id: Optional[str]
+) -> None:
+    documents = [r["file"] for r in analysis_results if r["status"] == "success"]
+    save_consolidation(record_path, fingerprint, consolidated_analysis, documents, consolidated_s3_url, consolidation_stats)
+    if submission_id:
+        s3_key = f"lnh-submissions/{submission_id}/analysis/{os.path.basename(record_path)}"
+        s3_service.upload_file(record_path, s3_key, content_type="application/json")
+
+
+def _named_analyses(analysis_results: List[dict]) -> List[dict]:
+    return [
+        {"document": r["file"], "analysis": r["analysis"]} for r in analysis_results if r["status"] == "success"
+    ]
+
+
+def _save_consolidated_analysis(
+    consolidated_analysis: str,
+    insurance_type: str,
+    analysis_output_dir: str,
+    documents_analyzed: int,
+    submission_id: Optional[str] = None
+) -> Optional[str]:
+    """Write the consolidated markdown locally and to S3 when submission_id is given; returns the S3 URL."""
+    # Save locally first
+    consolidated_file = os.path.join(
+        analysis_output_dir,
+        f"consolidated_analysis_{insurance_type}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md"
+    )
+    with open(consolidated_file, 'w', encoding='utf-8') as f:
+        f.write(f"# Consolidated {insurance_type.replace('_', ' ').title()} Insurance Analysis\n\n")
+        f.write(f"**Generated:** {datetime.now().isoformat()}\n\n")
+        f.write(f"**Documents Analyzed:** {documents_analyzed}\n\n")
+        f.write("---\n\n")
+        f.write(consolidated_analysis)
     
-    for json_file in json_files:
-        try:
-            with open(json_file, 'r', encoding='utf-8') as f:
-                extracted_data = f.read()
-            extracted_data = json.loads(extracted_data)
-            prompt = get_individual_analysis_prompt(insurance_type, extracted_data)
-            result = await analyze_with_claude(prompt)
-            if result["success"]:
-                try:
-                    analysis_json = extract_json_from_response(result["analysis"])
-                    is_valid, validation_error = validate_analysis_schema(analysis_json)
-                    if not is_valid:
-                        analysis_results.append({
-                            "file": os.path.basename(json_file),
-                            "status": "error",
-                            "error": f"Schema validation failed: {validation_error}",
-                            "raw_response": result["analysis"][:500]
-                        })
-                        continue
-                    analysis_with_metadata = {
-                        "source_file": os.path.basename(json_file),
-                        "analysis_timestamp": datetime.now().isoformat(),
-                        "insurance_type": insurance_type,
-                        "analysis": analysis_json
-                    }
-                    individual_analyses.append(analysis_json)
-                    base_name = os.path.splitext(os.path.basename(json_file))[0]
-                    
-                    # Save locally first
-                    analysis_file = os.path.join(
-                        analysis_output_dir,
-                        f"{base_name}_analysis_{insurance_type}.json"
-                    )
-                    with open(analysis_file, 'w', encoding='utf-8') as f:
-                        json.dump(analysis_with_metadata, f, ensure_ascii=False, indent=2)
-                    
-                    # Upload to S3 if submission_id provided
-                    s3_url = None
-                    s3_key = None
-                    if submission_id:
-                        s3_key = f"lnh-submissions/{submission_id}/analysis/{base_name}_analysis_{insurance_type}.json"
-                        s3_url = s3_service.upload_file(analysis_file, s3_key, content_type="application/json")
-                    
-                    analysis_results.append({
-                        "file": os.path.basename(json_file),
-                        "status": "success",
-                        "analysis": analysis_json,  # Include the actual analysis JSON data
-                        "analysis_saved_to": analysis_file,
-                        "s3_url": s3_url,
-                        "s3_key": s3_key
-                    })
-                except Exception as e:
-                    analysis_results.append({
-                        "file": os.path.basename(json_file),
-                        "status": "error",
-                        "error": f"Failed to parse Claude response as JSON: {str(e)}",
-                        "raw_response": result["analysis"][:500]
-                    })
-            else:
-                analysis_results.append({
-                    "file": os.path.basename(json_file),
-                    "status": "error",
-                    "error": result.get("error", "Unknown error")
-                })
-        except Exception as e:
-            analysis_results.append({
-                "file": os.path.basename(json_file),
-                "status": "error",
-                "error": str(e)
-            })
+    # Upload to S3 if submission_id provided
+    if submission_id:
+        s3_key = f"lnh-submissions/{submission_id}/analysis/consolidated_analysis_{insurance_type}.md"
+        return s3_service.upload_file(consolidated_file, s3_key, content_type="text/markdown")
+    return None
+
+
+@router.post("/analysis")
+async def analyze_documents(
+    insurance_type: Literal["life", "property_casualty"] = Query(..., description="Type of insurance analysis"),
+    submission_id: Optional[str] = Query(None, description="Submission ID for organizing files in S3"),
+    use_cache: bool = Query(True, description="Set false to bypass the Bedrock response cache"),
+    fused: bool = Query(FUSED_ANALYSIS_SUMMARY, description="Also extract and store each file's structured summary in the same call"),
+    force: bool = Query(False, description="Re-analyze and re-consolidate even if nothing changed")
+):
+    """
+    Analyze extracted documents and optionally upload to S3
+    
+    Files whose extraction and analysis prompt are unchanged since the last call
+    reuse their stored analysis, and consolidation only runs when the set of
+    inputs changed.
+
+    Args:
+        insurance_type: Type of insurance analysis ('life' or 'property_casualty')
+        submission_id: Optional submission ID for organizing files in S3
+        use_cache: Whether cached Bedrock responses may be reused
+        fused: Store per-file structured summaries for /structured_summary from the same calls
+        force: Recompute every analysis and the consolidation
+    
+    Returns:
+        JSON response with analysis results
+    """
+    json_files, analysis_output_dir = _analysis_inputs(submission_id)
+    analysis_results = await _run_individual_analyses(
+        json_files, insurance_type, analysis_output_dir, submission_id, use_cache, fused, force
+    )
+    individual_analyses = _named_analyses(analysis_results)
+
     consolidated_analysis = None
     consolidated_s3_url = None
+    consolidation_stats = None
+    consolidation_reused = False
     if individual_analyses:
         try:
-            consolidated_prompt = get_consolidated_analysis_prompt(insurance_type, individual_analyses)
-            consolidated_result = await analyze_with_claude(consolidated_prompt, max_tokens=8192)
-            if consolidated_result["success"]:
-                consolidated_analysis = consolidated_result["analysis"]
-                
-                # Save locally first
-                consolidated_file = os.path.join(
-                    analysis_output_dir,
-                    f"consolidated_analysis_{insurance_type}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md"
-                )
-                with open(consolidated_file, 'w', encoding='utf-8') as f:
-                    f.write(f"# Consolidated {insurance_type.replace('_', ' ').title()} Insurance Analysis\n\n")
-                    f.write(f"**Generated:** {datetime.now().isoformat()}\n\n")
-                    f.write(f"**Documents Analyzed:** {len(individual_analyses)}\n\n")
-                    f.write("---\n\n")
-                    f.write(consolidated_analysis)
-                
-                # Upload to S3 if submission_id provided
-                if submission_id:
-                    s3_key = f"lnh-submissions/{submission_id}/analysis/consolidated_analysis_{insurance_type}.md"
-                    consolidated_s3_url = s3_service.upload_file(consolidated_file, s3_key, content_type="text/markdown")
+            record_path, fingerprint, recorded = await _recorded_consolidation(
+                insurance_type, analysis_results, analysis_output_dir, submission_id, force
+            )
+            if recorded is not None:
+                consolidated_analysis = recorded["consolidated_analysis"]
+                consolidated_s3_url = recorded.get("consolidated_s3_url")
+                consolidation_stats = recorded.get("consolidation")
+                consolidation_reused = True
+            else:
+                consolidated_result = await consolidate_analyses(insurance_type, individual_analyses, use_cache=use_cache)
+                consolidation_stats = consolidated_result.get("consolidation")
+                if consolidated_result["success"]:
+                    consolidated_analysis = consolidated_result["analysis"]
+                    # file writes and S3 uploads stay off the event loop, as in /analysis/stream
+                    consolidated_s3_url = await asyncio.to_thread(
+                        _save_consolidated_analysis,
+                        consolidated_analysis, insurance_type, analysis_output_dir, len(individual_analyses), submission_id
+                    )
+                    await asyncio.to_thread(
+                        _record_consolidation,
+                        record_path, fingerprint, consolidated_analysis, analysis_results,
+                        consolidated_s3_url, consolidation_stats, submission_id
+                    )
         except Exception as e:
             consolidated_analysis = f"Error generating consolidated analysis: {str(e)}"
     
@@ -316,25 +754,172 @@ async def analyze_documents(
         "total_files_processed": len(json_files),
         "successful_analyses": len(individual_analyses),
         "failed_analyses": len(json_files) - len(individual_analyses),
+        **_reuse_report(analysis_results),
         "individual_results": analysis_results,
         "consolidated_analysis": consolidated_analysis,
         "consolidated_s3_url": consolidated_s3_url,
+        "consolidation": consolidation_stats,
+        "consolidation_reused": consolidation_reused,
         "timestamp": datetime.now().isoformat()
     }
     return JSONResponse(content=response_data, status_code=200)
 
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/analysis/stream")
+async def analyze_documents_stream(
+    insurance_type: Literal["life", "property_casualty"] = Query(..., description="Type of insurance analysis"),
+    submission_id: Optional[str] = Query(None, description="Submission ID for organizing files in S3"),
+    use_cache: bool = Query(True, description="Set false to bypass the Bedrock response cache"),
+    fused: bool = Query(FUSED_ANALYSIS_SUMMARY, description="Also extract and store each file's structured summary in the same call"),
+    force: bool = Query(False, description="Re-analyze and re-consolidate even if nothing changed")
+):
+    """
+    Same pipeline as /analysis, streamed as Server-Sent Events.
+
+    Events:
+        analyses: per-file results once the individual analyses finish
+        token:    {"text": ...} markdown deltas of the consolidated analysis as Bedrock generates them
+                  (a single event with the recorded text when the consolidation is reused)
+        done:     {"ttfb_ms", "total_ms", "input_tokens", "output_tokens", "cached", "consolidated_s3_url",
+                   "consolidation_reused", ...}
+        error:    {"error": ...}
+    """
+    json_files, analysis_output_dir = _analysis_inputs(submission_id)
+
+    async def sse_stream():
+        analysis_results = await _run_individual_analyses(
+            json_files, insurance_type, analysis_output_dir, submission_id, use_cache, fused, force
+        )
+        individual_analyses = _named_analyses(analysis_results)
+        yield _sse("analyses", {
+            "insurance_type": insurance_type,
+            "total_files_processed": len(json_files),
+            "successful_analyses": len(individual_analyses),
+            "failed_analyses": len(json_files) - len(individual_analyses),
+            **_reuse_report(analysis_results),
+            "individual_results": analysis_results
+        })
+        if not individual_analyses:
+            yield _sse("error", {"error": "No document could be analyzed"})
+            return
+
+        try:
+            record_path, fingerprint, recorded = await _recorded_consolidation(
+                insurance_type, analysis_results, analysis_output_dir, submission_id, force
+            )
+            if recorded is not None:
+                yield _sse("token", {"text": recorded["consolidated_analysis"]})
+                yield _sse("done", {
+                    "consolidation": recorded.get("consolidation"),
+                    "consolidated_s3_url": recorded.get("consolidated_s3_url"),
+                    "consolidation_reused": True,
+                    "timestamp": datetime.now().isoformat()
+                })
+                return
+
+            prompt, consolidation_stats = await prepare_consolidation_prompt(
+                insurance_type, individual_analyses, use_cache=use_cache
+            )
+            async for event in analyze_with_claude_stream(prompt, max_tokens=CONSOLIDATION_MAX_TOKENS, use_cache=use_cache):
+                if event["type"] == "text":
+                    yield _sse("token", {"text": event["text"]})
+                elif event["type"] == "error":
+                    yield _sse("error", {"error": event["error"]})
+                    return
+                else:
+                    consolidated_s3_url = await asyncio.to_thread(
+                        _save_consolidated_analysis,
+                        event["text"], insurance_type, analysis_output_dir, len(individual_analyses), submission_id
+                    )
+                    await asyncio.to_thread(
+                        _record_consolidation,
+                        record_path, fingerprint, event["text"], analysis_results,
+                        consolidated_s3_url, consolidation_stats, submission_id
+                    )
+                    stats = {k: v for k, v in event.items() if k not in ("type", "text")}
+                    yield _sse("done", {
+                        **stats,
+                        "consolidation": consolidation_stats,
+                        "consolidated_s3_url": consolidated_s3_url,
+                        "consolidation_reused": False,
+                        "timestamp": datetime.now().isoformat()
+                    })
+        except Exception as e:
+            yield _sse("error", {"error": f"Error generating consolidated analysis: {str(e)}"})
+
+    return StreamingResponse(
+        sse_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def _summarize_file(
+    json_file: str,
+    insurance_type: str,
+    summary_dir: str,
+    submission_id: Optional[str],
+    use_cache: bool,
+    use_stored: bool
+) -> dict:
+    """
+    Structured summary of one extracted file, normalized and stored as soon as it lands.
+
+    Never raises: returns {"source_file", "summary", "document_type"} or {"source_file", "error"}.
+    """
+    source_file = os.path.basename(json_file)
+    try:
+        source_sha256 = await asyncio.to_thread(hash_file, json_file)
+        stored_path = summary_file_path(summary_dir, json_file, insurance_type)
+        stored = None
+        if use_stored:
+            await asyncio.to_thread(fetch_from_s3_if_missing, stored_path, submission_id, "summary")
+            stored = load_stored_summary(stored_path, source_sha256, insurance_type)
+        if stored is not None and stored.get("document_type"):
+            print(f"♻️ Using stored summary for {source_file}")
+            return {"source_file": source_file, "summary": stored["summary"], "document_type": stored["document_type"]}
+
+        with open(json_file, 'r', encoding='utf-8') as f:
+            extracted = json.load(f)
+        doc_type = detect_document_type(extracted)
+        if stored is not None:
+            print(f"♻️ Using stored summary for {source_file}")
+            return {"source_file": source_file, "summary": stored["summary"], "document_type": doc_type}
+
+        parsed = await run_structured_summary_prompt(insurance_type, extracted, use_cache=use_cache, doc_type=doc_type)
+
+        # Validate/normalize against Pydantic schemas for consistent output
+        summary = normalize_summary(insurance_type, parsed)
+        await asyncio.to_thread(save_file_summary, summary_dir, json_file, insurance_type, summary, source_sha256, doc_type)
+        return {"source_file": source_file, "summary": summary, "document_type": doc_type}
+    except Exception as e:
+        return {"source_file": source_file, "error": str(e)}
+
+
 @router.post("/structured_summary")
 async def structured_summary(
     insurance_type: Literal["life", "property_casualty"] = Query(..., description="Choose 'life' or 'property_casualty'"),
-    submission_id: Optional[str] = Query(None, description="Submission ID for organizing files in S3")
+    submission_id: Optional[str] = Query(None, description="Submission ID for organizing files in S3"),
+    use_cache: bool = Query(True, description="Set false to bypass the Bedrock response cache"),
+    use_stored: bool = Query(True, description="Reuse per-file summaries stored by /analysis or earlier runs")
 ):
     """
     Generate structured summary from extracted documents
     
+    Per-file summaries already stored for the same extracted content (e.g. by a
+    fused /analysis run) are reused; the rest are prompted for and stored. They are
+    merged field by field locally (SUMMARY_LOCAL_MERGE), with Claude consulted only
+    for conflicting fields; "merge_stats" reports the split.
+
     Args:
         insurance_type: Type of insurance ('life' or 'property_casualty')
         submission_id: Optional submission ID for organizing files in S3
+        use_cache: Whether cached Bedrock responses may be reused
+        use_stored: Whether stored per-file summaries may be reused
     
     Returns:
         JSON response with structured summary
@@ -347,59 +932,34 @@ async def structured_summary(
             detail="No JSON files found in outputs directory. Please extract files first."
         )
 
-    summaries = []
-    errors = []
-    for json_file in json_files:
-        try:
-            with open(json_file, 'r', encoding='utf-8') as f:
-                extracted = json.load(f)
-            
-            # Log extracted data structure for debugging
-            print(f"📄 Processing file: {os.path.basename(json_file)}")
-            print(f"📊 Extracted data keys: {list(extracted.keys()) if isinstance(extracted, dict) else 'Not a dict'}")
-            if isinstance(extracted, dict):
-                # Log sample of extracted data (first 500 chars)
-                extracted_str = json.dumps(extracted, indent=2)[:500]
-                print(f"📋 Sample extracted data: {extracted_str}...")
-            
-            parsed = await run_structured_summary_prompt(insurance_type, extracted)
-            
-            # Log what Claude returned
-            print(f"🤖 Claude parsed response keys: {list(parsed.keys()) if isinstance(parsed, dict) else 'Not a dict'}")
-            parsed_str = json.dumps(parsed, indent=2)[:500]
-            print(f"📋 Sample parsed data: {parsed_str}...")
-
-            # Validate/normalize against Pydantic schemas for consistent output
-            if insurance_type == "life":
-                model = LifeSummary(**parsed)
-            else:
-                model = PropertyCasualtySummary(**parsed)
+    summary_dir = ANALYSIS_OUTPUT_DIR
+    if submission_id:
+        summary_dir = os.path.join(ANALYSIS_OUTPUT_DIR, submission_id)
+        os.makedirs(summary_dir, exist_ok=True)
 
-            summaries.append({
-                "source_file": os.path.basename(json_file),
-                "summary": model.model_dump()
-            })
-        except Exception as e:
-            errors.append({
-                "source_file": os.path.basename(json_file),
-                "error": str(e)
-            })
+    # Per-file prompts run concurrently under a bounded limit; gather keeps input order and
+    # consolidation starts as soon as the last file lands
+    semaphore = asyncio.Semaphore(MAX_WORKERS)
+
+    async def run_bounded(json_file: str) -> dict:
+        async with semaphore:
+            return await _summarize_file(json_file, insurance_type, summary_dir, submission_id, use_cache, use_stored)
+
+    file_results = await asyncio.gather(*(run_bounded(f) for f in json_files))
+    summaries = [r for r in file_results if "summary" in r]
+    errors = [r for r in file_results if "error" in r]
 
     # If there are parsed summaries, consolidate them into a single final JSON
     try:
         consolidated_input = [s["summary"] for s in summaries]
         print(f"🔄 Consolidating {len(consolidated_input)} summaries...")
-        for i, summary in enumerate(consolidated_input):
-            print(f"📄 Summary {i+1} keys: {list(summary.keys()) if isinstance(summary, dict) else 'Not a dict'}")
-            summary_str = json.dumps(summary, indent=2)[:500]
-            print(f"📋 Sample summary {i+1}: {summary_str}...")
-        
-        final_summary = await consolidate_structured_summaries(insurance_type, consolidated_input)
-        
-        print(f"✅ Consolidated summary keys: {list(final_summary.keys()) if isinstance(final_summary, dict) else 'Not a dict'}")
-        final_str = json.dumps(final_summary, indent=2)[:500]
-        print(f"📋 Sample consolidated summary: {final_str}...")
-        
+        merge_stats = None
+        if SUMMARY_LOCAL_MERGE:
+            final_summary, merge_stats = await merge_structured_summaries(insurance_type, summaries, use_cache=use_cache)
+            print(f"🧩 Summary fields merged locally: {merge_stats['local']}, by the model: {merge_stats['model']}")
+        else:
+            final_summary = await consolidate_structured_summaries(insurance_type, consolidated_input, use_cache=use_cache)
+
         # Upload to S3 if submission_id provided
         if submission_id and final_summary:
             import tempfile
@@ -415,6 +975,9 @@ async def structured_summary(
             if isinstance(final_summary, dict):
                 final_summary["s3_url"] = s3_url
                 final_summary["s3_key"] = s3_key
+
+        if merge_stats is not None:
+            final_summary["merge_stats"] = merge_stats
         
         # Return only the consolidated JSON as requested
         return JSONResponse(content=final_summary, status_code=200)
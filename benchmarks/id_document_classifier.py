@@ -0,0 +1,252 @@
+"""
+Throughput of the indexed identity classifier against the previous implementation.
+
+The legacy scorer below is the closure-based code classify_verification_documents
+used before IdDocumentClassifier, kept verbatim as the reference. Both run over the
+same synthetic Aadhaar / PAN / passport / voter / driving licence files (plus
+non-ID noise) and must agree on every file.
+
+Usage (from the repository root):
+    python -m benchmarks.id_document_classifier [number_of_files] [seed]
+"""
+import sys
+import time
+import random
+from services.doc_classification import KEY_VARIANTS, id_document_classifier
+
+
+def legacy_classify_files(files):
+    """Classify each file's records with the pre-index closures (rebuilt per call, as before)."""
+
+    # Lower-case keys map
+    def lower_keys(d):
+        return {str(k).lower(): v for k, v in d.items()}
+
+    # Scoring function that includes many key variants and document_type text matches
+    def score_record(rec):
+        s = {"aadhaar": 0, "passport": 0, "voter": 0, "driving_licence": 0, "pan": 0}
+
+        # convenience checks
+        def has_any(keys):
+            for k in keys:
+                if rec.get(k) not in (None, "", []):
+                    return True
+            return False
+
+        # document_type textual hints
+        doc_type_text = (rec.get("document_type") or "").lower()
+
+        # Aadhaar scoring
+        if has_any(KEY_VARIANTS["aadhaar"]):
+            s["aadhaar"] += 12
+        if has_any(["name", "name_english", "name_hindi", "full_name"]):
+            s["aadhaar"] += 1
+        if has_any(["s_o_name_english", "s_o_name_hindi", "s_o", "s/o", "father_or_husband_name", "father_name"]):
+            s["aadhaar"] += 1
+        if has_any(["address", "address_english", "address_line1_english", "address_line1"]):
+            s["aadhaar"] += 1
+        if has_any(["dob", "date_of_birth", "birth_date"]):
+            s["aadhaar"] += 1
+
+        # Passport scoring
+        if has_any(KEY_VARIANTS["passport"]) or "mrz_line1" in rec or "mrz_line2" in rec:
+            s["passport"] += 12
+        if has_any(["given_names", "surname", "name"]):
+            s["passport"] += 1
+        if has_any(["place_of_issue", "place_of_birth", "address_city"]):
+            s["passport"] += 1
+        if has_any(["dob", "date_of_birth", "birth_date"]):
+            s["passport"] += 1
+        if "passport" in doc_type_text or "p<" in (rec.get("mrz_line1") or "").lower():
+            s["passport"] += 2
+
+        # Voter scoring
+        if has_any(KEY_VARIANTS["voter"]):
+            s["voter"] += 12
+        if has_any(["assembly_constituency_name", "part_number", "part_name"]):
+            s["voter"] += 1
+        if has_any(["name", "name_english"]):
+            s["voter"] += 1
+        if has_any(["address", "address_english"]):
+            s["voter"] += 1
+        if has_any(["dob", "date_of_birth"]):
+            s["voter"] += 1
+        if "elector" in doc_type_text or "voter" in doc_type_text or "epic" in doc_type_text:
+            s["voter"] += 1
+
+        # Driving licence scoring - expanded key variants and document_type match
+        if has_any(KEY_VARIANTS["driving_licence"]):
+            s["driving_licence"] += 12
+        if "driving" in doc_type_text or "licence" in doc_type_text or "driving licence" in doc_type_text:
+            s["driving_licence"] += 4
+        if has_any(["class_lmv_issued_on", "class_mcwg_issued_on", "issued_on_lmv", "issued_on_mcwg", "issued_on"]):
+            s["driving_licence"] += 1
+        if has_any(["issuing_authority", "issuing_authority_signature", "issuing_authority_name"]):
+            s["driving_licence"] += 1
+        if has_any(["name", "name_english", "name_hindi"]):
+            s["driving_licence"] += 1
+        if has_any(["dob", "date_of_birth", "birth_date"]):
+            s["driving_licence"] += 1
+        if has_any(["state", "issuing_state", "state_code"]):
+            s["driving_licence"] += 1
+
+        # PAN scoring
+        if has_any(KEY_VARIANTS["pan"]):
+            s["pan"] += 12
+        if has_any(["name", "name_english"]):
+            s["pan"] += 1
+        if has_any(["father_name", "father_or_husband_name"]):
+            s["pan"] += 1
+        if has_any(["dob", "date_of_birth"]):
+            s["pan"] += 1
+
+        return s
+
+    # Decide file classification using aggregated scores across all records
+    def classify_file(records):
+        agg = {"aadhaar": 0, "passport": 0, "voter": 0, "driving_licence": 0, "pan": 0}
+        primaries_present = {k: False for k in agg}
+
+        for r in records:
+            if not isinstance(r, dict):
+                continue
+            rn = lower_keys(r)
+            sc = score_record(rn)
+            for k in agg:
+                agg[k] += sc[k]
+
+            # primaries presence checks (use key variants + doc_type text)
+            for k, variants in KEY_VARIANTS.items():
+                if any(rn.get(v) not in (None, "", []) for v in variants):
+                    primaries_present[k] = True
+
+            # document_type textual hints
+            dt = (rn.get("document_type") or "").lower()
+            if "driving" in dt or "licence" in dt:
+                primaries_present["driving_licence"] = True
+            if "passport" in dt:
+                primaries_present["passport"] = True
+            if "elector" in dt or "voter" in dt or "epic" in dt:
+                primaries_present["voter"] = True
+            if "aadhaar" in dt or "uidai" in dt:
+                primaries_present["aadhaar"] = True
+            if "pan" in dt or "income tax" in dt:
+                primaries_present["pan"] = True
+
+        # choose best type by aggregated score
+        best_type, best_score = max(agg.items(), key=lambda it: it[1])
+
+        # Conservative thresholds:
+        # - If primary identifier present and agg score >= 12 -> accept
+        # - Else if agg score >= 10 -> accept
+        # - Otherwise reject (None)
+        if primaries_present.get(best_type) and best_score >= 12:
+            return best_type
+        if best_score >= 10:
+            return best_type
+        return None
+
+    return [classify_file(records) for records in files]
+
+
+_NAMES = ["Ramesh Kumar", "Sita Devi", "Arjun Mehta", "Priya Nair", "Mohammed Iqbal", "Anita Rao"]
+_DOBS = ["01/02/1980", "1975-11-23", "12-08-1992", "30/06/1968"]
+_ADDRESSES = ["12 MG Road, Pune", "S/O Suresh Kumar, 4 Park Street, Kolkata", "Flat 9, Andheri East, Mumbai"]
+_NOISE_KEYS = ["page", "confidence", "bbox", "barcode", "photo", "signature", "qr_code", "remarks"]
+
+
+def _maybe_case(key, rng):
+    # Nanonets keys arrive in mixed case; both implementations lower-case them
+    return key.upper() if rng.random() < 0.1 else key.title() if rng.random() < 0.1 else key
+
+
+def _identity_record(doc_type, rng):
+    name, dob, address = rng.choice(_NAMES), rng.choice(_DOBS), rng.choice(_ADDRESSES)
+    if doc_type == "aadhaar":
+        rec = {rng.choice(["aadhaar_number", "Aadhaar No", "uid"]): "1234 5678 9012", "name_english": name,
+               "date_of_birth": dob, "address_english": address, "name_hindi": "", "s_o_name_english": "Suresh Kumar"}
+    elif doc_type == "pan":
+        rec = {rng.choice(["pan_number", "PAN", "permanent_account_number"]): "ABCDE1234F", "name": name,
+               "father_name": "Suresh Kumar", "dob": dob, "document_type": rng.choice(["Income Tax Department", "", None])}
+    elif doc_type == "passport":
+        rec = {"passport_number": "K1234567", "surname": name.split()[-1], "given_names": name.split()[0],
+               "date_of_birth": dob, "place_of_birth": "Pune", "place_of_issue": "Mumbai"}
+        if rng.random() < 0.5:
+            rec["mrz_line1"] = "P<INDKUMAR<<RAMESH<<<<<<<<<<<<<<<<<<<<<<<<<<"
+            rec["mrz_line2"] = None
+        if rng.random() < 0.3:
+            rec.pop("passport_number")
+    elif doc_type == "voter":
+        rec = {rng.choice(["epic_number", "voter_id", "EPIC"]): "ABC1234567", "name": name, "address": address,
+               "part_number": "42", "assembly_constituency_name": "Kothrud", "document_type": "Elector Photo Identity Card"}
+    else:
+        rec = {rng.choice(["dl_number", "Licence_No", "driving_licence_number"]): "MH12 20110012345", "name": name,
+               "dob": dob, "issuing_authority": "RTO Pune", "state": "Maharashtra", "issued_on": "2011-03-04",
+               "document_type": rng.choice(["Driving Licence", "Union of India Driving Licence", ""])}
+        if rng.random() < 0.2:
+            rec.pop(next(k for k in rec if k.lower() in KEY_VARIANTS["driving_licence"]))
+    rec = {_maybe_case(k, rng): v for k, v in rec.items()}
+    for key in rng.sample(_NOISE_KEYS, rng.randint(2, 6)):
+        rec[key] = rng.choice(["x", "", None, [], 0.97])
+    return rec
+
+
+def _noise_record(rng):
+    # salary slips / lab reports sharing name and dob keys with ID documents
+    rec = {"employee_name": rng.choice(_NAMES), "name": rng.choice(_NAMES), "dob": rng.choice(_DOBS),
+           "gross_earnings": "85,000", "net_pay": "71,250", "state": "Karnataka", "address": rng.choice(_ADDRESSES)}
+    for key in rng.sample(_NOISE_KEYS, rng.randint(2, 6)):
+        rec[key] = "x"
+    return rec
+
+
+def synthetic_files(count, seed=7):
+    """`count` extracted files of 1-3 records each, mostly identity documents."""
+    rng = random.Random(seed)
+    doc_types = list(KEY_VARIANTS)
+    files = []
+    for _ in range(count):
+        if rng.random() < 0.15:
+            files.append([_noise_record(rng) for _ in range(rng.randint(1, 3))])
+        else:
+            doc_type = rng.choice(doc_types)
+            files.append([_identity_record(doc_type, rng) for _ in range(rng.randint(1, 3))])
+    return files
+
+
+def _timed(fn, files, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(files)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def run(count=5000, seed=7):
+    files = synthetic_files(count, seed)
+    records = sum(len(f) for f in files)
+    legacy, legacy_s = _timed(legacy_classify_files, files)
+    indexed, indexed_s = _timed(id_document_classifier.classify_many, files)
+    mismatches = [i for i, (a, b) in enumerate(zip(legacy, indexed)) if a != b]
+
+    print(f"📊 {count} files / {records} records")
+    print(f"   legacy closures : {legacy_s * 1000:8.1f} ms  ({records / legacy_s:,.0f} records/s)")
+    print(f"   indexed         : {indexed_s * 1000:8.1f} ms  ({records / indexed_s:,.0f} records/s)")
+    print(f"   speedup         : {legacy_s / indexed_s:.2f}x")
+    distribution = {}
+    for doc_type in indexed:
+        distribution[doc_type] = distribution.get(doc_type, 0) + 1
+    print(f"   results         : {distribution}")
+    if mismatches:
+        print(f"❌ {len(mismatches)} files classified differently, first: {files[mismatches[0]]}")
+        return 1
+    print("✅ identical classification for every file")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 5000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 7
+    ))
@@ -19,10 +19,72 @@ AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
 if not AWS_SECRET_ACCESS_KEY:
     raise ValueError("AWS_SECRET_ACCESS_KEY environment variable is required. Please set it in your .env file.")
 AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
-MAX_WORKERS = 10
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", "10"))
+# Process-wide caps on concurrent blocking upstream calls (see utils/worker_pool.py)
+BEDROCK_MAX_CONCURRENCY = int(os.getenv("BEDROCK_MAX_CONCURRENCY", "16"))
+EXTRACTION_MAX_CONCURRENCY = int(os.getenv("EXTRACTION_MAX_CONCURRENCY", "8"))
 OUTPUT_DIR = "outputs"
 ANALYSIS_OUTPUT_DIR = "analysis_outputs"
+JOBS_DIR = os.getenv("JOBS_DIR", "jobs")
+# A queued/running job whose record has not been updated for this long is reported as failed
+# (its worker died or the server restarted mid-job)
+JOB_STALE_AFTER_SECONDS = int(os.getenv("JOB_STALE_AFTER_SECONDS", "3600"))
 CHROMA_STORE_PATH = "./chroma_store"
+
+# Bedrock response cache (in-memory LRU + disk tier)
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", "llm_cache")
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "256"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Nanonets extraction API client
+NANONETS_BASE_URL = os.getenv("NANONETS_BASE_URL", "https://extraction-api.nanonets.com")
+NANONETS_MAX_CONNECTIONS = int(os.getenv("NANONETS_MAX_CONNECTIONS", "20"))
+NANONETS_POLL_MAX_WAIT = float(os.getenv("NANONETS_POLL_MAX_WAIT", "120"))
+NANONETS_POLL_INITIAL_INTERVAL = float(os.getenv("NANONETS_POLL_INITIAL_INTERVAL", "0.5"))
+NANONETS_POLL_MAX_INTERVAL = float(os.getenv("NANONETS_POLL_MAX_INTERVAL", "8"))
+
+# Large PDFs are split into page ranges that are extracted concurrently
+PDF_SPLIT_ENABLED = os.getenv("PDF_SPLIT_ENABLED", "true").lower() == "true"
+PDF_SPLIT_PAGE_THRESHOLD = int(os.getenv("PDF_SPLIT_PAGE_THRESHOLD", "20"))
+PDF_SPLIT_CHUNK_PAGES = int(os.getenv("PDF_SPLIT_CHUNK_PAGES", "10"))
+
+# Digitally generated PDF pages (text layer or filled form fields) are extracted locally
+PDF_TEXT_FAST_PATH_ENABLED = os.getenv("PDF_TEXT_FAST_PATH_ENABLED", "true").lower() == "true"
+PDF_TEXT_MIN_CHARS = int(os.getenv("PDF_TEXT_MIN_CHARS", "200"))
+
+# CSV/XLSX uploads are parsed locally; responses inline at most this many rows
+TABULAR_INLINE_MAX_ROWS = int(os.getenv("TABULAR_INLINE_MAX_ROWS", "500"))
+
+# Content-addressed Nanonets extraction cache (local disk + S3)
+EXTRACTION_CACHE_ENABLED = os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() == "true"
+EXTRACTION_CACHE_DIR = os.getenv("EXTRACTION_CACHE_DIR", "extraction_cache")
+EXTRACTION_CACHE_MAX_BYTES = int(os.getenv("EXTRACTION_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+EXTRACTION_CACHE_S3_PREFIX = os.getenv("EXTRACTION_CACHE_S3_PREFIX", "lnh-extraction-cache/flat-json/")
+
+# Compact encoding of extracted data embedded in prompts
+PROMPT_COMPACT_ENCODING = os.getenv("PROMPT_COMPACT_ENCODING", "true").lower() == "true"
+PROMPT_PRUNE_KEYS = [
+    k.strip().lower() for k in os.getenv(
+        "PROMPT_PRUNE_KEYS",
+        "slogan,slogan_hindi,slogan_english,helpline,helpline_number,toll_free_number,website,website_url"
+    ).split(",") if k.strip()
+]
+PROMPT_DROP_HINDI_DUPLICATES = os.getenv("PROMPT_DROP_HINDI_DUPLICATES", "true").lower() == "true"
+PROMPT_DATA_TOKEN_BUDGET = int(os.getenv("PROMPT_DATA_TOKEN_BUDGET", "40000"))
+# Extractions whose compact encoding exceeds this many (estimated) tokens are analyzed map-reduce style
+ANALYSIS_MAP_REDUCE_THRESHOLD_TOKENS = int(os.getenv("ANALYSIS_MAP_REDUCE_THRESHOLD_TOKENS", "12000"))
+ANALYSIS_CHUNK_TOKENS = int(os.getenv("ANALYSIS_CHUNK_TOKENS", "6000"))
+ANALYSIS_REDUCE_FAN_IN = int(os.getenv("ANALYSIS_REDUCE_FAN_IN", "6"))
+# Maximum analyses (or group digests) per consolidation call; more documents consolidate tree-style
+CONSOLIDATION_FAN_IN = int(os.getenv("CONSOLIDATION_FAN_IN", "8"))
+# Narrow the individual analysis prompt to the locally detected document type
+DOC_TYPE_AWARE_PROMPTS = os.getenv("DOC_TYPE_AWARE_PROMPTS", "true").lower() == "true"
+# Default for /analysis: produce the per-file structured summary in the same Bedrock call
+FUSED_ANALYSIS_SUMMARY = os.getenv("FUSED_ANALYSIS_SUMMARY", "false").lower() == "true"
+# Merge per-file structured summaries locally, asking Claude only about conflicting fields
+SUMMARY_LOCAL_MERGE = os.getenv("SUMMARY_LOCAL_MERGE", "true").lower() == "true"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 os.makedirs(ANALYSIS_OUTPUT_DIR, exist_ok=True)
 
@@ -33,11 +95,19 @@ bedrock_config = BotoConfig(
     },
     max_pool_connections=50
 )
+# Optional override, e.g. a local Bedrock stand-in for checking request shapes
+BEDROCK_ENDPOINT_URL = os.getenv("BEDROCK_ENDPOINT_URL") or None
+# Mark static prompt prefixes with Bedrock prompt-caching cache_control blocks
+BEDROCK_PROMPT_CACHING = os.getenv("BEDROCK_PROMPT_CACHING", "true").lower() == "true"
+# Ask for JSON outputs as forced tool calls, and how many targeted repair calls an invalid one gets
+STRUCTURED_OUTPUT_TOOLS = os.getenv("STRUCTURED_OUTPUT_TOOLS", "true").lower() == "true"
+STRUCTURED_OUTPUT_MAX_REPAIRS = int(os.getenv("STRUCTURED_OUTPUT_MAX_REPAIRS", "1"))
 bedrock_client = boto3.client(
     'bedrock-runtime',
     aws_access_key_id=AWS_ACCESS_KEY_ID,
     aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
     region_name=AWS_REGION,
+    endpoint_url=BEDROCK_ENDPOINT_URL,
     config=bedrock_config
 )
 BEDROCK_MODEL_ID = "us.anthropic.claude-3-7-sonnet-20250219-v1:0"
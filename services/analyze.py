@@ -1,251 +1,418 @@
 import json
-from typing import List, Dict, Any, Tuple
+import time
+import hashlib
+from functools import lru_cache
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
-from config.settings import bedrock_client, BEDROCK_MODEL_ID, ANALYSIS_OUTPUT_SCHEMA, ANALYSIS_OUTPUT_DIR
+import threading
+from typing import AsyncIterator, Callable, List, Dict, Any, Optional, Tuple
+from config.settings import (
+    bedrock_client,
+    BEDROCK_MODEL_ID,
+    BEDROCK_PROMPT_CACHING,
+    STRUCTURED_OUTPUT_TOOLS,
+    STRUCTURED_OUTPUT_MAX_REPAIRS,
+    ANALYSIS_OUTPUT_SCHEMA,
+    ANALYSIS_OUTPUT_DIR,
+    DOC_TYPE_AWARE_PROMPTS
+)
 import jsonschema
+from utils.worker_pool import bedrock_pool
+from services.llm_cache import llm_cache, make_cache_key
+from services.prompt_encoding import encode_for_prompt
+
+# Per detected document type: prompt size and Bedrock latency, for /metrics
+prompt_metrics: Dict[str, Dict[str, float]] = {}
+
+
+def record_prompt_metrics(doc_type: str, prompt_chars: int, latency_ms: float, cached: bool) -> None:
+    entry = prompt_metrics.setdefault(
+        doc_type, {"prompts": 0, "prompt_chars": 0, "bedrock_calls": 0, "bedrock_latency_ms": 0.0, "cached": 0}
+    )
+    entry["prompts"] += 1
+    entry["prompt_chars"] += prompt_chars
+    if cached:
+        entry["cached"] += 1
+    else:
+        entry["bedrock_calls"] += 1
+        entry["bedrock_latency_ms"] += latency_ms
+
+
+def prompt_metrics_snapshot() -> dict:
+    by_type = {}
+    for doc_type, entry in prompt_metrics.items():
+        by_type[doc_type] = {
+            "prompts": entry["prompts"],
+            "cached": entry["cached"],
+            "avg_prompt_chars": round(entry["prompt_chars"] / entry["prompts"]),
+            "avg_bedrock_latency_ms": round(entry["bedrock_latency_ms"] / entry["bedrock_calls"], 1) if entry["bedrock_calls"] else None,
+        }
+    return {"doc_type_aware": DOC_TYPE_AWARE_PROMPTS, "by_document_type": by_type}
+
 
 # --- PROMPTS ---
-def get_individual_analysis_prompt(insurance_type: str, extracted_data: dict) -> str:
-    type_specific_instructions = ""
+_LIFE_FOCUS = """
+Focus on:
+- Medical history and conditions
+- Age, lifestyle factors, and risk behaviors
+- Coverage amounts and beneficiaries
+- Medical timeline if applicable
+- Set 'property_assessment' to "N/A"
+"""
+
+_LIFE_SALARY_SLIP = """
+**SALARY SLIPS (Pay Stubs, Payroll Statements):**
+If the document is a salary slip/pay stub, analyze it for:
+- Employee name, employer name, and employment period
+- Gross salary, net salary, deductions (taxes, insurance, etc.)
+- Employment stability indicators (consistent payments, tenure)
+- Income verification for premium payment capacity
+- Occupation and industry type (for occupation-based risk assessment)
+- Employee benefits and existing insurance coverage details
+
+Value for Life Insurance:
+1. **Income Verification & Premium Payment Capacity**: 
+   - Verify applicant's ability to pay life insurance premiums consistently
+   - Assess income-to-coverage ratio to ensure requested coverage is affordable and appropriate
+   - Calculate if income supports the requested death benefit amount
+   - Identify financial stability indicators (steady employment, regular income)
+
+2. **Occupation-Based Risk Assessment**:
+   - Identify occupation type and industry for mortality risk assessment
+   - Assess occupational hazards that may affect life expectancy
+   - Verify employment stability and career progression
+   - Understand job-related stress levels and lifestyle factors
+
+3. **Coverage Amount Justification**:
+   - Validate if requested coverage amount aligns with income level (typically 5-10x annual income)
+   - Assess financial need for life insurance coverage
+   - Verify beneficiary relationships and financial dependencies
+   - Identify potential over-insurance or under-insurance scenarios
+
+4. **Lifestyle & Risk Factor Indicators**:
+   - Employment stability suggests lower risk of policy lapse
+   - Income level correlates with lifestyle factors affecting mortality
+   - Employer information helps verify applicant identity and reduce fraud risk
+   - Benefits information may reveal existing coverage or health insurance status
+
+5. **Medical & Health Insights**:
+   - Employee benefits may indicate health insurance coverage
+   - Deductions may reveal health-related expenses or insurance purchases
+   - Employment gaps may indicate health issues or lifestyle instability
+"""
+
+_LIFE_INVOICE = """
+**INVOICES (Bills, Purchase Orders, Service Invoices):**
+If the document is an invoice, analyze it for:
+- Invoice number, date, and payment terms
+- Vendor/supplier information and credentials
+- Itemized goods/services purchased
+- Purchase amounts, taxes, and totals
+- Payment status and due dates
+- Goods/services descriptions (especially health-related, lifestyle, or business-related)
+
+Value for Life Insurance:
+1. **Lifestyle & Risk Assessment**:
+   - Health-related purchases (gym memberships, medical equipment, wellness services) indicate health consciousness
+   - Luxury purchases may indicate lifestyle factors affecting risk
+   - Business-related invoices may indicate business ownership (affecting coverage needs)
+   - Travel-related invoices may indicate occupation hazards or lifestyle risks
+
+2. **Business Ownership Verification** (for commercial life insurance):
+   - Confirm business ownership and operational scale
+   - Assess business income for key person insurance or buy-sell agreements
+   - Verify business legitimacy and financial stability
+   - Understand business debt obligations affecting coverage needs
+
+3. **Financial Stability Indicators**:
+   - Payment patterns indicate financial responsibility
+   - High-value purchases suggest income level and financial capacity
+   - Consistent spending patterns suggest stable financial situation
+   - Financial stress indicators (late payments, debt issues) may affect coverage needs
+
+4. **Coverage Need Justification**:
+   - Business invoices help justify business-related life insurance needs
+   - Large purchases may indicate dependents or financial obligations requiring coverage
+   - Recurring expenses help assess ongoing financial commitments
+
+5. **Identity & Fraud Prevention**:
+   - Verify applicant's business ownership claims
+   - Cross-reference with other application information
+   - Identify inconsistencies in financial disclosures
+"""
+
+_LIFE_WAGE_DOC_CLOSING = """
+When analyzing salary slips or invoices for life insurance:
+- Extract all financial figures, dates, and parties involved
+- Identify any discrepancies or inconsistencies with application information
+- Note any red flags (unusual patterns, missing information, income inconsistencies)
+- Highlight how the document supports or contradicts coverage amount requests
+- Explain specific underwriting value in the analysis, especially for coverage justification and risk assessment
+"""
+
+_PC_FOCUS = """
+Focus on:
+- Property details, location, and construction
+- Risk exposures (fire, flood, liability, etc.)
+- Coverage limits and deductibles
+- Property assessment details
+- Set 'medical_timeline' to "N/A"
+"""
+
+_PC_SALARY_SLIP = """
+**SALARY SLIPS (Pay Stubs, Payroll Statements):**
+If the document is a salary slip/pay stub, analyze it for:
+- Employee name, employer name, and employment period
+- Gross salary, net salary, deductions (taxes, insurance, etc.)
+- Employment stability indicators (consistent payments, tenure)
+- Income verification for premium payment capacity
+- Employee benefits and insurance coverage details
+
+Value for Property & Casualty Insurance:
+1. **Financial Stability Assessment**: 
+   - Verify applicant's ability to pay premiums consistently
+   - Assess income-to-premium ratio to ensure affordability
+   - Identify financial stability indicators (steady employment, regular income)
+
+2. **Business Operations Understanding** (for commercial policies):
+   - Confirm employment details for business owners/employees
+   - Verify business operations and employee count
+   - Assess payroll exposure for workers' compensation risk
+   - Understand organizational structure and hierarchy
+
+3. **Risk Assessment**:
+   - Stable income suggests lower risk of policy cancellation
+   - Employment verification reduces fraud risk
+   - Income level helps determine appropriate coverage limits
+   - Employer information helps verify business legitimacy
+
+4. **Premium Payment Capacity**:
+   - Calculate if income supports requested coverage amounts
+   - Identify potential payment issues early
+   - Assess financial capacity for deductibles and premiums
+"""
+
+_PC_INVOICE = """
+**INVOICES (Bills, Purchase Orders, Service Invoices):**
+If the document is an invoice, analyze it for:
+- Invoice number, date, and payment terms
+- Vendor/supplier information and credentials
+- Itemized goods/services purchased
+- Purchase amounts, taxes, and totals
+- Payment status and due dates
+- Property/equipment descriptions and values
+
+Value for Property & Casualty Insurance:
+1. **Property Valuation & Inventory**:
+   - Verify actual property values for accurate coverage
+   - Identify newly purchased assets requiring coverage
+   - Validate replacement costs for property insurance
+   - Document inventory and equipment for business personal property coverage
+
+2. **Business Operations Verification**:
+   - Confirm business activity and industry type
+   - Verify supplier relationships and supply chain
+   - Understand business expenses and operational scale
+   - Assess volume of business transactions
+
+3. **Risk Exposure Assessment**:
+   - Identify high-value items requiring special coverage
+   - Assess equipment and machinery risks
+   - Evaluate inventory exposure for theft/damage
+   - Understand business interruption potential from supplier dependencies
+
+4. **Liability Risk Indicators**:
+   - Identify products/services that may create liability exposure
+   - Assess vendor relationships for contractual liability
+   - Evaluate professional services exposure
+   - Understand product liability risks from goods sold
+
+5. **Property Coverage Needs**:
+   - Determine if purchased items need immediate coverage
+   - Verify property locations and addresses
+   - Assess seasonal inventory fluctuations
+   - Identify equipment requiring specialized coverage
+
+6. **Financial Verification**:
+   - Verify business legitimacy and operational reality
+   - Assess cash flow and payment patterns
+   - Identify potential financial stress indicators
+   - Support business income coverage calculations
+"""
+
+_PC_WAGE_DOC_CLOSING = """
+When analyzing salary slips or invoices:
+- Extract all financial figures, dates, and parties involved
+- Identify any discrepancies or inconsistencies
+- Note any red flags (unusual patterns, missing information)
+- Highlight how the document supports or contradicts other application information
+- Explain specific underwriting value in the 'property_assessment' field with clear reasoning
+"""
+
+# Instruction blocks for pre-classified document types other than salary slips / invoices
+_DOC_TYPE_INSTRUCTIONS = {
+    "lab_report": """
+**LAB / MEDICAL TEST REPORTS:**
+- List every out-of-range result against its reference interval, with units
+- Relate abnormal values to mortality or morbidity risk (e.g., HbA1c, lipids, liver and kidney markers)
+- Build the 'medical_timeline' from collection and report dates
+- Note tests an underwriter would normally expect but that are missing
+""",
+    "acord_form": """
+**ACORD / COMMERCIAL INSURANCE APPLICATIONS:**
+- Capture named insured, producer/agency, carrier, requested coverages, limits and deductibles
+- Summarize location, construction, occupancy, protection class and year built
+- Review prior carrier and loss history for frequency or severity patterns
+- Flag unanswered questions and coverage gaps
+""",
+    "proposal_form": """
+**INSURANCE PROPOSAL / APPLICATION FORMS:**
+- Capture proposer and insured details, plan, sum assured/insured and nominees
+- Review declared medical history, family history, habits, occupation and income
+- Flag answers that are blank, contradictory, or inconsistent with the requested cover
+""",
+    "bank_statement": """
+**BANK STATEMENTS:**
+- Summarize account holder, period, opening/closing balances and average balance
+- Identify regular salary or business credits and recurring obligations
+- Flag bounced payments, overdraft usage, or unusual large transactions
+- Assess premium payment capacity from cash flow
+""",
+    "id_document": """
+**IDENTITY DOCUMENTS (Aadhaar, PAN, Passport, Voter ID, Driving Licence):**
+- Confirm name, date of birth, gender, address and ID number
+- Note anything that would prevent matching the identity against other documents
+- Keep the analysis brief: identity documents rarely carry underwriting risk on their own
+""",
+}
+
+DOC_TYPE_LABELS = {
+    "salary_slip": "Salary Slip / Pay Stub",
+    "invoice": "Invoice / Bill",
+    "lab_report": "Lab / Medical Test Report",
+    "acord_form": "ACORD / Commercial Insurance Application",
+    "proposal_form": "Insurance Proposal / Application Form",
+    "bank_statement": "Bank Statement",
+    "id_document": "Identity Document",
+}
+
+
+def get_type_specific_instructions(insurance_type: str, doc_type: Optional[str] = None) -> str:
+    """
+    Instruction blocks for the insurance type, narrowed to the document type when known.
+
+    Args:
+        insurance_type: 'life' or 'property_casualty'
+        doc_type: Pre-classified document type (see services.doc_classification);
+            None or "general" includes the salary slip and invoice blocks as before
+    """
     if insurance_type == "life":
-        type_specific_instructions = """
-        Focus on:
-        - Medical history and conditions
-        - Age, lifestyle factors, and risk behaviors
-        - Coverage amounts and beneficiaries
-        - Medical timeline if applicable
-        - Set 'property_assessment' to "N/A"
-        
-        SPECIAL DOCUMENT HANDLING - Salary Slips and Invoices:
-        
-        **SALARY SLIPS (Pay Stubs, Payroll Statements):**
-        If the document is a salary slip/pay stub, analyze it for:
-        - Employee name, employer name, and employment period
-        - Gross salary, net salary, deductions (taxes, insurance, etc.)
-        - Employment stability indicators (consistent payments, tenure)
-        - Income verification for premium payment capacity
-        - Occupation and industry type (for occupation-based risk assessment)
-        - Employee benefits and existing insurance coverage details
-        
-        Value for Life Insurance:
-        1. **Income Verification & Premium Payment Capacity**: 
-           - Verify applicant's ability to pay life insurance premiums consistently
-           - Assess income-to-coverage ratio to ensure requested coverage is affordable and appropriate
-           - Calculate if income supports the requested death benefit amount
-           - Identify financial stability indicators (steady employment, regular income)
-        
-        2. **Occupation-Based Risk Assessment**:
-           - Identify occupation type and industry for mortality risk assessment
-           - Assess occupational hazards that may affect life expectancy
-           - Verify employment stability and career progression
-           - Understand job-related stress levels and lifestyle factors
-        
-        3. **Coverage Amount Justification**:
-           - Validate if requested coverage amount aligns with income level (typically 5-10x annual income)
-           - Assess financial need for life insurance coverage
-           - Verify beneficiary relationships and financial dependencies
-           - Identify potential over-insurance or under-insurance scenarios
-        
-        4. **Lifestyle & Risk Factor Indicators**:
-           - Employment stability suggests lower risk of policy lapse
-           - Income level correlates with lifestyle factors affecting mortality
-           - Employer information helps verify applicant identity and reduce fraud risk
-           - Benefits information may reveal existing coverage or health insurance status
-        
-        5. **Medical & Health Insights**:
-           - Employee benefits may indicate health insurance coverage
-           - Deductions may reveal health-related expenses or insurance purchases
-           - Employment gaps may indicate health issues or lifestyle instability
-        
-        **INVOICES (Bills, Purchase Orders, Service Invoices):**
-        If the document is an invoice, analyze it for:
-        - Invoice number, date, and payment terms
-        - Vendor/supplier information and credentials
-        - Itemized goods/services purchased
-        - Purchase amounts, taxes, and totals
-        - Payment status and due dates
-        - Goods/services descriptions (especially health-related, lifestyle, or business-related)
-        
-        Value for Life Insurance:
-        1. **Lifestyle & Risk Assessment**:
-           - Health-related purchases (gym memberships, medical equipment, wellness services) indicate health consciousness
-           - Luxury purchases may indicate lifestyle factors affecting risk
-           - Business-related invoices may indicate business ownership (affecting coverage needs)
-           - Travel-related invoices may indicate occupation hazards or lifestyle risks
-        
-        2. **Business Ownership Verification** (for commercial life insurance):
-           - Confirm business ownership and operational scale
-           - Assess business income for key person insurance or buy-sell agreements
-           - Verify business legitimacy and financial stability
-           - Understand business debt obligations affecting coverage needs
-        
-        3. **Financial Stability Indicators**:
-           - Payment patterns indicate financial responsibility
-           - High-value purchases suggest income level and financial capacity
-           - Consistent spending patterns suggest stable financial situation
-           - Financial stress indicators (late payments, debt issues) may affect coverage needs
-        
-        4. **Coverage Need Justification**:
-           - Business invoices help justify business-related life insurance needs
-           - Large purchases may indicate dependents or financial obligations requiring coverage
-           - Recurring expenses help assess ongoing financial commitments
-        
-        5. **Identity & Fraud Prevention**:
-           - Verify applicant's business ownership claims
-           - Cross-reference with other application information
-           - Identify inconsistencies in financial disclosures
-        
-        When analyzing salary slips or invoices for life insurance:
-        - Extract all financial figures, dates, and parties involved
-        - Identify any discrepancies or inconsistencies with application information
-        - Note any red flags (unusual patterns, missing information, income inconsistencies)
-        - Highlight how the document supports or contradicts coverage amount requests
-        - Explain specific underwriting value in the analysis, especially for coverage justification and risk assessment
-        """
+        focus, salary_slip, invoice, closing = _LIFE_FOCUS, _LIFE_SALARY_SLIP, _LIFE_INVOICE, _LIFE_WAGE_DOC_CLOSING
     else:
-        type_specific_instructions = """
-        Focus on:
-        - Property details, location, and construction
-        - Risk exposures (fire, flood, liability, etc.)
-        - Coverage limits and deductibles
-        - Property assessment details
-        - Set 'medical_timeline' to "N/A"
-        
-        SPECIAL DOCUMENT HANDLING - Salary Slips and Invoices:
-        
-        **SALARY SLIPS (Pay Stubs, Payroll Statements):**
-        If the document is a salary slip/pay stub, analyze it for:
-        - Employee name, employer name, and employment period
-        - Gross salary, net salary, deductions (taxes, insurance, etc.)
-        - Employment stability indicators (consistent payments, tenure)
-        - Income verification for premium payment capacity
-        - Employee benefits and insurance coverage details
-        
-        Value for Property & Casualty Insurance:
-        1. **Financial Stability Assessment**: 
-           - Verify applicant's ability to pay premiums consistently
-           - Assess income-to-premium ratio to ensure affordability
-           - Identify financial stability indicators (steady employment, regular income)
-        
-        2. **Business Operations Understanding** (for commercial policies):
-           - Confirm employment details for business owners/employees
-           - Verify business operations and employee count
-           - Assess payroll exposure for workers' compensation risk
-           - Understand organizational structure and hierarchy
-        
-        3. **Risk Assessment**:
-           - Stable income suggests lower risk of policy cancellation
-           - Employment verification reduces fraud risk
-           - Income level helps determine appropriate coverage limits
-           - Employer information helps verify business legitimacy
-        
-        4. **Premium Payment Capacity**:
-           - Calculate if income supports requested coverage amounts
-           - Identify potential payment issues early
-           - Assess financial capacity for deductibles and premiums
-        
-        **INVOICES (Bills, Purchase Orders, Service Invoices):**
-        If the document is an invoice, analyze it for:
-        - Invoice number, date, and payment terms
-        - Vendor/supplier information and credentials
-        - Itemized goods/services purchased
-        - Purchase amounts, taxes, and totals
-        - Payment status and due dates
-        - Property/equipment descriptions and values
-        
-        Value for Property & Casualty Insurance:
-        1. **Property Valuation & Inventory**:
-           - Verify actual property values for accurate coverage
-           - Identify newly purchased assets requiring coverage
-           - Validate replacement costs for property insurance
-           - Document inventory and equipment for business personal property coverage
-        
-        2. **Business Operations Verification**:
-           - Confirm business activity and industry type
-           - Verify supplier relationships and supply chain
-           - Understand business expenses and operational scale
-           - Assess volume of business transactions
-        
-        3. **Risk Exposure Assessment**:
-           - Identify high-value items requiring special coverage
-           - Assess equipment and machinery risks
-           - Evaluate inventory exposure for theft/damage
-           - Understand business interruption potential from supplier dependencies
-        
-        4. **Liability Risk Indicators**:
-           - Identify products/services that may create liability exposure
-           - Assess vendor relationships for contractual liability
-           - Evaluate professional services exposure
-           - Understand product liability risks from goods sold
-        
-        5. **Property Coverage Needs**:
-           - Determine if purchased items need immediate coverage
-           - Verify property locations and addresses
-           - Assess seasonal inventory fluctuations
-           - Identify equipment requiring specialized coverage
-        
-        6. **Financial Verification**:
-           - Verify business legitimacy and operational reality
-           - Assess cash flow and payment patterns
-           - Identify potential financial stress indicators
-           - Support business income coverage calculations
-        
-        When analyzing salary slips or invoices:
-        - Extract all financial figures, dates, and parties involved
-        - Identify any discrepancies or inconsistencies
-        - Note any red flags (unusual patterns, missing information)
-        - Highlight how the document supports or contradicts other application information
-        - Explain specific underwriting value in the 'property_assessment' field with clear reasoning
-        """
-    consolidated = json.dumps(extracted_data, indent=2)
-    return f"""You are an expert insurance underwriter tasked with analyzing extracted document information for {insurance_type.replace('_', ' ').title()} insurance.
+        focus, salary_slip, invoice, closing = _PC_FOCUS, _PC_SALARY_SLIP, _PC_INVOICE, _PC_WAGE_DOC_CLOSING
 
-{type_specific_instructions}
+    parts = [focus]
+    if doc_type in _DOC_TYPE_INSTRUCTIONS:
+        parts.append(_DOC_TYPE_INSTRUCTIONS[doc_type])
+    elif doc_type in (None, "general", "salary_slip", "invoice"):
+        parts.append("SPECIAL DOCUMENT HANDLING - Salary Slips and Invoices:\n")
+        if doc_type != "invoice":
+            parts.append(salary_slip)
+        if doc_type != "salary_slip":
+            parts.append(invoice)
+        parts.append(closing)
+    return "\n".join(parts)
 
-The following data was extracted from an insurance document:
-<extracted_data>
-{consolidated}
-</extracted_data>
 
-DOCUMENT TYPE DETECTION:
+def get_individual_analysis_prompt_prefix(insurance_type: str, doc_type: Optional[str] = None) -> str:
+    """
+    Static instruction prefix of the per-document analysis prompt.
+
+    It depends only on insurance_type and doc_type, so it is byte-identical across
+    documents and is sent with a Bedrock prompt-cache marker.
+
+    Args:
+        insurance_type: 'life' or 'property_casualty'
+        doc_type: Pre-classified document type; when omitted (or "general") the prompt
+            carries every instruction block and asks the model to detect the type itself
+    """
+    insurance_label = insurance_type.replace('_', ' ').title()
+    type_specific_instructions = get_type_specific_instructions(insurance_type, doc_type)
+
+    # Salary slip / invoice guidance only applies when the type is unknown or one of those two
+    salary = doc_type in (None, "general", "salary_slip")
+    invoice = doc_type in (None, "general", "invoice")
+
+    if doc_type in DOC_TYPE_LABELS:
+        detection_section = (
+            f"DOCUMENT TYPE:\nThis document was pre-classified as a **{DOC_TYPE_LABELS[doc_type]}** from its extracted fields. "
+            f"Follow the handling instructions above for this document type and explain its value for {insurance_label} insurance underwriting."
+        )
+    else:
+        detection_section = f"""DOCUMENT TYPE DETECTION:
 First, identify if this document is:
 - A **SALARY SLIP/PAY STUB**: Contains employee name, employer, salary details, deductions, pay period
 - An **INVOICE/BILL**: Contains invoice number, vendor, items purchased, amounts, payment terms
 - Other insurance document types (ACORD forms, loss runs, financial statements, etc.)
 
-If this is a SALARY SLIP or INVOICE, follow the special handling instructions above and ensure the analysis clearly explains the value for {insurance_type.replace('_', ' ').title()} insurance underwriting.
+If this is a SALARY SLIP or INVOICE, follow the special handling instructions above and ensure the analysis clearly explains the value for {insurance_label} insurance underwriting."""
+
+    def lines(*items):
+        return "".join(f"\n{text}" for include, text in items if include)
+
+    goal_1_note = " If it's a salary slip or invoice, clearly state this and explain its relevance to the insurance application." if salary or invoice else ""
+    risk_notes = lines(
+        (salary, f"   - For salary slips ({insurance_type}): Consider risks like income instability, employment gaps, payment capacity issues, occupation-related hazards (life), or payroll exposure (property/casualty)"),
+        (invoice, f"   - For invoices ({insurance_type}): Consider risks like high-value items without coverage, property valuation discrepancies, business interruption exposure (property/casualty), or lifestyle risk factors (life)"),
+    )
+    discrepancy_notes = lines(
+        (salary, "   - For salary slips: Check for inconsistencies in income amounts, employer information, or coverage amount justification (life). DO NOT flag date mismatches or future dates."),
+        (invoice, "   - For invoices: Verify amounts, vendor information align with other documents, or business ownership claims (life). DO NOT flag date mismatches or future dates."),
+        (True, "   - CRITICAL: DO NOT report discrepancies related to dates, date mismatches, future dates, or date inconsistencies. Ignore all date-related discrepancies regardless of insurance type."),
+    )
+    timeline_notes = lines(
+        (salary, "   - For life insurance salary slips: If health-related deductions or benefits are present, mention them here"),
+        (invoice, "   - For life insurance invoices: If health/lifestyle-related purchases are present, mention them here"),
+    )
+    if salary or invoice:
+        property_notes = lines(
+            (True, "   - For Property & Casualty insurance: If the document is property-related OR if it's a salary slip/invoice:"),
+            (salary, "     * For salary slips: Explain income verification, payment capacity assessment, employment stability, payroll exposure, and how this supports premium payment reliability"),
+            (invoice, "     * For invoices: Explain property valuation, inventory assessment, business operations verification, and risk exposure analysis"),
+            (True, "     * For other property documents: Provide property assessment details"),
+            (True, "   - For Life insurance: \n     * Set to \"N/A\" (salary slips and invoices should be analyzed in 'overall_summary', 'identified_risks', and 'final_recommendation' instead)"),
+        )
+    else:
+        property_notes = lines(
+            (True, "   - For Property & Casualty insurance: Provide property assessment details if the document is property-related"),
+            (True, "   - For Life insurance: Set to \"N/A\""),
+        )
+    recommendation_notes = lines(
+        (salary, f"   - For salary slips ({insurance_type}): \n     * Life insurance: Include recommendations about premium payment capacity, coverage amount justification, occupation risk assessment, and financial stability\n     * Property/Casualty: Include recommendations about premium payment capacity, coverage limits, financial stability, and payroll exposure"),
+        (invoice, f"   - For invoices ({insurance_type}): \n     * Life insurance: Include recommendations about coverage need justification, lifestyle risk factors, business ownership verification, and financial stability\n     * Property/Casualty: Include recommendations about property coverage needs, valuations, risk mitigation, and business operations"),
+    )
+    missing_notes = lines(
+        (salary, "   - For salary slips: Note if additional employment verification, tax returns, or bank statements are needed"),
+        (invoice, "   - For invoices: Note if additional invoices for other periods, property valuations, or purchase receipts are needed"),
+    )
+    wage_doc_guideline = lines(
+        (salary or invoice, "- For salary slips and invoices:\n  * Property & Casualty: Ensure the 'property_assessment' field clearly explains their value for underwriting\n  * Life Insurance: Set 'property_assessment' to \"N/A\" and explain the value in 'overall_summary', 'identified_risks', and 'final_recommendation' instead"),
+    )
+
+    prefix = f"""You are an expert insurance underwriter tasked with analyzing extracted document information for {insurance_label} insurance.
+
+{type_specific_instructions}
+
+{detection_section}
 
 Please perform a comprehensive analysis. Your goal is to:
-1. Provide an 'overall_summary' of the document content and its purpose based on the extracted data. If it's a salary slip or invoice, clearly state this and explain its relevance to the insurance application.
-2. Identify key risks in 'identified_risks'. For each risk, include 'risk_description', 'severity' (Low, Medium, or High), and 'page_references' (list of strings, e.g., ["1", "3-5"], use ["N/A"] if not applicable).
-   - For salary slips ({insurance_type}): Consider risks like income instability, employment gaps, payment capacity issues, occupation-related hazards (life), or payroll exposure (property/casualty)
-   - For invoices ({insurance_type}): Consider risks like high-value items without coverage, property valuation discrepancies, business interruption exposure (property/casualty), or lifestyle risk factors (life)
-3. Identify any discrepancies or inconsistencies in 'discrepancies'. For each, include 'discrepancy_description', 'details' (provide specific details of the discrepancy), and 'page_references' (list of strings, e.g., ["2", "10"], use ["N/A"] if not applicable).
-   - For salary slips: Check for inconsistencies in income amounts, employer information, or coverage amount justification (life). DO NOT flag date mismatches or future dates.
-   - For invoices: Verify amounts, vendor information align with other documents, or business ownership claims (life). DO NOT flag date mismatches or future dates.
-   - CRITICAL: DO NOT report discrepancies related to dates, date mismatches, future dates, or date inconsistencies. Ignore all date-related discrepancies regardless of insurance type.
-4. Provide a 'medical_timeline' (string, use Markdown for formatting) if the document is medical-related. If not applicable, provide an empty string or "N/A".
-   - For life insurance salary slips: If health-related deductions or benefits are present, mention them here
-   - For life insurance invoices: If health/lifestyle-related purchases are present, mention them here
-5. Provide a 'property_assessment' (string, use Markdown for formatting):
-   - For Property & Casualty insurance: If the document is property-related OR if it's a salary slip/invoice:
-     * For salary slips: Explain income verification, payment capacity assessment, employment stability, payroll exposure, and how this supports premium payment reliability
-     * For invoices: Explain property valuation, inventory assessment, business operations verification, and risk exposure analysis
-     * For other property documents: Provide property assessment details
-   - For Life insurance: 
-     * Set to "N/A" (salary slips and invoices should be analyzed in 'overall_summary', 'identified_risks', and 'final_recommendation' instead)
+1. Provide an 'overall_summary' of the document content and its purpose based on the extracted data.{goal_1_note}
+2. Identify key risks in 'identified_risks'. For each risk, include 'risk_description', 'severity' (Low, Medium, or High), and 'page_references' (list of strings, e.g., ["1", "3-5"], use ["N/A"] if not applicable).{risk_notes}
+3. Identify any discrepancies or inconsistencies in 'discrepancies'. For each, include 'discrepancy_description', 'details' (provide specific details of the discrepancy), and 'page_references' (list of strings, e.g., ["2", "10"], use ["N/A"] if not applicable).{discrepancy_notes}
+4. Provide a 'medical_timeline' (string, use Markdown for formatting) if the document is medical-related. If not applicable, provide an empty string or "N/A".{timeline_notes}
+5. Provide a 'property_assessment' (string, use Markdown for formatting):{property_notes}
    - If not applicable, provide "N/A"
-6. Formulate a 'final_recommendation' (string, use Markdown for formatting) for the underwriter based on your analysis (e.g., approve, decline with reasons, request more info).
-   - For salary slips ({insurance_type}): 
-     * Life insurance: Include recommendations about premium payment capacity, coverage amount justification, occupation risk assessment, and financial stability
-     * Property/Casualty: Include recommendations about premium payment capacity, coverage limits, financial stability, and payroll exposure
-   - For invoices ({insurance_type}): 
-     * Life insurance: Include recommendations about coverage need justification, lifestyle risk factors, business ownership verification, and financial stability
-     * Property/Casualty: Include recommendations about property coverage needs, valuations, risk mitigation, and business operations
-7. List any critical missing information in 'missing_information'. For each, include 'item_description' and 'notes'.
-   - For salary slips: Note if additional employment verification, tax returns, or bank statements are needed
-   - For invoices: Note if additional invoices for other periods, property valuations, or purchase receipts are needed
+6. Formulate a 'final_recommendation' (string, use Markdown for formatting) for the underwriter based on your analysis (e.g., approve, decline with reasons, request more info).{recommendation_notes}
+7. List any critical missing information in 'missing_information'. For each, include 'item_description' and 'notes'.{missing_notes}
 8. If you can estimate a 'confidence_score' (0.0 to 1.0) for your overall analysis based on the quality and completeness of the provided extracted data, include it. Otherwise, you can omit it or use a default like 0.75.
 
 Structure your response as a single JSON object matching the following schema precisely. Do not include any explanations or text outside this JSON structure:
@@ -255,23 +422,96 @@ Important Guidelines:
 - Adhere strictly to the JSON schema provided for the output.
 - If a section like 'identified_risks', 'discrepancies', or 'missing_information' has no items, provide an empty list ([]) for that key.
 - For 'page_references', if the source extracted data does not contain explicit page numbers associated with the information, use ["N/A"].
-- CRITICAL: DO NOT report any discrepancies related to dates, date mismatches, future dates, or date inconsistencies. Ignore all date-related discrepancies completely, regardless of insurance type.
-- For salary slips and invoices:
-  * Property & Casualty: Ensure the 'property_assessment' field clearly explains their value for underwriting
-  * Life Insurance: Set 'property_assessment' to "N/A" and explain the value in 'overall_summary', 'identified_risks', and 'final_recommendation' instead
+- CRITICAL: DO NOT report any discrepancies related to dates, date mismatches, future dates, or date inconsistencies. Ignore all date-related discrepancies completely, regardless of insurance type.{wage_doc_guideline}
 - If you can estimate a 'confidence_score' (0.0 to 1.0) for your overall analysis based on the quality and completeness of the provided extracted data, include it. Otherwise, you can omit it or use a default like 0.75.
+"""
+    return prefix
+
+
+def get_individual_analysis_prompt_parts(
+    insurance_type: str,
+    extracted_data: dict,
+    doc_type: Optional[str] = None,
+    part_note: Optional[str] = None
+) -> Tuple[str, str]:
+    """
+    Build the per-document analysis prompt as (static prefix, document suffix).
 
+    Args:
+        insurance_type: 'life' or 'property_casualty'
+        extracted_data: Extracted flat-json for one document
+        doc_type: See get_individual_analysis_prompt_prefix
+        part_note: Placed after the data when only part of a document is being analyzed
+    """
+    prefix = get_individual_analysis_prompt_prefix(insurance_type, doc_type)
+    consolidated = encode_for_prompt(extracted_data)
+    suffix = f"""The following data was extracted from an insurance document:
+<extracted_data>
+{consolidated}
+</extracted_data>
+{f"{chr(10)}{part_note}{chr(10)}" if part_note else ""}
 Return ONLY the JSON object."""
+    return prefix, suffix
 
-def get_consolidated_analysis_prompt(insurance_type: str, individual_analyses: List[Dict[str, Any]]) -> str:
-    analyses_text = json.dumps(individual_analyses, indent=2)
-    return f"""You are a senior insurance underwriter conducting a comprehensive portfolio review for {insurance_type.replace('_', ' ').title()} insurance applications.
 
-You have been provided with individual analyses from multiple documents. Your task is to create a concise consolidated final analysis that synthesizes all findings into a single, non-repetitive markdown document.
+def get_individual_analysis_prompt(
+    insurance_type: str,
+    extracted_data: dict,
+    doc_type: Optional[str] = None,
+    part_note: Optional[str] = None
+) -> str:
+    """Single-string form of get_individual_analysis_prompt_parts."""
+    prefix, suffix = get_individual_analysis_prompt_parts(insurance_type, extracted_data, doc_type, part_note)
+    return f"{prefix}\n{suffix}"
+
+
+# Bump when the analysis changes in a way the instruction prefix does not show
+# (data encoding, suffix wording, post-processing) so stored analyses are recomputed
+ANALYSIS_PROMPT_REVISION = 1
+
+
+@lru_cache(maxsize=None)
+def analysis_prompt_version(insurance_type: str, doc_type: Optional[str] = None) -> str:
+    """Fingerprint of the model and single-call analysis instructions used for one document type."""
+    prefix = get_individual_analysis_prompt_prefix(insurance_type, doc_type)
+    material = json.dumps([ANALYSIS_PROMPT_REVISION, BEDROCK_MODEL_ID, prefix])
+    return f"single-{ANALYSIS_PROMPT_REVISION}-{hashlib.sha256(material.encode('utf-8')).hexdigest()[:16]}"
+
+
+def get_consolidated_analysis_prompt(
+    insurance_type: str,
+    individual_analyses: List[Dict[str, Any]],
+    pre_consolidated: bool = False,
+    record_stats: bool = True
+) -> str:
+    """
+    Build the final markdown consolidation prompt.
+
+    Args:
+        insurance_type: 'life' or 'property_casualty'
+        individual_analyses: Individual analyses, or group digests when `pre_consolidated`
+        pre_consolidated: Inputs are group digests from services.consolidation
+        record_stats: Count the encoded inputs in prompt_encoding_stats (off when only fingerprinting)
+    """
+    # every analysis must reach the report: size is bounded by hierarchical consolidation, not truncation
+    analyses_text = encode_for_prompt(
+        individual_analyses, prune_fields=False, dedupe=False, fit_budget=False, record_stats=record_stats
+    )
+    if pre_consolidated:
+        inputs_section = f"""You have been provided with group summaries, each condensing the analyses of several documents. Their 'documents' arrays together list every document analyzed. Your task is to create a concise consolidated final analysis that synthesizes all findings into a single, non-repetitive markdown document. The Document-Specific Summary Table must contain one row for every document listed in the 'documents' arrays.
+
+<group_summaries>
+{analyses_text}
+</group_summaries>"""
+    else:
+        inputs_section = f"""You have been provided with individual analyses from multiple documents. Your task is to create a concise consolidated final analysis that synthesizes all findings into a single, non-repetitive markdown document.
 
 <individual_analyses>
 {analyses_text}
-</individual_analyses>
+</individual_analyses>"""
+    return f"""You are a senior insurance underwriter conducting a comprehensive portfolio review for {insurance_type.replace('_', ' ').title()} insurance applications.
+
+{inputs_section}
 
 CRITICAL FORMATTING REQUIREMENTS:
 1. Start immediately with "## Executive Summary" (do NOT include any title or heading before this)
@@ -334,16 +574,134 @@ IMPORTANT:
 
 Your consolidated analysis:"""
 
-async def analyze_with_claude(prompt: str, max_tokens: int = 4096) -> dict:
+def make_tool(name: str, description: str, input_schema: dict) -> dict:
+    """Tool definition whose forced call carries a JSON output as schema-shaped arguments."""
+    return {"name": name, "description": description, "input_schema": input_schema}
+
+
+ANALYSIS_TOOL = make_tool(
+    "record_document_analysis",
+    "Record the underwriting analysis of the document.",
+    ANALYSIS_OUTPUT_SCHEMA
+)
+
+
+def build_request_body(
+    prompt: str,
+    max_tokens: int,
+    temperature: float,
+    cacheable_prefix: Optional[str] = None,
+    tool: Optional[dict] = None
+) -> dict:
+    """
+    Bedrock Anthropic Messages request body.
+
+    With a `cacheable_prefix` the user turn is two text blocks: the prefix, marked
+    with cache_control so Bedrock caches it, followed by the variable `prompt`.
+    With a `tool` the model is forced to answer by calling it.
+    """
+    if cacheable_prefix:
+        prefix_block = {"type": "text", "text": cacheable_prefix}
+        if BEDROCK_PROMPT_CACHING:
+            prefix_block["cache_control"] = {"type": "ephemeral"}
+        content: Any = [prefix_block, {"type": "text", "text": prompt}]
+    else:
+        content = prompt
+    body = {
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "messages": [{"role": "user", "content": content}]
+    }
+    if tool:
+        body["tools"] = [tool]
+        body["tool_choice"] = {"type": "tool", "name": tool["name"]}
+    return body
+
+
+# Cumulative Bedrock token usage, including prompt-cache reads/writes, for /metrics
+bedrock_usage_stats = {
+    "calls": 0,
+    "input_tokens": 0,
+    "output_tokens": 0,
+    "cache_read_input_tokens": 0,
+    "cache_creation_input_tokens": 0
+}
+_usage_lock = threading.Lock()
+
+
+def record_bedrock_usage(usage: Optional[dict]) -> dict:
+    """Add one call's usage block to bedrock_usage_stats; returns the normalized usage."""
+    usage = usage or {}
+    normalized = {key: int(usage.get(key) or 0) for key in bedrock_usage_stats if key != "calls"}
+    with _usage_lock:
+        bedrock_usage_stats["calls"] += 1
+        for key, value in normalized.items():
+            bedrock_usage_stats[key] += value
+    return normalized
+
+
+def _cache_prompt_text(prompt: str, cacheable_prefix: Optional[str], tool: Optional[dict] = None) -> str:
+    text = f"{cacheable_prefix}\n{prompt}" if cacheable_prefix else prompt
+    if tool:
+        text = f"{text}\n<tool>{json.dumps(tool, sort_keys=True)}</tool>"
+    return text
+
+
+def _response_text(content: List[dict], tool: Optional[dict]) -> Tuple[str, bool]:
+    """(text, from_tool): the forced tool call's arguments as JSON, else the first text block."""
+    if tool:
+        for block in content:
+            if block.get("type") == "tool_use":
+                return json.dumps(block.get("input"), ensure_ascii=False), True
+    for block in content:
+        if "text" in block:
+            return block["text"], False
+    raise ValueError("Unexpected response format from Bedrock")
+
+
+async def analyze_with_claude(
+    prompt: str,
+    max_tokens: int = 4096,
+    temperature: float = 0.3,
+    use_cache: bool = True,
+    cacheable_prefix: Optional[str] = None,
+    tool: Optional[dict] = None,
+    cache_result: Optional[Callable[[str], bool]] = None
+) -> dict:
+    """
+    Invoke Claude on Bedrock, answering from the response cache when possible.
+
+    Cache lookups and stores run in a worker thread, not on bedrock_pool, so a hit
+    never queues behind in-flight Bedrock calls.
+
+    Args:
+        prompt: User prompt text (the variable part when `cacheable_prefix` is given)
+        max_tokens: Output token limit
+        temperature: Sampling temperature
+        use_cache: Set False to bypass the response cache (the fresh response is still stored)
+        cacheable_prefix: Static instructions sent ahead of `prompt` with a prompt-cache marker
+        tool: Force the answer through this tool; "analysis" is then its arguments as JSON text
+        cache_result: Only responses for which this returns True are stored or replayed
+            (analyze_structured passes its validation so invalid outputs are retried)
+
+    Returns:
+        {"success": True, "analysis": text, "cached": bool, "usage": {...}} or {"success": False, "error": str}
+    """
+    cache_key = make_cache_key(
+        BEDROCK_MODEL_ID, _cache_prompt_text(prompt, cacheable_prefix, tool), max_tokens, temperature
+    )
+    if use_cache:
+        cached = await asyncio.to_thread(llm_cache.get, cache_key)
+        if cached is not None:
+            if cache_result is None or cache_result(cached["text"]):
+                return {"success": True, "analysis": cached["text"], "cached": True}
+            await asyncio.to_thread(llm_cache.invalidate, cache_key)
+    else:
+        llm_cache.record_bypass()
     try:
-        loop = asyncio.get_event_loop()
         def call_claude():
-            request_body = {
-                "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": max_tokens,
-                "temperature": 0.3,
-                "messages": [{"role": "user", "content": prompt}]
-            }
+            request_body = build_request_body(prompt, max_tokens, temperature, cacheable_prefix, tool)
             response = bedrock_client.invoke_model(
                 modelId=BEDROCK_MODEL_ID,
                 contentType="application/json",
@@ -352,39 +710,144 @@ async def analyze_with_claude(prompt: str, max_tokens: int = 4096) -> dict:
             )
             response_body = json.loads(response['body'].read())
             if 'content' in response_body and len(response_body['content']) > 0:
-                return response_body['content'][0]['text']
+                return _response_text(response_body['content'], tool), response_body.get('usage')
             else:
                 raise ValueError("Unexpected response format from Bedrock")
-        with ThreadPoolExecutor(max_workers=1) as executor:
-            response_text = await loop.run_in_executor(executor, call_claude)
-        return {"success": True, "analysis": response_text}
+        started = time.perf_counter()
+        (response_text, from_tool), usage = await bedrock_pool.run(call_claude)
+        latency_ms = (time.perf_counter() - started) * 1000
+        usage = record_bedrock_usage(usage)
+        if cache_result is None or cache_result(response_text):
+            await asyncio.to_thread(llm_cache.put, cache_key, response_text, latency_ms)
+        return {"success": True, "analysis": response_text, "cached": False, "usage": usage, "tool_use": from_tool}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
+
+async def analyze_with_claude_stream(
+    prompt: str,
+    max_tokens: int = 4096,
+    temperature: float = 0.3,
+    use_cache: bool = True,
+    cacheable_prefix: Optional[str] = None
+) -> AsyncIterator[dict]:
+    """
+    Stream a Claude response from Bedrock as it is generated.
+
+    The blocking event stream is read on a bedrock_pool thread and bridged to the
+    event loop through an asyncio.Queue. A cache hit is replayed as a single chunk.
+
+    Yields:
+        {"type": "text", "text": str} for each delta, then exactly one final
+        {"type": "done", "ttfb_ms", "total_ms", "input_tokens", "output_tokens",
+        "cache_read_input_tokens", "cache_creation_input_tokens", "cached", "text"}
+        or {"type": "error", "error": str}
+    """
+    started = time.perf_counter()
+    cache_key = make_cache_key(BEDROCK_MODEL_ID, _cache_prompt_text(prompt, cacheable_prefix), max_tokens, temperature)
+    if use_cache:
+        cached = await asyncio.to_thread(llm_cache.get, cache_key)
+        if cached is not None:
+            elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+            yield {"type": "text", "text": cached["text"]}
+            yield {
+                "type": "done", "ttfb_ms": elapsed_ms, "total_ms": elapsed_ms,
+                "input_tokens": None, "output_tokens": None, "cache_read_input_tokens": None,
+                "cache_creation_input_tokens": None, "cached": True, "text": cached["text"]
+            }
+            return
+    else:
+        llm_cache.record_bypass()
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    _end = object()
+    stop = threading.Event()
+
+    def read_stream():
+        try:
+            request_body = build_request_body(prompt, max_tokens, temperature, cacheable_prefix)
+            response = bedrock_client.invoke_model_with_response_stream(
+                modelId=BEDROCK_MODEL_ID,
+                contentType="application/json",
+                accept="application/json",
+                body=json.dumps(request_body)
+            )
+            for event in response["body"]:
+                if stop.is_set():
+                    # consumer went away (e.g. client disconnected)
+                    break
+                chunk = event.get("chunk")
+                if chunk:
+                    loop.call_soon_threadsafe(queue.put_nowait, json.loads(chunk["bytes"]))
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, {"type": "_error", "error": str(e)})
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, _end)
+
+    reader = asyncio.ensure_future(bedrock_pool.run(read_stream))
+    parts: List[str] = []
+    ttfb_ms = None
+    usage: Dict[str, Any] = {}
+    error = None
+    try:
+        while True:
+            message = await queue.get()
+            if message is _end:
+                break
+            kind = message.get("type")
+            if kind == "_error":
+                error = message["error"]
+            elif kind == "message_start":
+                usage.update(message.get("message", {}).get("usage", {}))
+            elif kind == "content_block_delta" and message.get("delta", {}).get("type") == "text_delta":
+                text = message["delta"]["text"]
+                if ttfb_ms is None:
+                    ttfb_ms = round((time.perf_counter() - started) * 1000, 1)
+                parts.append(text)
+                yield {"type": "text", "text": text}
+            elif kind == "message_delta":
+                usage.update(message.get("usage", {}))
+    finally:
+        stop.set()
+        await reader
+
+    if error is not None:
+        yield {"type": "error", "error": error}
+        return
+    total_ms = (time.perf_counter() - started) * 1000
+    response_text = "".join(parts)
+    await asyncio.to_thread(llm_cache.put, cache_key, response_text, total_ms)
+    yield {
+        "type": "done", "ttfb_ms": ttfb_ms, "total_ms": round(total_ms, 1),
+        **record_bedrock_usage(usage),
+        "cached": False, "text": response_text
+    }
+
+
 def extract_json_from_response(response_text: str) -> dict:
-    import re
+    """
+    Parse the JSON object in a model response, with or without a ```json fence.
+
+    Uses the JSON decoder itself to find where the object ends, so braces and
+    backticks inside string values do not cut it short.
+    """
     response_text = response_text.strip()
-    code_block_pattern = r'```(?:json)?\s*(.+?)\s*```'
-    code_match = re.search(code_block_pattern, response_text, re.DOTALL)
-    if code_match:
-        json_str = code_match.group(1).strip()
-    else:
-        start_idx = response_text.find('{')
-        if start_idx != -1:
-            brace_count = 0
-            end_idx = start_idx
-            for i in range(start_idx, len(response_text)):
-                if response_text[i] == '{':
-                    brace_count += 1
-                elif response_text[i] == '}':
-                    brace_count -= 1
-                    if brace_count == 0:
-                        end_idx = i
-                        break
-            json_str = response_text[start_idx:end_idx+1]
-        else:
-            json_str = response_text
-    return json.loads(json_str)
+    try:
+        return json.loads(response_text)
+    except json.JSONDecodeError as e:
+        first_error = e
+    decoder = json.JSONDecoder()
+    start_idx = response_text.find('{')
+    while start_idx != -1:
+        try:
+            parsed, _ = decoder.raw_decode(response_text, start_idx)
+            if isinstance(parsed, dict):
+                return parsed
+        except json.JSONDecodeError:
+            pass
+        start_idx = response_text.find('{', start_idx + 1)
+    raise first_error
 
 def validate_analysis_schema(analysis_json: dict) -> Tuple[bool, str]:
     try:
@@ -406,3 +869,130 @@ def validate_analysis_schema(analysis_json: dict) -> Tuple[bool, str]:
         if "missing_information" in analysis_json and not isinstance(analysis_json["missing_information"], list):
             return False, "Field 'missing_information' must be a list"
         return True, ""
+
+
+# Parse/validation outcomes of JSON responses and the extra calls spent repairing them, for /metrics
+structured_output_stats = {
+    "responses": 0,
+    "tool_responses": 0,
+    "parse_failures": 0,
+    "validation_failures": 0,
+    "repair_calls": 0,
+    "repaired": 0,
+    "failed": 0
+}
+
+
+def structured_output_snapshot() -> dict:
+    stats = dict(structured_output_stats)
+    responses = stats["responses"]
+    stats["tools_enabled"] = STRUCTURED_OUTPUT_TOOLS
+    stats["parse_failure_rate"] = round(stats["parse_failures"] / responses, 4) if responses else 0.0
+    stats["invalid_rate"] = round((stats["parse_failures"] + stats["validation_failures"]) / responses, 4) if responses else 0.0
+    return stats
+
+
+def get_repair_prompt(previous_output: str, error: str, schema: Optional[dict] = None) -> str:
+    """Targeted repair: only the invalid output and its error, never the source document."""
+    schema_text = f"\nThe object must match this schema:\n{json.dumps(schema, separators=(',', ':'))}\n" if schema else ""
+    return f"""Your previous response could not be used because it is not a valid JSON object for the required schema.
+
+Error:
+{error}
+
+<previous_response>
+{previous_output}
+</previous_response>
+{schema_text}
+Return the corrected JSON object. Fix only what the error requires and keep all other content unchanged."""
+
+
+def _try_parse(text: str, validate: Callable[[Any], Tuple[bool, str]]) -> Tuple[Optional[dict], Optional[str], Optional[str]]:
+    """(parsed object, error, failing stat) for one response; counts nothing, so cache predicates can use it."""
+    try:
+        data = extract_json_from_response(text)
+    except Exception as e:
+        return None, f"Response is not valid JSON: {str(e)}", "parse_failures"
+    if not isinstance(data, dict):
+        return None, "Response is not a JSON object", "parse_failures"
+    is_valid, validation_error = validate(data)
+    if not is_valid:
+        return None, validation_error, "validation_failures"
+    return data, None, None
+
+
+def _parse_and_validate(
+    text: str,
+    validate: Callable[[Any], Tuple[bool, str]],
+    outcome: Optional[tuple] = None
+) -> Tuple[Optional[dict], Optional[str]]:
+    """
+    Parse and validate one response, counting it in structured_output_stats.
+
+    Args:
+        outcome: _try_parse result already computed for `text`, reused instead of parsing again
+    """
+    data, error, failure = outcome if outcome is not None else _try_parse(text, validate)
+    structured_output_stats["responses"] += 1
+    if failure:
+        structured_output_stats[failure] += 1
+    return data, error
+
+
+async def analyze_structured(
+    prompt: str,
+    tool: dict,
+    validate: Callable[[Any], Tuple[bool, str]],
+    max_tokens: int = 4096,
+    use_cache: bool = True,
+    cacheable_prefix: Optional[str] = None
+) -> dict:
+    """
+    Invoke Claude for a JSON object, parsed and validated, with targeted repair calls.
+
+    The object is requested as a forced call of `tool` (unless STRUCTURED_OUTPUT_TOOLS
+    is off). An output that does not parse or fails `validate` is sent back with the
+    error, without the original prompt, up to STRUCTURED_OUTPUT_MAX_REPAIRS times.
+    Only validated outputs are kept in the response cache.
+
+    Args:
+        tool: make_tool() definition whose input_schema describes the object
+        validate: Returns (is_valid, error message) for a parsed object
+
+    Returns:
+        analyze_with_claude result with "analysis" the validated dict and "repairs" the
+        number of repair calls, or {"success": False, "error": str, "raw_response": str}
+    """
+    call_tool = tool if STRUCTURED_OUTPUT_TOOLS else None
+
+    # the cache predicate parses each response once; the loop below reuses that outcome and does the counting
+    outcomes: Dict[str, tuple] = {}
+
+    def is_valid(text: str) -> bool:
+        outcomes[text] = _try_parse(text, validate)
+        return outcomes[text][1] is None
+
+    result = await analyze_with_claude(
+        prompt, max_tokens=max_tokens, use_cache=use_cache, cacheable_prefix=cacheable_prefix, tool=call_tool,
+        cache_result=is_valid
+    )
+    repairs = 0
+    while result["success"]:
+        if result.get("tool_use"):
+            structured_output_stats["tool_responses"] += 1
+        data, error = _parse_and_validate(result["analysis"], validate, outcomes.pop(result["analysis"], None))
+        if error is None:
+            if repairs:
+                structured_output_stats["repaired"] += 1
+            return {**result, "analysis": data, "repairs": repairs}
+        if repairs >= STRUCTURED_OUTPUT_MAX_REPAIRS:
+            structured_output_stats["failed"] += 1
+            return {"success": False, "error": error, "raw_response": result["analysis"][:500], "repairs": repairs}
+        repairs += 1
+        structured_output_stats["repair_calls"] += 1
+        print(f"🔧 Repair call {repairs}/{STRUCTURED_OUTPUT_MAX_REPAIRS} for invalid structured output: {error[:200]}")
+        repair_prompt = get_repair_prompt(result["analysis"], error, None if call_tool else tool["input_schema"])
+        result = await analyze_with_claude(
+            repair_prompt, max_tokens=max_tokens, use_cache=use_cache, tool=call_tool, cache_result=is_valid
+        )
+    return {**result, "repairs": repairs}
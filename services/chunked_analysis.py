@@ -0,0 +1,294 @@
+"""
+Map-reduce analysis for extractions too large for a single prompt.
+
+The records of an oversized extraction are tagged with their source page
+(from the page ranges of page-aware PDF extraction or page fields of the
+records; records without page metadata stay untagged),
+grouped into chunks of at most ANALYSIS_CHUNK_TOKENS, and each chunk is
+analyzed concurrently with the regular individual analysis prompt. The
+partial analyses are then reduced ANALYSIS_REDUCE_FAN_IN at a time by Claude
+until one remains, so no single call grows with the document. A reduce step
+whose output fails ANALYSIS_OUTPUT_SCHEMA falls back to a deterministic merge.
+"""
+import re
+import json
+import hashlib
+import asyncio
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+from config.settings import (
+    ANALYSIS_OUTPUT_SCHEMA,
+    ANALYSIS_MAP_REDUCE_THRESHOLD_TOKENS,
+    ANALYSIS_CHUNK_TOKENS,
+    ANALYSIS_REDUCE_FAN_IN
+)
+from services.analyze import (
+    get_individual_analysis_prompt_parts,
+    analysis_prompt_version,
+    analyze_structured,
+    validate_analysis_schema,
+    ANALYSIS_TOOL
+)
+from services.prompt_encoding import encode_for_prompt, estimate_tokens, prune
+
+_PAGE_KEYS = ("page_number", "page_no", "page_num", "page")
+_SEVERITY_RANK = {"Low": 0, "Medium": 1, "High": 2}
+
+
+def needs_map_reduce(extracted_data: Any) -> bool:
+    """True when the encoded extraction exceeds the single-prompt threshold and can be split."""
+    if not isinstance(extracted_data, list) or len(extracted_data) < 2:
+        return False
+    # sizing only: this encoding is never sent, so it stays out of prompt_encoding_stats
+    encoded = encode_for_prompt(extracted_data, token_budget=ANALYSIS_MAP_REDUCE_THRESHOLD_TOKENS * 4, record_stats=False)
+    return estimate_tokens(encoded) > ANALYSIS_MAP_REDUCE_THRESHOLD_TOKENS
+
+
+def _record_page(record: Any) -> Optional[str]:
+    """Source page of a record from its own page fields, or None without page metadata."""
+    if not isinstance(record, dict):
+        return None
+    for key, value in record.items():
+        if str(key).strip().lower().replace(" ", "_") in _PAGE_KEYS and value not in (None, ""):
+            match = re.match(r"\s*(\d+)", str(value))
+            if match:
+                return str(int(match.group(1)))
+    return None
+
+
+def _span_bounds(spans: List[str]) -> Optional[List[str]]:
+    """[first, last] page over page/span strings in document order, or None when there are none."""
+    if not spans:
+        return None
+    return [spans[0].split("-")[0], spans[-1].split("-")[-1]]
+
+
+def chunk_records(
+    records: List[Any],
+    chunk_tokens: int = ANALYSIS_CHUNK_TOKENS,
+    source_pages: Optional[List[Optional[str]]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Split records, in order, into chunks whose compact encoding stays within `chunk_tokens`.
+
+    Args:
+        source_pages: Page span per record from page-aware PDF extraction (extract.record_pages);
+            wins over page fields of the records themselves
+
+    Returns:
+        [{"records": [...], "pages": [first, last] or None, "rows": [first, last]}]; records
+        with known source pages carry a "_page" tag, "rows" are 1-based record positions
+    """
+    chunks: List[Dict[str, Any]] = []
+    current: List[Any] = []
+    pages: List[str] = []
+    start = 0
+    used = 0
+
+    def flush(end: int) -> None:
+        chunks.append({"records": current, "pages": _span_bounds(pages), "rows": [start + 1, end]})
+
+    for index, record in enumerate(records):
+        page = (source_pages[index] if source_pages and index < len(source_pages) else None) or _record_page(record)
+        tagged = dict(record) if isinstance(record, dict) else {"value": record}
+        if page is not None:
+            tagged = {"_page": page, **tagged}
+        size = estimate_tokens(json.dumps(prune(tagged), ensure_ascii=False, separators=(",", ":")))
+        if current and used + size > chunk_tokens:
+            flush(index)
+            current, pages, start, used = [], [], index, 0
+        current.append(tagged)
+        if page is not None:
+            pages.append(page)
+        used += size
+    if current:
+        flush(len(records))
+    return chunks
+
+
+def _page_span(pages: List[str]) -> str:
+    return pages[0] if pages[0] == pages[1] else f"{pages[0]}-{pages[1]}"
+
+
+def _part_label(part: Dict[str, Any]) -> str:
+    """"pages 3-7" when the part's pages are known, else its record positions ("records 1-120")."""
+    if part.get("pages"):
+        return f"pages {_page_span(part['pages'])}"
+    return f"records {_page_span([str(r) for r in part['rows']])}"
+
+
+def get_reduce_prompt(insurance_type: str, partial_analyses: List[Dict[str, Any]], record_stats: bool = True) -> str:
+    partials_text = encode_for_prompt(
+        partial_analyses, prune_fields=False, dedupe=False, fit_budget=False, record_stats=record_stats
+    )
+    return f"""You are an expert insurance underwriter. A single long document was analyzed in parts for {insurance_type.replace('_', ' ').title()} insurance; each part below covers the pages given in its "pages" field (null when the document has no page metadata) and the record positions in "rows".
+
+<partial_analyses>
+{partials_text}
+</partial_analyses>
+
+Merge the partial analyses into ONE analysis of the whole document:
+- 'overall_summary': one summary of the whole document, not a list of parts.
+- 'identified_risks', 'discrepancies', 'missing_information': merge items that describe the same issue, keeping the highest severity and the union of their 'page_references'. Keep distinct items separate. Never invent page references.
+- Drop 'missing_information' items that another part actually provides.
+- 'medical_timeline': a single chronological timeline ("N/A" if none of the parts has one).
+- 'property_assessment' and 'final_recommendation': one consolidated statement each.
+- 'confidence_score': your overall confidence (0.0 to 1.0).
+- CRITICAL: DO NOT report any discrepancies related to dates, date mismatches, future dates, or date inconsistencies.
+
+Return ONLY a single JSON object matching this schema:
+{json.dumps(ANALYSIS_OUTPUT_SCHEMA, separators=(",", ":"))}"""
+
+
+@lru_cache(maxsize=None)
+def map_reduce_prompt_version(insurance_type: str, doc_type: Optional[str] = None) -> str:
+    """Fingerprint of the chunk prompts, the reduce prompt and the chunking settings."""
+    material = json.dumps([
+        analysis_prompt_version(insurance_type, doc_type),
+        get_reduce_prompt(insurance_type, [], record_stats=False),
+        ANALYSIS_CHUNK_TOKENS,
+        ANALYSIS_REDUCE_FAN_IN
+    ])
+    return f"map_reduce-{hashlib.sha256(material.encode('utf-8')).hexdigest()[:16]}"
+
+
+def _merge_page_refs(*ref_lists: List[str]) -> List[str]:
+    refs: List[str] = []
+    for ref_list in ref_lists:
+        for ref in ref_list or []:
+            if ref not in refs and ref != "N/A":
+                refs.append(ref)
+    return refs or ["N/A"]
+
+
+def _merge_text(parts: List[Dict[str, Any]], field: str) -> str:
+    texts = []
+    for part in parts:
+        text = (part["analysis"].get(field) or "").strip()
+        if text and text.upper() != "N/A":
+            texts.append(f"**{_part_label(part).capitalize()}:** {text}" if len(parts) > 1 else text)
+    return "\n\n".join(texts) if texts else "N/A"
+
+
+def merge_partial_analyses(parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Deterministic reduce: union of list items (same description merged, page references
+    combined, highest severity kept) and page-labelled concatenation of text fields.
+
+    Args:
+        parts: [{"pages": [first, last] or None, "rows": [first, last], "analysis": {...schema-valid analysis...}}]
+    """
+    risks: Dict[str, dict] = {}
+    discrepancies: Dict[str, dict] = {}
+    missing: Dict[str, dict] = {}
+    for part in parts:
+        analysis = part["analysis"]
+        for risk in analysis.get("identified_risks", []):
+            key = risk["risk_description"].strip().lower()
+            if key in risks:
+                kept = risks[key]
+                if _SEVERITY_RANK.get(risk["severity"], 0) > _SEVERITY_RANK.get(kept["severity"], 0):
+                    kept["severity"] = risk["severity"]
+                kept["page_references"] = _merge_page_refs(kept["page_references"], risk["page_references"])
+            else:
+                risks[key] = {**risk, "page_references": _merge_page_refs(risk["page_references"])}
+        for item in analysis.get("discrepancies", []):
+            key = item["discrepancy_description"].strip().lower()
+            if key in discrepancies:
+                kept = discrepancies[key]
+                if item["details"] and item["details"] not in kept["details"]:
+                    kept["details"] = f"{kept['details']} {item['details']}".strip()
+                kept["page_references"] = _merge_page_refs(kept["page_references"], item["page_references"])
+            else:
+                discrepancies[key] = {**item, "page_references": _merge_page_refs(item["page_references"])}
+        for item in analysis.get("missing_information", []):
+            missing.setdefault(item["item_description"].strip().lower(), dict(item))
+
+    scores = [p["analysis"]["confidence_score"] for p in parts if isinstance(p["analysis"].get("confidence_score"), (int, float))]
+    merged = {
+        "overall_summary": _merge_text(parts, "overall_summary"),
+        "identified_risks": list(risks.values()),
+        "discrepancies": list(discrepancies.values()),
+        "medical_timeline": _merge_text(parts, "medical_timeline"),
+        "property_assessment": _merge_text(parts, "property_assessment"),
+        "final_recommendation": _merge_text(parts, "final_recommendation"),
+        "missing_information": list(missing.values()),
+    }
+    if scores:
+        merged["confidence_score"] = round(min(scores), 2)
+    return merged
+
+
+async def _reduce_group(insurance_type: str, group: List[Dict[str, Any]], use_cache: bool, stats: dict) -> Dict[str, Any]:
+    if len(group) == 1:
+        return group[0]
+    pages = _span_bounds([_page_span(part["pages"]) for part in group if part["pages"]])
+    rows = [group[0]["rows"][0], group[-1]["rows"][1]]
+    prompt = get_reduce_prompt(insurance_type, group)
+    result = await analyze_structured(prompt, ANALYSIS_TOOL, validate_analysis_schema, use_cache=use_cache)
+    if result["success"]:
+        stats["model_reduces"] += 1
+        return {"pages": pages, "rows": rows, "analysis": result["analysis"]}
+    stats["fallback_reduces"] += 1
+    return {"pages": pages, "rows": rows, "analysis": merge_partial_analyses(group)}
+
+
+async def map_reduce_analysis(
+    insurance_type: str,
+    extracted_data: List[Any],
+    doc_type: Optional[str] = None,
+    use_cache: bool = True,
+    source_pages: Optional[List[Optional[str]]] = None
+) -> dict:
+    """
+    Analyze an oversized extraction chunk by chunk and reduce to one schema-valid analysis.
+
+    Args:
+        source_pages: Page span per record, see chunk_records
+
+    Returns:
+        {"success": True, "analysis": {...}, "map_reduce": {...stats...}} or {"success": False, "error": str}
+    """
+    chunks = chunk_records(extracted_data, source_pages=source_pages)
+    total = len(chunks)
+
+    async def analyze_chunk(index: int, chunk: dict) -> Optional[dict]:
+        label = _part_label(chunk)
+        if chunk["pages"]:
+            pages_note = "Records carry their source page in '_page'; use those values in 'page_references', and \"N/A\" for records without one. "
+        else:
+            pages_note = "The document has no page metadata: use \"N/A\" in 'page_references'. "
+        note = (
+            f"NOTE: This is part {index + 1} of {total} of a longer document and covers {label}. "
+            f"{pages_note}"
+            f"Analyze only this part - the parts are merged afterwards."
+        )
+        # all chunks share the instruction prefix, which Bedrock can then serve from its prompt cache
+        prefix, suffix = get_individual_analysis_prompt_parts(insurance_type, chunk["records"], doc_type, part_note=note)
+        result = await analyze_structured(
+            suffix, ANALYSIS_TOOL, validate_analysis_schema, use_cache=use_cache, cacheable_prefix=prefix
+        )
+        if not result["success"]:
+            print(f"⚠️ Chunk {index + 1}/{total} ({label}) failed: {result.get('error')}")
+            return None
+        return {"pages": chunk["pages"], "rows": chunk["rows"], "analysis": result["analysis"]}
+
+    mapped = await asyncio.gather(*(analyze_chunk(i, c) for i, c in enumerate(chunks)))
+    parts = [part for part in mapped if part is not None]
+    failed_pages = [_part_label(c) for c, part in zip(chunks, mapped) if part is None]
+    if not parts:
+        return {"success": False, "error": f"All {total} chunk analyses failed"}
+
+    stats = {"chunks": total, "failed_chunks": len(failed_pages), "model_reduces": 0, "fallback_reduces": 0}
+    fan_in = max(2, ANALYSIS_REDUCE_FAN_IN)
+    while len(parts) > 1:
+        groups = [parts[i:i + fan_in] for i in range(0, len(parts), fan_in)]
+        parts = await asyncio.gather(*(_reduce_group(insurance_type, g, use_cache, stats) for g in groups))
+
+    analysis = parts[0]["analysis"]
+    if failed_pages:
+        analysis.setdefault("missing_information", []).append({
+            "item_description": f"Analysis of {', '.join(failed_pages)}",
+            "notes": "These parts of the document could not be analyzed and are not reflected in this result."
+        })
+    return {"success": True, "analysis": analysis, "map_reduce": stats}
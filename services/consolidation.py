@@ -0,0 +1,268 @@
+"""
+Tree-structured consolidation of individual document analyses.
+
+With more analyses than CONSOLIDATION_FAN_IN, analyses are grouped and each
+group is condensed concurrently into a JSON digest that keeps one row per
+document; digests are grouped again until at most CONSOLIDATION_FAN_IN remain,
+and the final six-section markdown is written from those. The number of
+sequential Bedrock calls grows with log_{fan_in}(documents) instead of the
+prompt growing linearly with the document count.
+"""
+import re
+import json
+import hashlib
+import asyncio
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+import jsonschema
+from config.settings import CONSOLIDATION_FAN_IN, BEDROCK_MODEL_ID
+from services.analyze import (
+    get_consolidated_analysis_prompt,
+    analyze_with_claude,
+    analyze_structured,
+    make_tool
+)
+from services.prompt_encoding import encode_for_prompt
+
+GROUP_DIGEST_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "documents": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "document": {"type": "string"},
+                    "primary_purpose": {"type": "string"},
+                    "key_finding": {"type": "string"},
+                    "recommendation": {"type": "string"}
+                },
+                "required": ["document", "primary_purpose", "key_finding", "recommendation"]
+            }
+        },
+        "risk_patterns": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "category": {"type": "string"},
+                    "severity": {"type": "string", "enum": ["Low", "Medium", "High"]},
+                    "documents": {"type": "array", "items": {"type": "string"}}
+                },
+                "required": ["category", "severity"]
+            }
+        },
+        "discrepancies": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "category": {"type": "string"},
+                    "details": {"type": "string"},
+                    "documents": {"type": "array", "items": {"type": "string"}}
+                },
+                "required": ["category", "details"]
+            }
+        },
+        "missing_information": {"type": "array", "items": {"type": "string"}},
+        "recommendations": {"type": "array", "items": {"type": "string"}},
+        "confidence": {"type": "number", "minimum": 0.0, "maximum": 1.0}
+    },
+    "required": ["documents", "risk_patterns", "discrepancies", "missing_information", "recommendations"]
+}
+
+GROUP_DIGEST_TOOL = make_tool(
+    "record_group_digest",
+    "Record the condensed digest of this group of documents.",
+    GROUP_DIGEST_SCHEMA
+)
+
+_SEVERITY_RANK = {"Low": 0, "Medium": 1, "High": 2}
+
+# Output limit of the final markdown consolidation call
+CONSOLIDATION_MAX_TOKENS = 8192
+
+
+def get_group_digest_prompt(insurance_type: str, items: List[Dict[str, Any]], record_stats: bool = True) -> str:
+    items_text = encode_for_prompt(items, prune_fields=False, dedupe=False, fit_budget=False, record_stats=record_stats)
+    return f"""You are a senior insurance underwriter preparing part of a portfolio review for {insurance_type.replace('_', ' ').title()} insurance.
+
+Below are analyses (or already condensed group summaries) for a subset of the documents in one application:
+<inputs>
+{items_text}
+</inputs>
+
+Condense them into ONE JSON object:
+- 'documents': exactly one row for EVERY document named in the inputs (including rows inside any 'documents' arrays), each with 'document' (the exact name), 'primary_purpose', 'key_finding' and 'recommendation' - one short sentence each.
+- 'risk_patterns': risk categories with 'severity' (Low, Medium, High) and the 'documents' they come from; merge duplicates and keep the highest severity.
+- 'discrepancies': substantive discrepancy categories with short 'details' and 'documents'. DO NOT include anything about dates, date mismatches or future dates.
+- 'missing_information': short strings, de-duplicated.
+- 'recommendations': short underwriting recommendations, de-duplicated.
+- 'confidence': overall confidence in this group (0.0 to 1.0).
+
+Return ONLY the JSON object matching this schema:
+{json.dumps(GROUP_DIGEST_SCHEMA, separators=(",", ":"))}"""
+
+
+# Bump when consolidation changes in a way its prompts do not show
+# (local digest fallback, post-processing) so recorded consolidations are rebuilt
+CONSOLIDATION_PROMPT_REVISION = 1
+
+
+@lru_cache(maxsize=None)
+def consolidation_prompt_version(insurance_type: str) -> str:
+    """Fingerprint of the model and the digest/final consolidation instructions for one insurance type."""
+    material = json.dumps([
+        CONSOLIDATION_PROMPT_REVISION,
+        BEDROCK_MODEL_ID,
+        get_group_digest_prompt(insurance_type, [], record_stats=False),
+        get_consolidated_analysis_prompt(insurance_type, [], record_stats=False),
+        get_consolidated_analysis_prompt(insurance_type, [], pre_consolidated=True, record_stats=False)
+    ])
+    return f"{CONSOLIDATION_PROMPT_REVISION}-{hashlib.sha256(material.encode('utf-8')).hexdigest()[:16]}"
+
+def _first_sentence(text: Any, limit: int = 240) -> str:
+    text = re.sub(r"[#*_`>]+", "", str(text or "")).strip()
+    if not text or text.upper() == "N/A":
+        return "N/A"
+    sentence = re.split(r"(?<=[.!?])\s+", text, maxsplit=1)[0]
+    return sentence[:limit]
+
+
+def _item_documents(item: Dict[str, Any]) -> List[str]:
+    if "documents" in item and "analysis" not in item:
+        return [row.get("document", "") for row in item.get("documents", [])]
+    return [item.get("document", "")]
+
+
+def local_group_digest(items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Deterministic digest used when a group call fails; keeps one row per document."""
+    digest = {"documents": [], "risk_patterns": [], "discrepancies": [], "missing_information": [], "recommendations": []}
+    risks: Dict[str, dict] = {}
+    confidences = []
+    for item in items:
+        if "analysis" not in item:
+            # already a digest
+            digest["documents"].extend(item.get("documents", []))
+            for risk in item.get("risk_patterns", []):
+                key = risk["category"].strip().lower()
+                kept = risks.get(key)
+                if kept is None or _SEVERITY_RANK[risk["severity"]] > _SEVERITY_RANK[kept["severity"]]:
+                    risks[key] = dict(risk)
+            digest["discrepancies"].extend(item.get("discrepancies", []))
+            digest["missing_information"].extend(item.get("missing_information", []))
+            digest["recommendations"].extend(item.get("recommendations", []))
+            if isinstance(item.get("confidence"), (int, float)):
+                confidences.append(item["confidence"])
+            continue
+
+        name = item.get("document", "")
+        analysis = item["analysis"]
+        top_risks = sorted(analysis.get("identified_risks", []), key=lambda r: -_SEVERITY_RANK.get(r.get("severity"), 0))
+        digest["documents"].append({
+            "document": name,
+            "primary_purpose": _first_sentence(analysis.get("overall_summary")),
+            "key_finding": _first_sentence(top_risks[0]["risk_description"]) if top_risks else "No material risks identified.",
+            "recommendation": _first_sentence(analysis.get("final_recommendation"))
+        })
+        for risk in top_risks:
+            key = risk["risk_description"].strip().lower()
+            kept = risks.get(key)
+            if kept is None:
+                risks[key] = {"category": risk["risk_description"], "severity": risk["severity"], "documents": [name]}
+            else:
+                if _SEVERITY_RANK.get(risk["severity"], 0) > _SEVERITY_RANK[kept["severity"]]:
+                    kept["severity"] = risk["severity"]
+                kept.setdefault("documents", []).append(name)
+        for item_d in analysis.get("discrepancies", []):
+            digest["discrepancies"].append({
+                "category": item_d["discrepancy_description"], "details": item_d.get("details", ""), "documents": [name]
+            })
+        digest["missing_information"].extend(m["item_description"] for m in analysis.get("missing_information", []))
+        recommendation = _first_sentence(analysis.get("final_recommendation"))
+        if recommendation != "N/A":
+            digest["recommendations"].append(recommendation)
+        if isinstance(analysis.get("confidence_score"), (int, float)):
+            confidences.append(analysis["confidence_score"])
+
+    digest["risk_patterns"] = list(risks.values())
+    digest["missing_information"] = list(dict.fromkeys(digest["missing_information"]))
+    digest["recommendations"] = list(dict.fromkeys(digest["recommendations"]))
+    if confidences:
+        digest["confidence"] = round(min(confidences), 2)
+    return digest
+
+
+def _validate_digest(digest: dict) -> Tuple[bool, str]:
+    try:
+        jsonschema.validate(instance=digest, schema=GROUP_DIGEST_SCHEMA)
+        return True, ""
+    except jsonschema.ValidationError as e:
+        return False, f"Schema validation failed: {e.message}"
+
+
+async def _digest_group(insurance_type: str, items: List[Dict[str, Any]], use_cache: bool, stats: dict) -> Dict[str, Any]:
+    expected = [name for item in items for name in _item_documents(item)]
+    result = await analyze_structured(
+        get_group_digest_prompt(insurance_type, items), GROUP_DIGEST_TOOL, _validate_digest, use_cache=use_cache
+    )
+    if result["success"]:
+        digest = result["analysis"]
+        # never lose a per-document row, whatever the model returned
+        present = {row["document"] for row in digest["documents"]}
+        missing = [name for name in expected if name not in present]
+        if missing:
+            fallback_rows = {row["document"]: row for row in local_group_digest(items)["documents"]}
+            digest["documents"].extend(fallback_rows[name] for name in missing if name in fallback_rows)
+        stats["group_calls"] += 1
+        return digest
+    print(f"⚠️ Group digest of {len(items)} items invalid, merging locally: {result.get('error')}")
+    stats["fallback_groups"] += 1
+    return local_group_digest(items)
+
+
+async def prepare_consolidation_prompt(
+    insurance_type: str,
+    named_analyses: List[Dict[str, Any]],
+    use_cache: bool = True,
+    fan_in: int = CONSOLIDATION_FAN_IN
+) -> Tuple[str, dict]:
+    """
+    Run the intermediate group levels and build the final markdown prompt.
+
+    Args:
+        named_analyses: [{"document": filename, "analysis": {...individual analysis...}}]
+        fan_in: Maximum inputs per consolidation call
+
+    Returns:
+        (final prompt, consolidation stats)
+    """
+    fan_in = max(2, fan_in)
+    stats = {"documents": len(named_analyses), "fan_in": fan_in, "levels": 0, "group_calls": 0, "fallback_groups": 0}
+    items: List[Dict[str, Any]] = list(named_analyses)
+    while len(items) > fan_in:
+        groups = [items[i:i + fan_in] for i in range(0, len(items), fan_in)]
+        print(f"🌳 Consolidation level {stats['levels'] + 1}: {len(items)} inputs -> {len(groups)} groups")
+        items = list(await asyncio.gather(*(_digest_group(insurance_type, g, use_cache, stats) for g in groups)))
+        stats["levels"] += 1
+
+    prompt = get_consolidated_analysis_prompt(insurance_type, items, pre_consolidated=stats["levels"] > 0)
+    return prompt, stats
+
+
+async def consolidate_analyses(
+    insurance_type: str,
+    named_analyses: List[Dict[str, Any]],
+    use_cache: bool = True,
+    fan_in: int = CONSOLIDATION_FAN_IN
+) -> dict:
+    """
+    Produce the consolidated markdown analysis, tree-style when there are many documents.
+
+    Returns:
+        analyze_with_claude result for the final call, plus "consolidation" stats
+    """
+    prompt, stats = await prepare_consolidation_prompt(insurance_type, named_analyses, use_cache, fan_in)
+    result = await analyze_with_claude(prompt, max_tokens=CONSOLIDATION_MAX_TOKENS, use_cache=use_cache)
+    result["consolidation"] = stats
+    return result
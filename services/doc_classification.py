@@ -1,246 +1,489 @@
 import os
 import json
-import shutil
+import threading
+from typing import Any, Dict, Optional
 from config.settings import OUTPUT_DIR
 
+# Identity document key variants (checked against lower-cased record keys)
+KEY_VARIANTS = {
+    "aadhaar": [
+        "aadhaar_number", "aadhaar no", "aadhaar card", "uid", "uidai", "uidai_number",
+        "aadhaarid", "aadhaarid_number", "aadhaaridno", "unique identification number", 
+        "aadhaar_ref", "aadhaar reference"
+    ],
+    "passport": [
+        "passport_number", "passport no", "passport", "passport card", "document_number", 
+        "passportid", "passportid_number", "passportidno", "passport reference", 
+        "passport code"
+    ],
+    "voter": [
+        "epic_number", "epic no", "voter_id", "voterid", "voterid_number", "voteridno",
+        "voter id no", "voter card", "voter_card", "voteridcard", "voter reference",
+        "eci number", "election commission", "epic", "epic card"
+    ],
+    "driving_licence": [
+        "dl_number", "dl_no", "driving_licence_number", "driving_license_number",
+        "licence_number", "licence_no", "drivinglicence_number", "drivinglicence_no",
+        "drivinglicence", "dlid", "dlid_number", "dlidno", "driver's license", 
+        "driver licence", "driving licence card", "driving license card"
+    ],
+    "pan": [
+        "pan_number", "pan no", "pan", "pan card", "pan id", "panid", "panid_number",
+        "panidno", "permanent_account_number", "pan ref", "pan reference"
+    ],
+}
 
-def classify_verification_documents(base_dir: str = OUTPUT_DIR, target_dir: str | None = None, submission_id: str | None = None) -> None:
+
+ID_DOC_TYPES = ["aadhaar", "passport", "voter", "driving_licence", "pan"]
+
+# Weighted scoring rules: (doc type, weight, keys of which any must carry a value).
+# The primary-identifier rule of each type is KEY_VARIANTS with weight 12.
+ID_SCORING_RULES = [
+    ("aadhaar", 12, KEY_VARIANTS["aadhaar"]),
+    ("aadhaar", 1, ["name", "name_english", "name_hindi", "full_name"]),
+    ("aadhaar", 1, ["s_o_name_english", "s_o_name_hindi", "s_o", "s/o", "father_or_husband_name", "father_name"]),
+    ("aadhaar", 1, ["address", "address_english", "address_line1_english", "address_line1"]),
+    ("aadhaar", 1, ["dob", "date_of_birth", "birth_date"]),
+    ("passport", 12, KEY_VARIANTS["passport"]),
+    ("passport", 1, ["given_names", "surname", "name"]),
+    ("passport", 1, ["place_of_issue", "place_of_birth", "address_city"]),
+    ("passport", 1, ["dob", "date_of_birth", "birth_date"]),
+    ("voter", 12, KEY_VARIANTS["voter"]),
+    ("voter", 1, ["assembly_constituency_name", "part_number", "part_name"]),
+    ("voter", 1, ["name", "name_english"]),
+    ("voter", 1, ["address", "address_english"]),
+    ("voter", 1, ["dob", "date_of_birth"]),
+    ("driving_licence", 12, KEY_VARIANTS["driving_licence"]),
+    ("driving_licence", 1, ["class_lmv_issued_on", "class_mcwg_issued_on", "issued_on_lmv", "issued_on_mcwg", "issued_on"]),
+    ("driving_licence", 1, ["issuing_authority", "issuing_authority_signature", "issuing_authority_name"]),
+    ("driving_licence", 1, ["name", "name_english", "name_hindi"]),
+    ("driving_licence", 1, ["dob", "date_of_birth", "birth_date"]),
+    ("driving_licence", 1, ["state", "issuing_state", "state_code"]),
+    ("pan", 12, KEY_VARIANTS["pan"]),
+    ("pan", 1, ["name", "name_english"]),
+    ("pan", 1, ["father_name", "father_or_husband_name"]),
+    ("pan", 1, ["dob", "date_of_birth"]),
+]
+
+# MRZ lines count for the passport primary rule by key presence alone (but are not a primary identifier)
+_MRZ_KEYS = ("mrz_line1", "mrz_line2")
+
+# document_type substrings: score bonus per type, and types whose primary counts as present
+_DOC_TYPE_TEXT_SCORE = [
+    ("passport", 2, ["passport"]),
+    ("voter", 1, ["elector", "voter", "epic"]),
+    ("driving_licence", 4, ["driving", "licence"]),
+]
+_DOC_TYPE_TEXT_PRIMARY = [
+    ("driving_licence", ["driving", "licence"]),
+    ("passport", ["passport"]),
+    ("voter", ["elector", "voter", "epic"]),
+    ("aadhaar", ["aadhaar", "uidai"]),
+    ("pan", ["pan", "income tax"]),
+]
+
+DOC_FILENAME = {doc_type: f"{doc_type}.json" for doc_type in ID_DOC_TYPES}
+
+
+class IdDocumentClassifier:
     """
-    Robustly classify JSON files in `base_dir` and move them into `verification_documents`
-    (sibling of outputs) using fixed names:
-       aadhaar.json, passport.json, voter.json, driving_licence.json, pan.json
+    Identity document classifier over a precompiled key index.
 
-    Behavior:
-    - `target_dir` defaults to sibling of OUTPUT_DIR if not provided
-    - If `submission_id` is provided, uses `outputs/{submission_id}/` as base_dir and `verification_documents/{submission_id}/` as target_dir
-    - Silent operation (no prints) and no return value
-    - Gracefully skips invalid/unsupported files
+    Each record's keys are lower-cased once; the keys carrying a value are
+    intersected with a key -> rule index, so a record costs one lookup per key
+    instead of one scan per variant list. A file takes the type with the best
+    aggregated score: accepted at >= 12 when its primary identifier is present,
+    else at >= 10.
     """
 
-    # Handle submission_id: use submission-specific directories
-    if submission_id:
-        base_dir = os.path.join(OUTPUT_DIR, submission_id)
-        if target_dir is None:
-            base_root = os.path.abspath(os.path.join(OUTPUT_DIR, os.pardir))
-            target_dir = os.path.join(base_root, "verification_documents", submission_id)
-    elif target_dir is None:
-        base_root = os.path.abspath(os.path.join(base_dir, os.pardir))
-        target_dir = os.path.join(base_root, "verification_documents")
+    def __init__(self, rules=ID_SCORING_RULES, primary_variants=KEY_VARIANTS):
+        self.rules = [(doc_type, weight) for doc_type, weight, _ in rules]
+        self.rule_index = {}
+        for rule_id, (_, _, keys) in enumerate(rules):
+            for key in keys:
+                self.rule_index.setdefault(key, []).append(rule_id)
+        self.mrz_rule = next(i for i, (_, _, keys) in enumerate(rules) if keys is primary_variants["passport"])
+        self.primary_index = {}
+        for doc_type, variants in primary_variants.items():
+            for key in variants:
+                self.primary_index.setdefault(key, set()).add(doc_type)
 
-    os.makedirs(target_dir, exist_ok=True)
+    @staticmethod
+    def _normalize(record: dict) -> dict:
+        # Later keys win on case collisions, as in a plain lower-casing dict comprehension
+        return {str(k).lower(): v for k, v in record.items()}
+
+    def _evaluate(self, rn: dict):
+        """(scores, primary types present) of one record with lower-cased keys."""
+        present = [k for k, v in rn.items() if v not in (None, "", [])]
+        fired = set()
+        primaries = set()
+        for key in present:
+            rule_ids = self.rule_index.get(key)
+            if rule_ids:
+                fired.update(rule_ids)
+                primaries.update(self.primary_index.get(key, ()))
+        if any(k in rn for k in _MRZ_KEYS):
+            fired.add(self.mrz_rule)
+
+        scores = dict.fromkeys(ID_DOC_TYPES, 0)
+        for rule_id in fired:
+            doc_type, weight = self.rules[rule_id]
+            scores[doc_type] += weight
+
+        doc_type_text = (rn.get("document_type") or "").lower()
+        if doc_type_text:
+            for doc_type, weight, needles in _DOC_TYPE_TEXT_SCORE:
+                if any(n in doc_type_text for n in needles):
+                    scores[doc_type] += weight
+            for doc_type, needles in _DOC_TYPE_TEXT_PRIMARY:
+                if any(n in doc_type_text for n in needles):
+                    primaries.add(doc_type)
+        if "passport" not in doc_type_text and "p<" in (rn.get("mrz_line1") or "").lower():
+            scores["passport"] += 2
+        return scores, primaries
 
-    DOC_FILENAME = {
-        "aadhaar": "aadhaar.json",
-        "passport": "passport.json",
-        "voter": "voter.json",
-        "driving_licence": "driving_licence.json",
-        "pan": "pan.json",
-    }
-
-    # Helper: flatten list/dict -> list of dict records
-    def as_record_list(data):
-        if isinstance(data, list):
-            return [d for d in data if isinstance(d, dict)]
-        if isinstance(data, dict):
-            return [data]
-        return []
-
-    # Lower-case keys map
-    def lower_keys(d):
-        return {str(k).lower(): v for k, v in d.items()}
-
-    KEY_VARIANTS = {
-        "aadhaar": [
-            "aadhaar_number", "aadhaar no", "aadhaar card", "uid", "uidai", "uidai_number",
-            "aadhaarid", "aadhaarid_number", "aadhaaridno", "unique identification number", 
-            "aadhaar_ref", "aadhaar reference"
-        ],
-        "passport": [
-            "passport_number", "passport no", "passport", "passport card", "document_number", 
-            "passportid", "passportid_number", "passportidno", "passport reference", 
-            "passport code"
-        ],
-        "voter": [
-            "epic_number", "epic no", "voter_id", "voterid", "voterid_number", "voteridno",
-            "voter id no", "voter card", "voter_card", "voteridcard", "voter reference",
-            "eci number", "election commission", "epic", "epic card"
-        ],
-        "driving_licence": [
-            "dl_number", "dl_no", "driving_licence_number", "driving_license_number",
-            "licence_number", "licence_no", "drivinglicence_number", "drivinglicence_no",
-            "drivinglicence", "dlid", "dlid_number", "dlidno", "driver's license", 
-            "driver licence", "driving licence card", "driving license card"
-        ],
-        "pan": [
-            "pan_number", "pan no", "pan", "pan card", "pan id", "panid", "panid_number",
-            "panidno", "permanent_account_number", "pan ref", "pan reference"
-        ],
-    }
-
-
-    # Scoring function that includes many key variants and document_type text matches
-    def score_record(rec):
-        s = {"aadhaar": 0, "passport": 0, "voter": 0, "driving_licence": 0, "pan": 0}
-
-        # convenience checks
-        def has_any(keys):
-            for k in keys:
-                if rec.get(k) not in (None, "", []):
-                    return True
-            return False
-
-        # document_type textual hints
-        doc_type_text = (rec.get("document_type") or "").lower()
-
-        # Aadhaar scoring
-        if has_any(KEY_VARIANTS["aadhaar"]):
-            s["aadhaar"] += 12
-        if has_any(["name", "name_english", "name_hindi", "full_name"]):
-            s["aadhaar"] += 1
-        if has_any(["s_o_name_english", "s_o_name_hindi", "s_o", "s/o", "father_or_husband_name", "father_name"]):
-            s["aadhaar"] += 1
-        if has_any(["address", "address_english", "address_line1_english", "address_line1"]):
-            s["aadhaar"] += 1
-        if has_any(["dob", "date_of_birth", "birth_date"]):
-            s["aadhaar"] += 1
-
-        # Passport scoring
-        if has_any(KEY_VARIANTS["passport"]) or "mrz_line1" in rec or "mrz_line2" in rec:
-            s["passport"] += 12
-        if has_any(["given_names", "surname", "name"]):
-            s["passport"] += 1
-        if has_any(["place_of_issue", "place_of_birth", "address_city"]):
-            s["passport"] += 1
-        if has_any(["dob", "date_of_birth", "birth_date"]):
-            s["passport"] += 1
-        if "passport" in doc_type_text or "p<" in (rec.get("mrz_line1") or "").lower():
-            s["passport"] += 2
-
-        # Voter scoring
-        if has_any(KEY_VARIANTS["voter"]):
-            s["voter"] += 12
-        if has_any(["assembly_constituency_name", "part_number", "part_name"]):
-            s["voter"] += 1
-        if has_any(["name", "name_english"]):
-            s["voter"] += 1
-        if has_any(["address", "address_english"]):
-            s["voter"] += 1
-        if has_any(["dob", "date_of_birth"]):
-            s["voter"] += 1
-        if "elector" in doc_type_text or "voter" in doc_type_text or "epic" in doc_type_text:
-            s["voter"] += 1
-
-        # Driving licence scoring - expanded key variants and document_type match
-        if has_any(KEY_VARIANTS["driving_licence"]):
-            s["driving_licence"] += 12
-        if "driving" in doc_type_text or "licence" in doc_type_text or "driving licence" in doc_type_text:
-            s["driving_licence"] += 4
-        if has_any(["class_lmv_issued_on", "class_mcwg_issued_on", "issued_on_lmv", "issued_on_mcwg", "issued_on"]):
-            s["driving_licence"] += 1
-        if has_any(["issuing_authority", "issuing_authority_signature", "issuing_authority_name"]):
-            s["driving_licence"] += 1
-        if has_any(["name", "name_english", "name_hindi"]):
-            s["driving_licence"] += 1
-        if has_any(["dob", "date_of_birth", "birth_date"]):
-            s["driving_licence"] += 1
-        if has_any(["state", "issuing_state", "state_code"]):
-            s["driving_licence"] += 1
-
-        # PAN scoring
-        if has_any(KEY_VARIANTS["pan"]):
-            s["pan"] += 12
-        if has_any(["name", "name_english"]):
-            s["pan"] += 1
-        if has_any(["father_name", "father_or_husband_name"]):
-            s["pan"] += 1
-        if has_any(["dob", "date_of_birth"]):
-            s["pan"] += 1
-
-        return s
-
-    # Decide file classification using aggregated scores across all records
-    def classify_file(records):
-        agg = {"aadhaar": 0, "passport": 0, "voter": 0, "driving_licence": 0, "pan": 0}
-        primaries_present = {k: False for k in agg}
+    def score_record(self, record: dict) -> dict:
+        """Doc type -> score for one extracted record."""
+        return self._evaluate(self._normalize(record))[0]
 
+    def score_records(self, records: list) -> list:
+        """Doc type -> score for each of many records, in order; non-dict entries score 0."""
+        empty = dict.fromkeys(ID_DOC_TYPES, 0)
+        return [self._evaluate(self._normalize(r))[0] if isinstance(r, dict) else dict(empty) for r in records]
+
+    def primary_types(self, record: dict) -> set:
+        """ID types whose primary identifier (see KEY_VARIANTS) carries a value in the record."""
+        types = set()
+        for k, v in self._normalize(record).items():
+            if v not in (None, "", []):
+                types.update(self.primary_index.get(k, ()))
+        return types
+
+    def classify(self, records: list):
+        """
+        Classify one file from all of its records.
+
+        Returns:
+            One of ID_DOC_TYPES, or None when no type scores high enough
+        """
+        agg = dict.fromkeys(ID_DOC_TYPES, 0)
+        primaries_present = set()
         for r in records:
             if not isinstance(r, dict):
                 continue
-            rn = lower_keys(r)
-            sc = score_record(rn)
-            for k in agg:
-                agg[k] += sc[k]
-
-            # primaries presence checks (use key variants + doc_type text)
-            for k, variants in KEY_VARIANTS.items():
-                if any(rn.get(v) not in (None, "", []) for v in variants):
-                    primaries_present[k] = True
-
-            # document_type textual hints
-            dt = (rn.get("document_type") or "").lower()
-            if "driving" in dt or "licence" in dt:
-                primaries_present["driving_licence"] = True
-            if "passport" in dt:
-                primaries_present["passport"] = True
-            if "elector" in dt or "voter" in dt or "epic" in dt:
-                primaries_present["voter"] = True
-            if "aadhaar" in dt or "uidai" in dt:
-                primaries_present["aadhaar"] = True
-            if "pan" in dt or "income tax" in dt:
-                primaries_present["pan"] = True
-
-        # choose best type by aggregated score
-        best_type, best_score = max(agg.items(), key=lambda it: it[1])
+            scores, primaries = self._evaluate(self._normalize(r))
+            for doc_type, score in scores.items():
+                agg[doc_type] += score
+            primaries_present |= primaries
 
-        # Conservative thresholds:
-        # - If primary identifier present and agg score >= 12 -> accept
-        # - Else if agg score >= 10 -> accept
-        # - Otherwise reject (None)
-        if primaries_present.get(best_type) and best_score >= 12:
+        best_type, best_score = max(agg.items(), key=lambda it: it[1])
+        if best_type in primaries_present and best_score >= 12:
             return best_type
         if best_score >= 10:
             return best_type
         return None
 
-    # Check if base_dir exists
-    if not os.path.exists(base_dir):
-        return
-    
-    # iterate files silently
-    for file_name in os.listdir(base_dir):
-        if not file_name.lower().endswith(".json"):
-            continue
+    def classify_many(self, files: list) -> list:
+        """classify() for each file's record list, in order."""
+        return [self.classify(records) for records in files]
 
-        in_path = os.path.join(base_dir, file_name)
-        try:
-            with open(in_path, "r", encoding="utf-8") as fh:
-                data = json.load(fh)
-        except Exception:
-            # invalid JSON -> skip
-            continue
 
-        records = as_record_list(data)
-        if not records:
-            continue
+id_document_classifier = IdDocumentClassifier()
 
-        doc_type = classify_file(records)
-        if not doc_type:
-            continue
 
-        target_fname = DOC_FILENAME.get(doc_type)
-        if not target_fname:
-            continue
+def as_record_list(data) -> list:
+    """Flatten extracted flat-json (list or dict) into its dict records."""
+    if isinstance(data, list):
+        return [d for d in data if isinstance(d, dict)]
+    if isinstance(data, dict):
+        return [data]
+    return []
+
+
+def classify_extraction(data) -> Optional[str]:
+    """Identity document type of one extracted file's flat-json, or None."""
+    records = as_record_list(data)
+    return id_document_classifier.classify(records) if records else None
+
+
+class ClassificationIndex:
+    """
+    Identity classification of extraction outputs, kept per output directory.
+
+    save_extraction_output reports every file as it is written (observe), so by
+    the time /get_kyc runs most files are already classified. snapshot() only
+    parses files that were not observed or changed since (e.g. after a restart),
+    each once, and drops files that were removed. Only (signature, doc_type) is
+    kept per file; the few identity documents are re-read when a snapshot is taken.
+    """
+
+    def __init__(self):
+        self._dirs: Dict[str, Dict[str, tuple]] = {}
+        self._lock = threading.Lock()
+        self._counters = {"observed": 0, "parsed_on_demand": 0, "reused": 0}
 
-        dest_path = os.path.join(target_dir, target_fname)
+    @staticmethod
+    def _signature(path: str) -> Optional[tuple]:
         try:
-            # remove existing target if possible (overwrite behavior)
-            if os.path.exists(dest_path):
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def observe(self, path: str, data: Any) -> Optional[str]:
+        """
+        Classify an extraction output that was just written to `path`.
+
+        Args:
+            data: Its flat-json content, or None for outputs that cannot be identity documents
+
+        Returns:
+            The identity document type, or None
+        """
+        doc_type = classify_extraction(data) if data is not None else None
+        entry = (self._signature(path), doc_type)
+        with self._lock:
+            self._dirs.setdefault(os.path.dirname(os.path.abspath(path)), {})[os.path.basename(path)] = entry
+            self._counters["observed"] += 1
+        return doc_type
+
+    def snapshot(self, base_dir: str) -> Dict[str, dict]:
+        """
+        Identity documents currently in `base_dir`.
+
+        Returns:
+            Doc type -> {"file": file name, "data": parsed content}; when several files
+            classify as one type, the last file name in sorted order wins
+        """
+        base_dir = os.path.abspath(base_dir)
+        if not os.path.isdir(base_dir):
+            return {}
+        names = sorted(
+            n for n in os.listdir(base_dir) if n.lower().endswith(".json") and not n.startswith(".")
+        )
+        with self._lock:
+            known = dict(self._dirs.get(base_dir, {}))
+
+        entries = {}
+        loaded = {}
+        reused = parsed = 0
+        for name in names:
+            path = os.path.join(base_dir, name)
+            signature = self._signature(path)
+            entry = known.get(name)
+            if entry is not None and entry[0] == signature:
+                reused += 1
+            else:
+                try:
+                    with open(path, "r", encoding="utf-8") as fh:
+                        data = json.load(fh)
+                except Exception:
+                    # invalid JSON -> skip
+                    data = None
+                doc_type = classify_extraction(data) if data is not None else None
+                entry = (signature, doc_type)
+                if doc_type:
+                    # names are sorted, so only the latest file per type is held
+                    loaded[doc_type] = (name, data)
+                parsed += 1
+            entries[name] = entry
+        with self._lock:
+            self._dirs[base_dir] = entries
+            self._counters["reused"] += reused
+            self._counters["parsed_on_demand"] += parsed
+
+        chosen = {}
+        for name, (_, doc_type) in entries.items():
+            if doc_type:
+                chosen[doc_type] = name
+        documents = {}
+        for doc_type, name in chosen.items():
+            loaded_name, data = loaded.get(doc_type, (None, None))
+            if loaded_name != name:
                 try:
-                    os.remove(dest_path)
+                    with open(os.path.join(base_dir, name), "r", encoding="utf-8") as fh:
+                        data = json.load(fh)
                 except Exception:
-                    # cannot remove existing target: skip to avoid clobber
+                    # removed or rewritten since it was classified -> skip
                     continue
-            shutil.move(in_path, dest_path)
+            documents[doc_type] = {"file": name, "data": data}
+        return documents
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._counters, "directories": len(self._dirs)}
+
+
+# Global classification index, fed by save_extraction_output
+classification_index = ClassificationIndex()
+
+
+def verification_dir_for(submission_id: str | None = None, base_dir: str = OUTPUT_DIR) -> str:
+    """verification_documents/{submission_id}/ next to OUTPUT_DIR, or verification_documents/ next to `base_dir`."""
+    if submission_id:
+        base_root = os.path.abspath(os.path.join(OUTPUT_DIR, os.pardir))
+        return os.path.join(base_root, "verification_documents", submission_id)
+    base_root = os.path.abspath(os.path.join(base_dir, os.pardir))
+    return os.path.join(base_root, "verification_documents")
+
+
+def write_verification_documents(documents: Dict[str, dict], target_dir: str) -> None:
+    """Write each classified document to `target_dir` under its fixed name (overwriting)."""
+    os.makedirs(target_dir, exist_ok=True)
+    for doc_type, document in documents.items():
+        dest_path = os.path.join(target_dir, DOC_FILENAME[doc_type])
+        try:
+            with open(dest_path, "w", encoding="utf-8") as fh:
+                json.dump(document["data"], fh, ensure_ascii=False, indent=2)
         except Exception:
-            # skip any move errors silently
+            # skip any write errors silently
             continue
+
+
+def classify_verification_documents(base_dir: str = OUTPUT_DIR, target_dir: str | None = None, submission_id: str | None = None) -> Dict[str, dict]:
+    """
+    Classify JSON files in `base_dir` and copy the identity documents into
+    `verification_documents` (sibling of outputs) using fixed names:
+       aadhaar.json, passport.json, voter.json, driving_licence.json, pan.json
+
+    The originals stay in `base_dir`, so /analysis and /chat still see them.
+
+    Behavior:
+    - `target_dir` defaults to sibling of OUTPUT_DIR if not provided
+    - If `submission_id` is provided, uses `outputs/{submission_id}/` as base_dir and `verification_documents/{submission_id}/` as target_dir
+    - Silent operation (no prints)
+    - Gracefully skips invalid/unsupported files
+
+    Returns:
+        Doc type -> {"file", "data"} of the documents written (see ClassificationIndex.snapshot)
+    """
+    if submission_id:
+        base_dir = os.path.join(OUTPUT_DIR, submission_id)
+    if target_dir is None:
+        target_dir = verification_dir_for(submission_id, base_dir)
+
+    documents = classification_index.snapshot(base_dir)
+    write_verification_documents(documents, target_dir)
+    return documents
+
+
+# --- Analysis document types ---
+# Cheap pre-classification of an extracted document so the analysis prompt only
+# carries the instruction blocks that apply to it. Same weighted-signal scoring
+# as the identity classifier above, but over key *substrings* (Nanonets key names
+# vary: "gross_earnings", "Bio. Ref. Interval", ...) plus title/type text hints.
+
+ANALYSIS_DOC_TYPES = ["salary_slip", "invoice", "lab_report", "acord_form", "proposal_form", "bank_statement", "id_document"]
+
+# Returned when no type scores at least ANALYSIS_MIN_SCORE
+GENERAL_DOC_TYPE = "general"
+ANALYSIS_MIN_SCORE = 6
+
+ANALYSIS_KEY_SIGNALS = {
+    "salary_slip": [
+        ("salary", 4), ("gross_earnings", 6), ("net_pay", 6), ("net_salary", 6), ("take_home", 4),
+        ("basic_pay", 4), ("basic_salary", 4), ("hra", 2), ("deduction", 2), ("earnings", 2),
+        ("employee_name", 3), ("employee_no", 2), ("employee_id", 2), ("pf_no", 2), ("uan", 2),
+        ("designation", 1), ("days_worked", 2), ("pay_period", 3)
+    ],
+    "invoice": [
+        ("invoice", 8), ("bill_no", 4), ("bill_number", 4), ("gstin", 3), ("hsn", 3), ("vendor", 2),
+        ("supplier", 2), ("subtotal", 2), ("sub_total", 2), ("tax_amount", 2), ("amount_due", 3),
+        ("total_amount", 2), ("unit_price", 2), ("quantity", 1), ("qty", 1), ("payment_terms", 3)
+    ],
+    "lab_report": [
+        ("hemoglobin", 4), ("bio_ref", 4), ("reference_range", 4), ("test_name", 3), ("sample_type", 3),
+        ("patient_id", 3), ("lab_visit", 3), ("collection_date", 2), ("date_of_collection", 2),
+        ("platelet", 2), ("glucose", 2), ("cholesterol", 2), ("creatinine", 2), ("hba1c", 2), ("lymphocytes", 2)
+    ],
+    "acord_form": [
+        ("acord", 10), ("named_insured", 4), ("naic", 4), ("producer", 3), ("prior_carrier", 3),
+        ("protection_class", 3), ("loss_history", 3), ("carrier", 2), ("agency", 2), ("occupancy", 2),
+        ("construction_type", 2), ("year_built", 2), ("sprinkler", 2), ("building", 1), ("effective_date", 1)
+    ],
+    "proposal_form": [
+        ("proposer", 4), ("proposal", 4), ("life_assured", 4), ("sum_assured", 3), ("sum_insured", 3),
+        ("nominee", 3), ("family_history", 2), ("medical_history", 2), ("primary_insured", 2),
+        ("occupation", 1), ("annual_income", 1)
+    ],
+    "bank_statement": [
+        ("opening_balance", 4), ("closing_balance", 4), ("narration", 3), ("value_date", 3),
+        ("account_holder", 3), ("withdrawal", 3), ("deposit", 2), ("transaction", 2), ("ifsc", 2),
+        ("cheque", 2), ("chq", 2), ("od_limit", 2), ("balance", 1)
+    ],
+}
+
+# Substrings looked for in title-like values (document_type, report_type, ...)
+ANALYSIS_TEXT_SIGNALS = {
+    "salary_slip": ["salary", "pay slip", "payslip", "pay stub", "payroll"],
+    "invoice": ["invoice", "bill of supply", "receipt"],
+    "lab_report": ["lab report", "laboratory", "pathology", "health report", "test report"],
+    "acord_form": ["acord", "commercial insurance application", "loss run"],
+    "proposal_form": ["proposal form", "application form"],
+    "bank_statement": ["statement of account", "account statement", "bank statement"],
+}
+_TITLE_KEYS = ("document_type", "document_title", "report_type", "form_title", "proposal_form_title", "title")
+_TEXT_SIGNAL_WEIGHT = 6
+# Larger documents are classified from their first records
+_MAX_RECORDS_SCANNED = 50
+
+
+def _normalize_key(key) -> str:
+    return "_".join("".join(c if c.isalnum() else " " for c in str(key).lower()).split())
+
+
+def _id_document_score(records: list) -> int:
+    """Best identity-document score, 12 per record carrying a primary ID number (see KEY_VARIANTS)."""
+    counts = dict.fromkeys(KEY_VARIANTS, 0)
+    for rec in records:
+        for doc_type in id_document_classifier.primary_types(rec):
+            counts[doc_type] += 1
+    return 12 * max(counts.values())
+
+
+def score_analysis_document(data) -> dict:
+    """
+    Score an extracted document against every analysis document type.
+
+    Args:
+        data: Extracted flat-json (list of records or a single dict)
+
+    Returns:
+        Document type -> score
+    """
+    if isinstance(data, dict):
+        records = [data]
+    elif isinstance(data, list):
+        records = [d for d in data if isinstance(d, dict)]
+    else:
+        records = []
+    records = records[:_MAX_RECORDS_SCANNED]
+
+    keys_blob = "|".join({_normalize_key(k) for rec in records for k in rec})
+    titles = " ".join(
+        str(rec.get(k)).lower() for rec in records for k in _TITLE_KEYS if isinstance(rec.get(k), str)
+    )
+
+    scores = {}
+    for doc_type, signals in ANALYSIS_KEY_SIGNALS.items():
+        score = sum(weight for needle, weight in signals if needle in keys_blob)
+        if any(hint in titles for hint in ANALYSIS_TEXT_SIGNALS.get(doc_type, [])):
+            score += _TEXT_SIGNAL_WEIGHT
+        scores[doc_type] = score
+    scores["id_document"] = _id_document_score(records)
+    return scores
+
+
+def detect_document_type(data) -> str:
+    """
+    Pre-classify an extracted document for analysis prompt assembly.
+
+    Returns:
+        One of ANALYSIS_DOC_TYPES, or GENERAL_DOC_TYPE when nothing scores high enough
+    """
+    scores = score_analysis_document(data)
+    best_type, best_score = max(scores.items(), key=lambda it: it[1])
+    if best_score < ANALYSIS_MIN_SCORE:
+        return GENERAL_DOC_TYPE
+    return best_type
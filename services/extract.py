@@ -1,36 +1,322 @@
-import requests
 import json
 import os
-import time
+import asyncio
 import tempfile
 import shutil
 from typing import List, Optional
+import httpx
 from fastapi import UploadFile
-import asyncio
-from concurrent.futures import ThreadPoolExecutor
-from config.settings import OUTPUT_DIR
-
-def poll_until_ready(record_id: str, api_key: str, max_wait: int = 120, interval: int = 10):
-    url = f"https://extraction-api.nanonets.com/files/{record_id}"
-    headers = {"Authorization": f"Bearer {api_key}"}
-    start_time = time.time()
-    while True:
-        response = requests.get(url, headers=headers, timeout=60)
-        data = response.json()
-        content = data.get("content", "")
-        if content and not data.get("processing_status") == "processing":
-            try:
-                return json.loads(content)
-            except Exception:
-                return content
-        if time.time() - start_time > max_wait:
-            raise TimeoutError(f"Polling timed out after {max_wait} seconds for record_id {record_id}")
-        time.sleep(interval)
-
-def extract_file_to_json_sync(file_path: str, api_key: str, submission_id: Optional[str] = None, upload_to_s3: bool = True) -> dict:
+from config.settings import (
+    OUTPUT_DIR,
+    PDF_SPLIT_ENABLED,
+    PDF_SPLIT_PAGE_THRESHOLD,
+    PDF_SPLIT_CHUNK_PAGES,
+    PDF_TEXT_FAST_PATH_ENABLED,
+    PDF_TEXT_MIN_CHARS,
+    TABULAR_INLINE_MAX_ROWS
+)
+from utils.worker_pool import extraction_pool
+from services.nanonets import nanonets_client
+
+def _read_bytes(file_path: str) -> bytes:
+    with open(file_path, "rb") as fh:
+        return fh.read()
+
+def _as_record_list(content) -> list:
+    if isinstance(content, list):
+        return content
+    if content in (None, "", {}):
+        return []
+    return [content]
+
+def _plan_pdf_segments(pages: List[dict]) -> List[tuple]:
+    """
+    Route each page of a PDF and group them into extraction segments in page order.
+
+    Pages with a usable text layer become single-page "local" segments. Consecutive
+    pages that need OCR are grouped into "ocr" segments, cut into PDF_SPLIT_CHUNK_PAGES
+    ranges when a run exceeds the split threshold.
+    """
+    from services.pdf_pages import has_usable_text
+
+    segments = []
+    run: List[int] = []
+
+    def flush_run():
+        if not run:
+            return
+        if PDF_SPLIT_ENABLED and len(run) > PDF_SPLIT_PAGE_THRESHOLD:
+            for i in range(0, len(run), PDF_SPLIT_CHUNK_PAGES):
+                segments.append(("ocr", run[i:i + PDF_SPLIT_CHUNK_PAGES]))
+        else:
+            segments.append(("ocr", list(run)))
+        run.clear()
+
+    for index, page in enumerate(pages):
+        if PDF_TEXT_FAST_PATH_ENABLED and has_usable_text(page, PDF_TEXT_MIN_CHARS):
+            flush_run()
+            segments.append(("local", [index]))
+        else:
+            run.append(index)
+    flush_run()
+    return segments
+
+async def _extract_pdf(file_path: str, api_key: str) -> tuple:
+    """
+    Extract a PDF page-aware: text-layer pages locally, the rest via Nanonets.
+
+    OCR segments are extracted concurrently and everything is reassembled in page order.
+
+    The records themselves are left exactly as extracted; their source pages are
+    returned alongside as page ranges (see page_ranges).
+
+    Returns:
+        (content, routing, ranges). content is None when the file should simply be uploaded
+        whole (scanned PDF under the split threshold); routing lists local vs OCR pages.
+    """
+    from services.pdf_pages import read_text_pages, page_to_record, write_page_groups
+
+    if not file_path.lower().endswith(".pdf"):
+        return None, None, None
+    try:
+        pages = await extraction_pool.run(read_text_pages, file_path)
+    except Exception:
+        # unreadable/encrypted for pypdf: let Nanonets handle the whole file
+        return None, None, None
+
+    segments = _plan_pdf_segments(pages)
+    local_pages = [p + 1 for kind, group in segments if kind == "local" for p in group]
+    ocr_pages = [p + 1 for kind, group in segments if kind == "ocr" for p in group]
+    routing = {
+        "mode": "text" if not ocr_pages else ("ocr" if not local_pages else "mixed"),
+        "total_pages": len(pages),
+        "local_pages": local_pages,
+        "ocr_pages": ocr_pages
+    }
+    _record_pdf_routing(routing)
+    if routing["mode"] == "ocr" and len(segments) == 1:
+        return None, routing, None
+
+    ocr_groups = [group for kind, group in segments if kind == "ocr"]
+    ocr_parts = []
+    if ocr_groups:
+        chunk_dir = tempfile.mkdtemp(prefix="pdf_split_")
+        try:
+            chunk_paths = await extraction_pool.run(write_page_groups, file_path, ocr_groups, chunk_dir)
+
+            async def extract_chunk(chunk_path: str):
+                chunk_bytes = await extraction_pool.run(_read_bytes, chunk_path)
+                return await nanonets_client.extract(os.path.basename(chunk_path), chunk_bytes, api_key)
+
+            ocr_parts = await asyncio.gather(*(extract_chunk(path) for path in chunk_paths))
+        finally:
+            shutil.rmtree(chunk_dir, ignore_errors=True)
+
+    content = []
+    record_pages = []
+    ocr_results = iter(ocr_parts)
+    for kind, group in segments:
+        if kind == "local":
+            records = [page_to_record(group[0] + 1, pages[group[0]])]
+        else:
+            records = _as_record_list(next(ocr_results))
+        content.extend(records)
+        record_pages.extend(_source_pages(records, group))
+    return content, routing, page_ranges(record_pages)
+
+_PAGE_KEYS = ("page_number", "page_no", "page_num", "page")
+
+def _source_pages(records: list, group: List[int]) -> List[str]:
+    """
+    The 1-based source page(s) of each record of one segment, e.g. "4" or "3-7".
+
+    A page number the record already carries is relative to the segment's PDF and is
+    mapped back to the source page; otherwise the record gets the segment's page span.
+    """
+    span = f"{group[0] + 1}-{group[-1] + 1}" if len(group) > 1 else str(group[0] + 1)
+    pages = []
+    for record in records:
+        page = span
+        if isinstance(record, dict) and len(group) > 1:
+            for key, value in record.items():
+                if str(key).strip().lower().replace(" ", "_") in _PAGE_KEYS and str(value).strip().isdigit():
+                    if 1 <= int(value) <= len(group):
+                        page = str(group[int(value) - 1] + 1)
+                    break
+        pages.append(page)
+    return pages
+
+def page_ranges(record_pages: List[Optional[str]]) -> Optional[List[dict]]:
+    """Record index spans [start, end) per source page span; None when no page is known."""
+    ranges: List[dict] = []
+    for index, pages in enumerate(record_pages):
+        if pages is None:
+            continue
+        if ranges and ranges[-1]["pages"] == pages and ranges[-1]["records"][1] == index:
+            ranges[-1]["records"][1] = index + 1
+        else:
+            ranges.append({"pages": pages, "records": [index, index + 1]})
+    return ranges or None
+
+def record_pages(ranges: Optional[List[dict]], count: int) -> List[Optional[str]]:
+    """Source page span of each of `count` records from page_ranges output (None where unknown)."""
+    pages: List[Optional[str]] = [None] * count
+    for entry in ranges or []:
+        start, end = entry["records"]
+        for index in range(max(0, start), min(end, count)):
+            pages[index] = entry["pages"]
+    return pages
+
+def page_ranges_path(json_path: str) -> str:
+    """Sidecar of an extraction output holding its page ranges; the leading dot keeps it out of *.json globs."""
+    base_name = os.path.splitext(os.path.basename(json_path))[0]
+    return os.path.join(os.path.dirname(json_path), f".{base_name}.pages.json")
+
+def load_page_ranges(json_path: str) -> Optional[List[dict]]:
+    """Page ranges stored next to an extraction output, or None (also when they belong to an older output)."""
+    from services.extraction_cache import hash_file
+
+    try:
+        with open(page_ranges_path(json_path), "r", encoding="utf-8") as fh:
+            stored = json.load(fh)
+        if stored.get("output_sha256") != hash_file(json_path):
+            return None
+    except (OSError, json.JSONDecodeError, AttributeError):
+        return None
+    ranges = stored.get("page_ranges")
+    return ranges if isinstance(ranges, list) else None
+
+# A cache entry of a page-aware PDF keeps its page ranges next to the unchanged flat-json
+_PAGED_ENTRY_KEYS = {"flat_json", "page_ranges"}
+
+def _cache_entry(content, ranges: Optional[List[dict]]):
+    return {"flat_json": content, "page_ranges": ranges} if ranges else content
+
+def _from_cache_entry(entry) -> tuple:
+    if isinstance(entry, dict) and set(entry) == _PAGED_ENTRY_KEYS:
+        return entry["flat_json"], entry["page_ranges"]
+    return entry, None
+
+# Running totals of PDF page routing, served from /metrics
+pdf_routing_stats = {"pdfs": 0, "pdfs_fully_local": 0, "local_pages": 0, "ocr_pages": 0}
+
+def _record_pdf_routing(routing: dict) -> None:
+    pdf_routing_stats["pdfs"] += 1
+    pdf_routing_stats["local_pages"] += len(routing["local_pages"])
+    pdf_routing_stats["ocr_pages"] += len(routing["ocr_pages"])
+    if routing["mode"] == "text":
+        pdf_routing_stats["pdfs_fully_local"] += 1
+
+def _output_json_path(file_path: str, submission_id: Optional[str] = None) -> str:
+    base_name = os.path.splitext(os.path.basename(file_path))[0]
+
+    # Save locally first (for backward compatibility)
+    local_output_dir = OUTPUT_DIR
+    if submission_id:
+        local_output_dir = os.path.join(OUTPUT_DIR, submission_id)
+        os.makedirs(local_output_dir, exist_ok=True)
+
+    return os.path.join(local_output_dir, f"{base_name}.json")
+
+def _upload_output(
+    result: dict,
+    local_json_path: str,
+    submission_id: Optional[str] = None,
+    upload_to_s3: bool = True,
+    with_pages: bool = False
+) -> dict:
+    from utils.s3_service import s3_service
+
+    # Upload to S3 if requested
+    if upload_to_s3 and submission_id:
+        s3_key = f"lnh-submissions/{submission_id}/outputs/{os.path.basename(local_json_path)}"
+        s3_url = s3_service.upload_file(local_json_path, s3_key, content_type="application/json")
+        result["s3_url"] = s3_url
+        result["s3_key"] = s3_key
+        if with_pages:
+            pages_path = page_ranges_path(local_json_path)
+            s3_service.upload_file(
+                pages_path, f"lnh-submissions/{submission_id}/outputs/{os.path.basename(pages_path)}",
+                content_type="application/json"
+            )
+    return result
+
+def save_extraction_output(
+    content_json,
+    file_path: str,
+    submission_id: Optional[str] = None,
+    upload_to_s3: bool = True,
+    ranges: Optional[List[dict]] = None
+) -> dict:
+    """
+    Persist extracted content to outputs/ (and S3) and build the per-file result dict.
+
+    Args:
+        content_json: Extracted flat-json content
+        file_path: Path of the source file the content was extracted from
+        submission_id: Optional submission ID for local and S3 path organization
+        upload_to_s3: Whether to upload to S3 after saving locally
+        ranges: Page ranges of a page-aware PDF, saved in the page_ranges_path sidecar
+
+    Returns:
+        Dictionary with success status, content, filename, local path and S3 URL
+    """
+    from services.doc_classification import classification_index
+
+    local_json_path = _output_json_path(file_path, submission_id)
+    with open(local_json_path, "w", encoding="utf-8") as f:
+        json.dump(content_json, f, ensure_ascii=False, indent=2)
+    pages_path = page_ranges_path(local_json_path)
+    if ranges:
+        from services.extraction_cache import hash_file
+        with open(pages_path, "w", encoding="utf-8") as f:
+            json.dump({"output_sha256": hash_file(local_json_path), "page_ranges": ranges}, f)
+    elif os.path.exists(pages_path):
+        os.remove(pages_path)
+    # Classify for /get_kyc while the content is in memory
+    classification_index.observe(local_json_path, content_json)
+
+    result = {
+        "success": True,
+        "content": content_json,
+        "filename": os.path.basename(file_path),
+        "saved_to": local_json_path
+    }
+    if ranges:
+        result["page_ranges"] = ranges
+    return _upload_output(result, local_json_path, submission_id, upload_to_s3, bool(ranges))
+
+def save_tabular_output(file_path: str, submission_id: Optional[str] = None, upload_to_s3: bool = True) -> dict:
+    """
+    Parse a CSV/XLSX file locally, streaming one record per row into outputs/ (and S3).
+
+    The response inlines at most TABULAR_INLINE_MAX_ROWS records; the saved JSON
+    always holds every row.
+    """
+    from services.tabular import iter_tabular_records, write_records_json
+    from services.doc_classification import classification_index
+
+    local_json_path = _output_json_path(file_path, submission_id)
+    row_count, preview = write_records_json(iter_tabular_records(file_path), local_json_path, TABULAR_INLINE_MAX_ROWS)
+    # Spreadsheets are never identity documents; recording that spares /get_kyc a re-read
+    classification_index.observe(local_json_path, None)
+    result = {
+        "success": True,
+        "content": preview,
+        "filename": os.path.basename(file_path),
+        "saved_to": local_json_path,
+        "row_count": row_count,
+        "content_truncated": row_count > len(preview)
+    }
+    return _upload_output(result, local_json_path, submission_id, upload_to_s3)
+
+async def extract_file_to_json(file_path: str, api_key: str, submission_id: Optional[str] = None, upload_to_s3: bool = True) -> dict:
     """
     Extract file (PDF, images, Excel, CSV) to JSON and optionally upload to S3
-    
+
+    Network I/O goes through the shared async Nanonets client; disk, hashing
+    and S3 work run on the shared extraction pool.
+
     Args:
         file_path: Path to file (PDF, images, Excel, CSV)
         api_key: Nanonets API key
@@ -40,69 +326,65 @@ def extract_file_to_json_sync(file_path: str, api_key: str, submission_id: Optio
     Returns:
         Dictionary with success status, content, filename, and S3 URL
     """
-    from utils.s3_service import s3_service
-    import tempfile
-    
-    extract_url = "https://extraction-api.nanonets.com/extract"
-    headers = {"Authorization": f"Bearer {api_key}"}
-    data = {"output_type": "flat-json"}
+    from services.extraction_cache import extraction_cache, hash_file
+    from services.tabular import TABULAR_EXTENSIONS
+
     try:
-        with open(file_path, "rb") as file:
-            files = {"file": file}
-            response = requests.post(extract_url, headers=headers, files=files, data=data, timeout=90)
-        response.raise_for_status()
-        response_data = response.json()
-        content_str = response_data.get("content")
-        record_id = response_data.get("record_id")
-        if content_str:
-            content_json = json.loads(content_str)
-        elif record_id:
-            content_json = poll_until_ready(record_id, api_key)
+        # Structured formats are parsed locally; no OCR round trip needed
+        if os.path.splitext(file_path.lower())[1] in TABULAR_EXTENSIONS:
+            result = await extraction_pool.run(save_tabular_output, file_path, submission_id, upload_to_s3)
+            result["sha256"] = await extraction_pool.run(hash_file, file_path)
+            result["cache_hit"] = False
+            result["extraction_method"] = "local_tabular"
+            return result
+
+        # Identical bytes were already extracted: skip the Nanonets round trip
+        file_hash = await extraction_pool.run(hash_file, file_path)
+        entry = await extraction_pool.run(extraction_cache.get, file_hash)
+        cache_hit = entry is not None
+        pdf_routing = None
+        if cache_hit:
+            content_json, ranges = _from_cache_entry(entry)
         else:
-            return {"success": False, "error": "No record_id or content returned", "response": response_data}
-        
-        base_name = os.path.splitext(os.path.basename(file_path))[0]
-        filename = os.path.basename(file_path)
-        
-        # Save locally first (for backward compatibility)
-        local_output_dir = OUTPUT_DIR
-        if submission_id:
-            local_output_dir = os.path.join(OUTPUT_DIR, submission_id)
-            os.makedirs(local_output_dir, exist_ok=True)
-        
-        local_json_path = os.path.join(local_output_dir, f"{base_name}.json")
-        with open(local_json_path, "w", encoding="utf-8") as f:
-            json.dump(content_json, f, ensure_ascii=False, indent=2)
-        
-        result = {
-            "success": True,
-            "content": content_json,
-            "filename": filename,
-            "saved_to": local_json_path
-        }
-        
-        # Upload to S3 if requested
-        if upload_to_s3 and submission_id:
-            s3_key = f"lnh-submissions/{submission_id}/outputs/{base_name}.json"
-            s3_url = s3_service.upload_file(local_json_path, s3_key, content_type="application/json")
-            result["s3_url"] = s3_url
-            result["s3_key"] = s3_key
-        
+            content_json, pdf_routing, ranges = await _extract_pdf(file_path, api_key)
+            if content_json is None:
+                file_bytes = await extraction_pool.run(_read_bytes, file_path)
+                content_json = await nanonets_client.extract(os.path.basename(file_path), file_bytes, api_key)
+            await extraction_pool.run(extraction_cache.put, file_hash, _cache_entry(content_json, ranges))
+
+        result = await extraction_pool.run(
+            save_extraction_output, content_json, file_path, submission_id, upload_to_s3, ranges
+        )
+        result["sha256"] = file_hash
+        result["cache_hit"] = cache_hit
+        result["extraction_method"] = "nanonets"
+        if pdf_routing:
+            result["pdf_routing"] = pdf_routing
+            if pdf_routing["mode"] == "text":
+                result["extraction_method"] = "local_text"
+            elif pdf_routing["mode"] == "mixed":
+                result["extraction_method"] = "local_text+nanonets"
         return result
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         return {"success": False, "error": f"Request failed: {e}", "filename": os.path.basename(file_path)}
     except Exception as e:
         return {"success": False, "error": f"Unexpected error: {e}", "filename": os.path.basename(file_path)}
 
-async def process_file_async(file: UploadFile, api_key: str, temp_dir: str, submission_id: Optional[str] = None, upload_to_s3: bool = True) -> dict:
-    temp_path = os.path.join(temp_dir, file.filename)
+def save_upload(file: UploadFile, temp_dir: str) -> str:
+    """
+    Spool an uploaded file into `temp_dir` and return its path.
+
+    Each upload gets its own subdirectory, so uploads sharing a name never overwrite
+    each other while the file keeps the name its outputs are derived from.
+    """
+    temp_path = os.path.join(tempfile.mkdtemp(dir=temp_dir), os.path.basename(file.filename))
+    with open(temp_path, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+    return temp_path
+
+async def process_saved_file_async(temp_path: str, api_key: str, submission_id: Optional[str] = None, upload_to_s3: bool = True) -> dict:
     try:
-        with open(temp_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        loop = asyncio.get_event_loop()
-        with ThreadPoolExecutor(max_workers=1) as executor:
-            result = await loop.run_in_executor(executor, extract_file_to_json_sync, temp_path, api_key, submission_id, upload_to_s3)
-        return result
+        return await extract_file_to_json(temp_path, api_key, submission_id, upload_to_s3)
     finally:
         if os.path.exists(temp_path):
             os.remove(temp_path)
@@ -145,6 +427,9 @@ def get_latest_json_files(submission_id: Optional[str] = None, from_s3: bool = F
                 local_path = os.path.join(temp_dir, filename)
                 print(f"📥 Downloading {s3_key} to {local_path}")
                 if s3_service.download_file(s3_key, local_path):
+                    if filename.startswith("."):
+                        # page_ranges_path sidecar: kept next to its output, not a document
+                        continue
                     if os.path.exists(local_path) and os.path.getsize(local_path) > 0:
                         local_files.append(local_path)
                         print(f"✅ Successfully downloaded {filename} ({os.path.getsize(local_path)} bytes)")
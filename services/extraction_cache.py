@@ -0,0 +1,189 @@
+"""
+Content-addressed cache for Nanonets extraction output.
+
+Entries are keyed by the SHA-256 of the uploaded file bytes, so identical
+documents re-uploaded under any name or submission reuse the earlier
+extraction. Lookups go local disk -> S3; the local tier is size-bounded
+with least-recently-used eviction.
+"""
+import os
+import io
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+from config.settings import (
+    EXTRACTION_CACHE_ENABLED,
+    EXTRACTION_CACHE_DIR,
+    EXTRACTION_CACHE_MAX_BYTES,
+    EXTRACTION_CACHE_S3_PREFIX
+)
+
+
+def hash_file(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Return the hex SHA-256 digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    def __init__(self, cache_dir: str, max_bytes: int, s3_prefix: Optional[str] = None, enabled: bool = True):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.s3_prefix = s3_prefix
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        # digest -> size in bytes, oldest access first
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._bytes = 0
+        self._counters = {"local_hits": 0, "s3_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        if enabled:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._load_index()
+
+    def _load_index(self) -> None:
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, name[:-len(".json")], st.st_size))
+        for _, digest, size in sorted(entries):
+            self._index[digest] = size
+            self._bytes += size
+
+    def _local_path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, f"{digest}.json")
+
+    def _s3_key(self, digest: str) -> str:
+        return f"{self.s3_prefix}{digest}.json"
+
+    def get(self, digest: str) -> Optional[Any]:
+        """
+        Look up an extraction by content digest.
+
+        Returns:
+            The cached flat-json content, or None on a miss
+        """
+        if not self.enabled:
+            return None
+        path = self._local_path(digest)
+        try:
+            with open(path, "r", encoding="utf-8") as fh:
+                content = json.load(fh)
+            os.utime(path)
+            with self._lock:
+                if digest in self._index:
+                    self._index.move_to_end(digest)
+                self._counters["local_hits"] += 1
+            return content
+        except FileNotFoundError:
+            pass
+        except Exception:
+            # corrupt entry: drop it and treat as a miss
+            self._remove(digest)
+
+        if self.s3_prefix:
+            from utils.s3_service import s3_service
+            key = self._s3_key(digest)
+            if s3_service.file_exists(key):
+                raw = s3_service.get_file_content(key)
+                if raw:
+                    try:
+                        content = json.loads(raw.decode("utf-8"))
+                    except Exception:
+                        content = None
+                    if content is not None:
+                        # a failed local copy still leaves a usable S3 hit
+                        try:
+                            self._store_local(digest, raw)
+                        except Exception as e:
+                            print(f"⚠️ Failed to write extraction cache entry {digest}: {e}")
+                        with self._lock:
+                            self._counters["s3_hits"] += 1
+                        return content
+
+        with self._lock:
+            self._counters["misses"] += 1
+        return None
+
+    def put(self, digest: str, content: Any) -> None:
+        """Store extraction content locally and in S3 (best effort, never raises)."""
+        if not self.enabled:
+            return
+        raw = json.dumps(content, ensure_ascii=False).encode("utf-8")
+        try:
+            self._store_local(digest, raw)
+            with self._lock:
+                self._counters["stores"] += 1
+        except Exception as e:
+            print(f"⚠️ Failed to write extraction cache entry {digest}: {e}")
+        if self.s3_prefix:
+            try:
+                from utils.s3_service import s3_service
+                s3_service.upload_fileobj(io.BytesIO(raw), self._s3_key(digest), content_type="application/json")
+            except Exception as e:
+                print(f"⚠️ Failed to upload extraction cache entry {digest} to S3: {e}")
+
+    def _store_local(self, digest: str, raw: bytes) -> None:
+        path = self._local_path(digest)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as fh:
+            fh.write(raw)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._bytes -= self._index.pop(digest, 0)
+            self._index[digest] = len(raw)
+            self._bytes += len(raw)
+        self._evict()
+
+    def _remove(self, digest: str) -> None:
+        with self._lock:
+            self._bytes -= self._index.pop(digest, 0)
+        try:
+            os.remove(self._local_path(digest))
+        except OSError:
+            pass
+
+    def _evict(self) -> None:
+        while True:
+            with self._lock:
+                if self._bytes <= self.max_bytes or len(self._index) <= 1:
+                    return
+                digest, size = self._index.popitem(last=False)
+                self._bytes -= size
+                self._counters["evictions"] += 1
+            try:
+                os.remove(self._local_path(digest))
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._counters["local_hits"] + self._counters["s3_hits"] + self._counters["misses"]
+            hits = self._counters["local_hits"] + self._counters["s3_hits"]
+            return {
+                "enabled": self.enabled,
+                **self._counters,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._index),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+# Global extraction cache instance
+extraction_cache = ExtractionCache(
+    EXTRACTION_CACHE_DIR,
+    EXTRACTION_CACHE_MAX_BYTES,
+    s3_prefix=EXTRACTION_CACHE_S3_PREFIX or None,
+    enabled=EXTRACTION_CACHE_ENABLED
+)
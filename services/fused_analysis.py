@@ -0,0 +1,129 @@
+"""
+Single-call analysis + structured summary of one document.
+
+/analysis and /structured_summary used to send the same extracted JSON to
+Bedrock twice. In fused mode one prompt asks for both: the individual
+analysis (ANALYSIS_OUTPUT_SCHEMA) and the per-file structured summary
+(LifeSummary / PropertyCasualtySummary). The summary half is persisted next to
+the analysis and /structured_summary serves it instead of re-prompting.
+"""
+import json
+import hashlib
+from functools import lru_cache
+from typing import Any, Optional, Tuple
+from config.settings import ANALYSIS_OUTPUT_SCHEMA, BEDROCK_MODEL_ID
+from services.analyze import (
+    get_individual_analysis_prompt_prefix,
+    get_individual_analysis_prompt_parts,
+    ANALYSIS_PROMPT_REVISION,
+    analyze_structured,
+    make_tool,
+    validate_analysis_schema
+)
+from services.structured_summary import get_summary_spec, normalize_summary, summary_tool
+
+# Both objects share one response, so allow more output than a plain analysis
+FUSED_MAX_TOKENS = 6144
+
+
+def get_fused_prompt_prefix(insurance_type: str, doc_type: Optional[str] = None) -> str:
+    """
+    Static prefix of the fused prompt: the individual analysis prefix followed by the
+    structured summary instructions, so it stays cacheable per insurance type and document type.
+    """
+    instructions, schema = get_summary_spec(insurance_type)
+    return get_individual_analysis_prompt_prefix(insurance_type, doc_type) + f"""
+STRUCTURED SUMMARY:
+From the same extracted data, also fill in a structured summary. {instructions}
+Summary schema (types are illustrative, keep the exact keys):
+{json.dumps(schema, indent=2)}
+
+COMBINED OUTPUT:
+Return ONE JSON object with exactly two keys:
+- "analysis": the analysis object matching the analysis schema above
+- "structured_summary": the object matching the summary schema
+"""
+
+
+def get_fused_prompt_parts(insurance_type: str, extracted_data: Any, doc_type: Optional[str] = None) -> Tuple[str, str]:
+    """Build the fused prompt as (static prefix, document suffix)."""
+    _, suffix = get_individual_analysis_prompt_parts(insurance_type, extracted_data, doc_type)
+    prefix = get_fused_prompt_prefix(insurance_type, doc_type)
+    suffix = suffix.replace(
+        "Return ONLY the JSON object.",
+        'Return ONLY the combined JSON object with the keys "analysis" and "structured_summary".'
+    )
+    return prefix, suffix
+
+
+def fused_tool(insurance_type: str) -> dict:
+    """Tool taking both objects; the summary model's $defs are lifted to the root so its refs resolve."""
+    summary_schema = dict(summary_tool(insurance_type)["input_schema"])
+    defs = summary_schema.pop("$defs", {})
+    schema = {
+        "type": "object",
+        "properties": {"analysis": ANALYSIS_OUTPUT_SCHEMA, "structured_summary": summary_schema},
+        "required": ["analysis", "structured_summary"]
+    }
+    if defs:
+        schema["$defs"] = defs
+    return make_tool(
+        "record_analysis_and_summary",
+        "Record the underwriting analysis and the structured summary of the document.",
+        schema
+    )
+
+
+@lru_cache(maxsize=None)
+def fused_prompt_version(insurance_type: str, doc_type: Optional[str] = None) -> str:
+    """
+    Fingerprint of the model, fused prompt and tool for one document type.
+
+    Both halves of a fused result are stored under it: the analysis as its prompt_version
+    and the structured summary as its summary_version.
+    """
+    material = json.dumps([
+        ANALYSIS_PROMPT_REVISION,
+        BEDROCK_MODEL_ID,
+        get_fused_prompt_prefix(insurance_type, doc_type),
+        fused_tool(insurance_type)["input_schema"]
+    ], sort_keys=True)
+    return f"fused-{ANALYSIS_PROMPT_REVISION}-{hashlib.sha256(material.encode('utf-8')).hexdigest()[:16]}"
+
+
+def _validate_fused(combined: dict) -> Tuple[bool, str]:
+    # Only the analysis half is required; an unusable summary is re-prompted by /structured_summary
+    if not isinstance(combined.get("analysis"), dict):
+        return False, "Missing required 'analysis' object"
+    return validate_analysis_schema(combined["analysis"])
+
+
+async def run_fused_analysis(
+    insurance_type: str,
+    extracted_data: Any,
+    doc_type: Optional[str] = None,
+    use_cache: bool = True
+) -> dict:
+    """
+    Analyze one document and extract its structured summary in a single Bedrock call.
+
+    Returns:
+        analyze_with_claude result where "analysis" is the parsed analysis dict and
+        "structured_summary" the normalized summary, or None when that half was unusable
+    """
+    prefix, suffix = get_fused_prompt_parts(insurance_type, extracted_data, doc_type)
+    result = await analyze_structured(
+        suffix, fused_tool(insurance_type), _validate_fused,
+        max_tokens=FUSED_MAX_TOKENS, use_cache=use_cache, cacheable_prefix=prefix
+    )
+    if not result["success"]:
+        return result
+    combined = result["analysis"]
+
+    summary = None
+    try:
+        summary = normalize_summary(insurance_type, combined.get("structured_summary") or {})
+    except Exception as e:
+        # the analysis is still usable; /structured_summary will prompt for this file itself
+        print(f"⚠️ Fused structured summary invalid: {e}")
+    return {**result, "analysis": combined["analysis"], "structured_summary": summary}
@@ -0,0 +1,93 @@
+"""
+Incremental re-analysis of a submission.
+
+Every stored {base}_analysis_{type}.json records the SHA-256 of the extracted
+JSON it was produced from and the analysis prompt version. On the next
+/analysis call a file whose extraction and prompt version are unchanged reuses
+that stored analysis instead of calling Bedrock again.
+
+The consolidated analysis is recorded in .consolidation_{type}.json together
+with a fingerprint of its inputs (file names, source hashes and prompt
+versions) and of the consolidation prompts; consolidation only runs again
+when either changes.
+The leading dot keeps the record out of *.json globs.
+"""
+import os
+import json
+import hashlib
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from utils.s3_service import s3_service
+from services.analyze import validate_analysis_schema
+from services.consolidation import consolidation_prompt_version
+
+
+def fetch_from_s3_if_missing(local_path: str, submission_id: Optional[str], s3_folder: str) -> None:
+    """Pull a stored artifact from lnh-submissions/{submission_id}/{s3_folder}/ when not present locally."""
+    if submission_id and not os.path.exists(local_path):
+        s3_service.download_file(
+            f"lnh-submissions/{submission_id}/{s3_folder}/{os.path.basename(local_path)}", local_path
+        )
+
+
+def load_reusable_analysis(analysis_file: str, source_sha256: str, prompt_version: str) -> Optional[dict]:
+    """
+    Return the stored analysis record if it was produced from the same extraction
+    with the same prompt version and still validates, else None.
+    """
+    try:
+        with open(analysis_file, 'r', encoding='utf-8') as f:
+            stored = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    if stored.get("source_sha256") != source_sha256 or stored.get("prompt_version") != prompt_version:
+        return None
+    is_valid, _ = validate_analysis_schema(stored.get("analysis"))
+    return stored if is_valid else None
+
+
+def consolidation_fingerprint(insurance_type: str, inputs: List[Dict[str, Any]], fan_in: int) -> str:
+    """
+    Fingerprint of one consolidation's inputs and of the consolidation prompt version.
+
+    Args:
+        inputs: [{"file", "source_sha256", "prompt_version"}] for every analysis consolidated
+    """
+    material = sorted((i["file"], i.get("source_sha256"), i.get("prompt_version")) for i in inputs)
+    version = consolidation_prompt_version(insurance_type)
+    return hashlib.sha256(json.dumps([insurance_type, fan_in, version, material]).encode('utf-8')).hexdigest()
+
+
+def consolidation_record_path(analysis_output_dir: str, insurance_type: str) -> str:
+    return os.path.join(analysis_output_dir, f".consolidation_{insurance_type}.json")
+
+
+def load_consolidation(path: str, fingerprint: str) -> Optional[dict]:
+    """Return the recorded consolidation if it was built from exactly these inputs."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            record = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    if record.get("inputs_fingerprint") != fingerprint or not record.get("consolidated_analysis"):
+        return None
+    return record
+
+
+def save_consolidation(
+    path: str,
+    fingerprint: str,
+    consolidated_analysis: str,
+    documents: List[str],
+    consolidated_s3_url: Optional[str],
+    consolidation_stats: Optional[dict]
+) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            "inputs_fingerprint": fingerprint,
+            "documents": documents,
+            "consolidated_at": datetime.now().isoformat(),
+            "consolidated_s3_url": consolidated_s3_url,
+            "consolidation": consolidation_stats,
+            "consolidated_analysis": consolidated_analysis
+        }, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,133 @@
+"""
+Persistent store for background extraction jobs.
+
+Each job is a JSON document under JOBS_DIR written atomically, so any
+worker process sharing the directory can answer status queries. Every
+progress write refreshes "updated_at"; a queued or running job that goes
+quiet for JOB_STALE_AFTER_SECONDS (its worker died, or the server restarted
+mid-job) is marked failed the next time it is read.
+"""
+import os
+import json
+import uuid
+import threading
+from datetime import datetime
+from typing import List, Optional
+from config.settings import JOBS_DIR, JOB_STALE_AFTER_SECONDS
+
+_ACTIVE_STATUSES = ("queued", "running")
+
+
+class JobStore:
+    def __init__(self, jobs_dir: str, stale_after_seconds: int = JOB_STALE_AFTER_SECONDS):
+        self.jobs_dir = jobs_dir
+        self.stale_after_seconds = stale_after_seconds
+        self._lock = threading.Lock()
+        os.makedirs(jobs_dir, exist_ok=True)
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _write(self, job: dict) -> None:
+        job["updated_at"] = datetime.now().isoformat()
+        path = self._path(job["job_id"])
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump(job, fh, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def _read(self, job_id: str) -> Optional[dict]:
+        # Job IDs are uuid hex strings; reject anything else before touching the filesystem
+        try:
+            job_id = uuid.UUID(hex=job_id).hex
+        except (ValueError, TypeError):
+            return None
+        try:
+            with open(self._path(job_id), "r", encoding="utf-8") as fh:
+                return json.load(fh)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _is_stale(self, job: dict) -> bool:
+        if job.get("status") not in _ACTIVE_STATUSES:
+            return False
+        try:
+            updated_at = datetime.fromisoformat(job.get("updated_at") or job["created_at"])
+        except (KeyError, TypeError, ValueError):
+            return False
+        return (datetime.now() - updated_at).total_seconds() > self.stale_after_seconds
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """The job record; an abandoned queued/running job is marked failed first."""
+        job = self._read(job_id)
+        if job is None or not self._is_stale(job):
+            return job
+        with self._lock:
+            # re-read under the lock: progress may have landed meanwhile
+            job = self._read(job_id)
+            if job is not None and self._is_stale(job):
+                job["status"] = "failed"
+                job["error"] = f"Job made no progress for {self.stale_after_seconds}s; its worker stopped before finishing"
+                job["finished_at"] = datetime.now().isoformat()
+                self._write(job)
+        return job
+
+    def create(self, kind: str, filenames: List[str], submission_id: Optional[str] = None) -> dict:
+        now = datetime.now().isoformat()
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "kind": kind,
+            "submission_id": submission_id,
+            "status": "queued",
+            "created_at": now,
+            "total_files": len(filenames),
+            "completed_files": 0,
+            "files": {name: {"status": "pending"} for name in filenames},
+            "results": None,
+            "error": None
+        }
+        with self._lock:
+            self._write(job)
+        return job
+
+    def _update(self, job_id: str, mutate) -> None:
+        with self._lock:
+            job = self._read(job_id)
+            if job is None:
+                return
+            mutate(job)
+            self._write(job)
+
+    def mark_running(self, job_id: str) -> None:
+        def mutate(job):
+            job["status"] = "running"
+            job["started_at"] = datetime.now().isoformat()
+        self._update(job_id, mutate)
+
+    def record_file_result(self, job_id: str, filename: str, result: dict) -> None:
+        def mutate(job):
+            job["files"][filename] = {
+                "status": "success" if result.get("success") else "error",
+                "error": result.get("error"),
+                "finished_at": datetime.now().isoformat()
+            }
+            job["completed_files"] = sum(1 for f in job["files"].values() if f["status"] != "pending")
+        self._update(job_id, mutate)
+
+    def complete(self, job_id: str, results: dict) -> None:
+        def mutate(job):
+            job["status"] = "completed"
+            job["results"] = results
+            job["finished_at"] = datetime.now().isoformat()
+        self._update(job_id, mutate)
+
+    def fail(self, job_id: str, error: str) -> None:
+        def mutate(job):
+            job["status"] = "failed"
+            job["error"] = error
+            job["finished_at"] = datetime.now().isoformat()
+        self._update(job_id, mutate)
+
+
+# Global job store instance
+job_store = JobStore(JOBS_DIR)
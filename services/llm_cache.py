@@ -0,0 +1,194 @@
+"""
+Two-tier cache for Bedrock responses used by analyze_with_claude.
+
+Keys combine the model ID, a hash of the whitespace-normalized prompt,
+max_tokens and temperature. A bounded in-memory LRU sits in front of a
+size-bounded on-disk tier; entries expire after a TTL in both tiers.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+from config.settings import (
+    LLM_CACHE_ENABLED,
+    LLM_CACHE_DIR,
+    LLM_CACHE_TTL_SECONDS,
+    LLM_CACHE_MEMORY_ENTRIES,
+    LLM_CACHE_MAX_BYTES
+)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Drop trailing whitespace per line and surrounding blank lines; content is unchanged."""
+    lines = prompt.replace("\r\n", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+def make_cache_key(model_id: str, prompt: str, max_tokens: int, temperature: float) -> str:
+    prompt_hash = hashlib.sha256(normalize_prompt(prompt).encode("utf-8")).hexdigest()
+    key_material = json.dumps([model_id, prompt_hash, max_tokens, round(float(temperature), 4)])
+    return hashlib.sha256(key_material.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    def __init__(self, cache_dir: str, ttl_seconds: int, memory_entries: int, max_bytes: int, enabled: bool = True):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, dict]" = OrderedDict()
+        # key -> size in bytes of the on-disk entry, oldest write first
+        self._disk_index: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0, "stores": 0, "evictions": 0, "expired": 0}
+        self._saved_latency_ms = 0.0
+        if enabled:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._load_index()
+
+    def _load_index(self) -> None:
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".json"):
+                try:
+                    st = os.stat(os.path.join(self.cache_dir, name))
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, name[:-len(".json")], st.st_size))
+        for _, key, size in sorted(entries):
+            self._disk_index[key] = size
+            self._disk_bytes += size
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def record_bypass(self) -> None:
+        with self._lock:
+            self._counters["bypassed"] += 1
+
+    def get(self, key: str) -> Optional[dict]:
+        """Return the cached entry ({"text", "latency_ms", "created_at"}) or None."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        expired = False
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry["expires_at"] > now:
+                    self._memory.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    self._saved_latency_ms += entry.get("latency_ms", 0.0)
+                    return entry
+                del self._memory[key]
+                expired = True
+
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as fh:
+                entry = json.load(fh)
+        except (FileNotFoundError, json.JSONDecodeError):
+            entry = None
+        if entry is not None and entry.get("expires_at", 0) <= now:
+            self._remove_disk(key)
+            expired = True
+            entry = None
+
+        with self._lock:
+            if expired:
+                # counted once per lookup, whether the memory copy, the disk copy or both had expired
+                self._counters["expired"] += 1
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            self._counters["disk_hits"] += 1
+            self._saved_latency_ms += entry.get("latency_ms", 0.0)
+            self._remember(key, entry)
+        return entry
+
+    def put(self, key: str, text: str, latency_ms: float) -> None:
+        if not self.enabled:
+            return
+        now = time.time()
+        entry = {"text": text, "latency_ms": latency_ms, "created_at": now, "expires_at": now + self.ttl_seconds}
+        raw = json.dumps(entry, ensure_ascii=False).encode("utf-8")
+        with self._lock:
+            self._remember(key, entry)
+            self._counters["stores"] += 1
+        try:
+            path = self._path(key)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as fh:
+                fh.write(raw)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"⚠️ Failed to write LLM cache entry {key}: {e}")
+            return
+        with self._lock:
+            self._disk_bytes -= self._disk_index.pop(key, 0)
+            self._disk_index[key] = len(raw)
+            self._disk_bytes += len(raw)
+        self._evict()
+
+    def invalidate(self, key: str) -> None:
+        """Drop an entry from both tiers (e.g. a replayed response that no longer validates)."""
+        with self._lock:
+            self._memory.pop(key, None)
+        self._remove_disk(key)
+
+    def _remember(self, key: str, entry: dict) -> None:
+        # caller holds the lock
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _remove_disk(self, key: str) -> None:
+        with self._lock:
+            self._disk_bytes -= self._disk_index.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self) -> None:
+        while True:
+            with self._lock:
+                if self._disk_bytes <= self.max_bytes or len(self._disk_index) <= 1:
+                    return
+                key, size = self._disk_index.popitem(last=False)
+                self._disk_bytes -= size
+                self._counters["evictions"] += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self._counters["memory_hits"] + self._counters["disk_hits"]
+            lookups = hits + self._counters["misses"]
+            return {
+                "enabled": self.enabled,
+                **self._counters,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_entries": len(self._disk_index),
+                "bytes_stored": self._disk_bytes,
+                "max_bytes": self.max_bytes,
+                "saved_latency_ms": round(self._saved_latency_ms, 1),
+            }
+
+
+# Global LLM response cache instance
+llm_cache = LLMResponseCache(
+    LLM_CACHE_DIR,
+    ttl_seconds=LLM_CACHE_TTL_SECONDS,
+    memory_entries=LLM_CACHE_MEMORY_ENTRIES,
+    max_bytes=LLM_CACHE_MAX_BYTES,
+    enabled=LLM_CACHE_ENABLED
+)
@@ -0,0 +1,155 @@
+"""
+Per-submission extraction manifest.
+
+outputs/{submission_id}/.manifest.json maps each uploaded source file to the
+SHA-256 of its bytes and the JSON artifact extracted from it, plus which
+files the latest /extract call added, replaced or left untouched. The leading
+dot keeps it out of the *.json globs that downstream steps use.
+
+record_batch updates the manifest under a per-submission lock (a thread lock
+plus an flock on .manifest.lock), so concurrent append requests to the same
+submission, in one worker or several, never drop each other's entries.
+"""
+import os
+import json
+import fcntl
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+from config.settings import OUTPUT_DIR, ANALYSIS_OUTPUT_DIR
+
+MANIFEST_FILENAME = ".manifest.json"
+MANIFEST_LOCK_FILENAME = ".manifest.lock"
+
+_thread_locks: Dict[Optional[str], threading.Lock] = {}
+_thread_locks_guard = threading.Lock()
+
+
+def _manifest_path(submission_id: Optional[str] = None) -> str:
+    base_dir = os.path.join(OUTPUT_DIR, submission_id) if submission_id else OUTPUT_DIR
+    return os.path.join(base_dir, MANIFEST_FILENAME)
+
+
+@contextmanager
+def _manifest_lock(submission_id: Optional[str] = None):
+    """Hold the submission's manifest lock across this process's threads and other workers."""
+    with _thread_locks_guard:
+        thread_lock = _thread_locks.setdefault(submission_id, threading.Lock())
+    lock_path = os.path.join(os.path.dirname(_manifest_path(submission_id)), MANIFEST_LOCK_FILENAME)
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    with thread_lock, open(lock_path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def load_manifest(submission_id: Optional[str] = None) -> dict:
+    try:
+        with open(_manifest_path(submission_id), "r", encoding="utf-8") as fh:
+            manifest = json.load(fh)
+        if isinstance(manifest, dict) and isinstance(manifest.get("files"), dict):
+            return manifest
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+    return {"submission_id": submission_id, "files": {}}
+
+
+def save_manifest(manifest: dict, submission_id: Optional[str] = None) -> None:
+    path = _manifest_path(submission_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    manifest["updated_at"] = datetime.now().isoformat()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def classify_uploads(file_hashes: Dict[str, str], submission_id: Optional[str] = None) -> Dict[str, str]:
+    """
+    Compare uploads against the manifest.
+
+    Args:
+        file_hashes: Source filename -> SHA-256 of the uploaded bytes
+
+    Returns:
+        Source filename -> "new", "changed" or "unchanged"
+    """
+    known = load_manifest(submission_id)["files"]
+    statuses = {}
+    for filename, digest in file_hashes.items():
+        entry = known.get(filename)
+        if entry is None:
+            statuses[filename] = "new"
+        elif entry.get("sha256") == digest and os.path.exists(entry.get("output", "")):
+            statuses[filename] = "unchanged"
+        else:
+            statuses[filename] = "changed"
+    return statuses
+
+
+def unchanged_result(filename: str, submission_id: Optional[str] = None) -> dict:
+    """Result entry for an upload that matched the manifest and was not re-extracted."""
+    entry = load_manifest(submission_id)["files"].get(filename, {})
+    return {
+        "success": True,
+        "filename": filename,
+        "saved_to": entry.get("output"),
+        "sha256": entry.get("sha256"),
+        "s3_key": entry.get("s3_key"),
+        "skipped": True
+    }
+
+
+def remove_stale_analyses(filenames: List[str], submission_id: str) -> List[str]:
+    """Delete per-file analyses and structured summaries derived from replaced source files."""
+    analysis_dir = os.path.join(ANALYSIS_OUTPUT_DIR, submission_id)
+    if not os.path.isdir(analysis_dir):
+        return []
+    prefixes = tuple(
+        f"{os.path.splitext(name)[0]}_{kind}_" for name in filenames for kind in ("analysis", "summary")
+    )
+    removed = []
+    for name in os.listdir(analysis_dir):
+        if prefixes and name.startswith(prefixes):
+            os.remove(os.path.join(analysis_dir, name))
+            removed.append(name)
+    return removed
+
+
+def record_batch(results: List[dict], statuses: Dict[str, str], submission_id: Optional[str] = None) -> dict:
+    """
+    Record an /extract batch in the manifest and return the batch summary.
+
+    Only successful extractions are recorded, so a failed upload is retried next time.
+    """
+    with _manifest_lock(submission_id):
+        return _record_batch_locked(results, statuses, submission_id)
+
+
+def _record_batch_locked(results: List[dict], statuses: Dict[str, str], submission_id: Optional[str]) -> dict:
+    # re-read under the lock: another request may have recorded its batch since classify_uploads
+    manifest = load_manifest(submission_id)
+    now = datetime.now().isoformat()
+    batch = {"new": [], "changed": [], "unchanged": [], "failed": [], "at": now}
+    for result in results:
+        filename = result.get("filename")
+        status = statuses.get(filename, "new")
+        if not result.get("success"):
+            batch["failed"].append(filename)
+            continue
+        batch[status].append(filename)
+        if status == "unchanged":
+            continue
+        manifest["files"][filename] = {
+            "sha256": result.get("sha256"),
+            "output": result.get("saved_to"),
+            "s3_key": result.get("s3_key"),
+            "extracted_at": now
+        }
+    manifest["submission_id"] = submission_id
+    manifest["last_batch"] = batch
+    save_manifest(manifest, submission_id)
+    return batch
@@ -0,0 +1,153 @@
+"""
+Asyncio client for the Nanonets extraction API.
+
+A single httpx.AsyncClient keeps TLS connections alive across uploads and
+polls. Polling backs off exponentially with jitter from a sub-second first
+interval and honors Retry-After hints, so fast documents return as soon as
+they are ready and no thread is parked in sleep.
+"""
+import json
+import random
+import time
+import asyncio
+from email.utils import parsedate_to_datetime
+from typing import Any, Optional
+import httpx
+from config.settings import (
+    NANONETS_BASE_URL,
+    NANONETS_MAX_CONNECTIONS,
+    NANONETS_POLL_MAX_WAIT,
+    NANONETS_POLL_INITIAL_INTERVAL,
+    NANONETS_POLL_MAX_INTERVAL
+)
+
+# Status codes worth retrying (rate limiting / transient upstream failures)
+_RETRYABLE_STATUS = {429, 502, 503, 504}
+
+
+def _retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    """Parse a Retry-After header given either as seconds or an HTTP date."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+
+class NanonetsClient:
+    def __init__(
+        self,
+        base_url: str = NANONETS_BASE_URL,
+        max_connections: int = NANONETS_MAX_CONNECTIONS,
+        max_wait: float = NANONETS_POLL_MAX_WAIT,
+        initial_interval: float = NANONETS_POLL_INITIAL_INTERVAL,
+        max_interval: float = NANONETS_POLL_MAX_INTERVAL
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.max_connections = max_connections
+        self.max_wait = max_wait
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Created lazily so the pool binds to the running event loop
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(90.0, connect=10.0),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                )
+            )
+        return self._client
+
+    def _backoff(self, attempt: int) -> float:
+        """Exponential backoff with equal jitter: half fixed, half random."""
+        ceiling = min(self.max_interval, self.initial_interval * (2 ** attempt))
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+    async def extract(self, filename: str, content: bytes, api_key: str, output_type: str = "flat-json") -> Any:
+        """
+        Upload a document and wait for its extraction result.
+
+        Args:
+            filename: Original file name (sent as the multipart file name)
+            content: Raw file bytes
+            api_key: Nanonets API key
+            output_type: Nanonets output type
+
+        Returns:
+            Parsed extraction content (usually a list of flat-json records)
+        """
+        client = self._get_client()
+        headers = {"Authorization": f"Bearer {api_key}"}
+        attempt = 0
+        while True:
+            response = await client.post(
+                "/extract",
+                headers=headers,
+                files={"file": (filename, content)},
+                data={"output_type": output_type}
+            )
+            if response.status_code in _RETRYABLE_STATUS and attempt < 3:
+                await asyncio.sleep(_retry_after_seconds(response) or self._backoff(attempt))
+                attempt += 1
+                continue
+            break
+        response.raise_for_status()
+        response_data = response.json()
+        content_str = response_data.get("content")
+        record_id = response_data.get("record_id")
+        if content_str:
+            return json.loads(content_str)
+        if record_id:
+            return await self.poll_until_ready(record_id, api_key)
+        raise ValueError(f"No record_id or content returned: {response_data}")
+
+    async def poll_until_ready(self, record_id: str, api_key: str, max_wait: Optional[float] = None) -> Any:
+        """
+        Poll a Nanonets record until its content is ready.
+
+        Raises:
+            TimeoutError: If the record is not ready within `max_wait` seconds
+        """
+        max_wait = self.max_wait if max_wait is None else max_wait
+        client = self._get_client()
+        headers = {"Authorization": f"Bearer {api_key}"}
+        deadline = time.monotonic() + max_wait
+        attempt = 0
+        while True:
+            response = await client.get(f"/files/{record_id}", headers=headers, timeout=60.0)
+            hint = _retry_after_seconds(response)
+            if response.status_code not in _RETRYABLE_STATUS:
+                response.raise_for_status()
+                data = response.json()
+                content = data.get("content", "")
+                if content and not data.get("processing_status") == "processing":
+                    try:
+                        return json.loads(content)
+                    except Exception:
+                        return content
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"Polling timed out after {max_wait} seconds for record_id {record_id}")
+            delay = hint if hint is not None else self._backoff(attempt)
+            await asyncio.sleep(min(delay, remaining))
+            attempt += 1
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# Global Nanonets client instance
+nanonets_client = NanonetsClient()
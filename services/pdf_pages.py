@@ -0,0 +1,125 @@
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import NameObject
+
+
+def _write_pages(reader: PdfReader, page_indexes: List[int], out_path: str) -> str:
+    writer = PdfWriter()
+    for index in page_indexes:
+        writer.add_page(reader.pages[index])
+    with open(out_path, "wb") as fh:
+        writer.write(fh)
+    return out_path
+
+
+def write_page_groups(pdf_path: str, groups: List[List[int]], out_dir: str) -> List[str]:
+    """
+    Write each group of 0-based pages to its own PDF, parsing the source once.
+
+    Args:
+        pdf_path: Source PDF
+        groups: Page index lists, one output file per list
+        out_dir: Directory the output PDFs are written to
+
+    Returns:
+        Output paths, in the same order as `groups`
+    """
+    reader = PdfReader(pdf_path)
+    base_name = os.path.splitext(os.path.basename(pdf_path))[0]
+    paths = []
+    for pages in groups:
+        out_path = os.path.join(out_dir, f"{base_name}_p{pages[0] + 1}-{pages[-1] + 1}.pdf")
+        paths.append(_write_pages(reader, pages, out_path))
+    return paths
+
+
+def _field_key(name: str) -> str:
+    return re.sub(r"[^0-9a-zA-Z]+", "_", name).strip("_").lower()
+
+
+def _inherited(annot, key: str):
+    """Look up a form-field attribute on a widget or its parent field chain."""
+    node = annot
+    while node is not None:
+        if key in node:
+            return node[key]
+        parent = node.get("/Parent")
+        node = parent.get_object() if parent is not None else None
+    return None
+
+
+def _widget_field(annot) -> Optional[Tuple[str, Any]]:
+    """Fully qualified name and display value of a filled form widget, or None."""
+    names = []
+    node = annot
+    while node is not None:
+        if "/T" in node:
+            names.insert(0, str(node["/T"]))
+        parent = node.get("/Parent")
+        node = parent.get_object() if parent is not None else None
+    if not names:
+        return None
+    value = _inherited(annot, "/V")
+    if value is None:
+        return None
+    if isinstance(value, NameObject):
+        # checkbox / radio states: /Off is unchecked, any other state is checked
+        if value == "/Off":
+            return None
+        value = "Yes"
+    elif isinstance(value, list):
+        value = ", ".join(str(v) for v in value)
+    value = str(value).strip()
+    if not value:
+        return None
+    return ".".join(names), value
+
+
+def read_text_pages(pdf_path: str) -> List[Dict[str, Any]]:
+    """
+    Read the embedded text layer and filled form fields of every page.
+
+    Returns:
+        One {"text": str, "fields": {name: value}} entry per page, in page order
+    """
+    reader = PdfReader(pdf_path)
+    pages = []
+    for page in reader.pages:
+        try:
+            text = page.extract_text() or ""
+        except Exception:
+            text = ""
+        fields: Dict[str, Any] = {}
+        for annot_ref in page.get("/Annots") or []:
+            annot = annot_ref.get_object()
+            if annot.get("/Subtype") != "/Widget":
+                continue
+            field = _widget_field(annot)
+            if field:
+                fields.setdefault(field[0], field[1])
+        pages.append({"text": text, "fields": fields})
+    return pages
+
+
+def has_usable_text(page: Dict[str, Any], min_chars: int) -> bool:
+    """A page is usable without OCR when it has filled form fields or enough embedded text."""
+    return bool(page["fields"]) or len(page["text"].strip()) >= min_chars
+
+
+def page_to_record(page_number: int, page: Dict[str, Any]) -> Dict[str, Any]:
+    """Flat-json record for a locally extracted page: form fields as snake_case keys plus the page text."""
+    record: Dict[str, Any] = {"page_number": str(page_number)}
+    for name, value in page["fields"].items():
+        key = _field_key(name) or "field"
+        if key in record:
+            suffix = 2
+            while f"{key}_{suffix}" in record:
+                suffix += 1
+            key = f"{key}_{suffix}"
+        record[key] = value
+    text = page["text"].strip()
+    if text:
+        record["page_text"] = text
+    return record
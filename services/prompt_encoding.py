@@ -0,0 +1,270 @@
+"""
+Compact encoding of extracted document data for Bedrock prompts.
+
+Extracted flat-json used to be embedded with json.dumps(indent=2). This module
+instead emits minified JSON after:
+  * dropping empty values and boilerplate keys (PROMPT_PRUNE_KEYS),
+  * dropping `*_hindi` fields that have an English/plain sibling,
+  * removing exact duplicate records and hoisting page-header fields that
+    repeat identically on most pages into a single "repeated_fields" block,
+  * enforcing a per-prompt token budget (long strings first, then trailing records).
+
+Run `python -m services.prompt_encoding [outputs_dir]` to report the savings
+against the indent=2 encoding on stored extraction outputs.
+"""
+import os
+import sys
+import json
+import glob
+import math
+from typing import Any, Dict, List, Optional
+from config.settings import (
+    OUTPUT_DIR,
+    PROMPT_COMPACT_ENCODING,
+    PROMPT_PRUNE_KEYS,
+    PROMPT_DROP_HINDI_DUPLICATES,
+    PROMPT_DATA_TOKEN_BUDGET
+)
+
+# Rough characters-per-token ratio for budgeting; no tokenizer is shipped with the service
+CHARS_PER_TOKEN = 4
+# Strings longer than this are cut first when a prompt is over budget
+MAX_STRING_CHARS = 2000
+# A field repeated identically must appear in at least this many records to be hoisted
+MIN_REPEATS_TO_HOIST = 3
+
+_EMPTY = (None, "", [], {})
+
+# Cumulative encoding stats for /metrics
+prompt_encoding_stats = {"prompts": 0, "baseline_chars": 0, "encoded_chars": 0, "truncated": 0}
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def baseline_encoding(data: Any) -> str:
+    """The encoding prompts used before compaction."""
+    return json.dumps(data, indent=2)
+
+
+def _minify(data: Any) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def _is_hindi_duplicate(key: str, record: dict) -> bool:
+    if not key.lower().endswith("_hindi"):
+        return False
+    base = key[:-len("_hindi")]
+    for sibling in (base, f"{base}_english", f"{base}_English"):
+        if record.get(sibling) not in _EMPTY:
+            return True
+    return False
+
+
+def prune(data: Any, prune_keys: Optional[List[str]] = None, drop_hindi: bool = PROMPT_DROP_HINDI_DUPLICATES) -> Any:
+    """Recursively drop empty values, boilerplate keys and Hindi duplicates of English fields."""
+    prune_keys = PROMPT_PRUNE_KEYS if prune_keys is None else prune_keys
+    if isinstance(data, dict):
+        pruned = {}
+        for key, value in data.items():
+            if key.lower() in prune_keys:
+                continue
+            if drop_hindi and _is_hindi_duplicate(key, data):
+                continue
+            value = prune(value, prune_keys, drop_hindi)
+            if value in _EMPTY:
+                continue
+            pruned[key] = value
+        return pruned
+    if isinstance(data, list):
+        items = [prune(item, prune_keys, drop_hindi) for item in data]
+        return [item for item in items if item not in _EMPTY]
+    return data
+
+
+def dedupe_records(records: List[Any]) -> Any:
+    """
+    Drop exact duplicate records and hoist fields repeated unchanged on most pages.
+
+    Returns the list unchanged when nothing repeats, otherwise
+    {"repeated_fields": {...}, "records": [...]}.
+    """
+    seen = set()
+    unique = []
+    for record in records:
+        marker = _minify(record)
+        if marker in seen:
+            continue
+        seen.add(marker)
+        unique.append(record)
+
+    dict_records = [r for r in unique if isinstance(r, dict)]
+    threshold = max(MIN_REPEATS_TO_HOIST, math.ceil(len(dict_records) / 2))
+    # key -> distinct encoded values and number of records carrying the key
+    values: Dict[str, set] = {}
+    counts: Dict[str, int] = {}
+    for record in dict_records:
+        for key, value in record.items():
+            values.setdefault(key, set()).add(_minify(value))
+            counts[key] = counts.get(key, 0) + 1
+    # Only keys with a single value everywhere they appear, so hoisting never hides a per-record value
+    hoisted_keys = {key for key, count in counts.items() if count >= threshold and len(values[key]) == 1}
+    if not hoisted_keys:
+        return unique
+
+    repeated_fields = {}
+    records_out = []
+    for record in unique:
+        if not isinstance(record, dict):
+            records_out.append(record)
+            continue
+        kept = {}
+        for key, value in record.items():
+            if key in hoisted_keys:
+                repeated_fields.setdefault(key, value)
+            else:
+                kept[key] = value
+        if kept:
+            records_out.append(kept)
+    return {"repeated_fields": repeated_fields, "records": records_out}
+
+
+def _truncate_strings(data: Any, limit: int) -> Any:
+    if isinstance(data, str) and len(data) > limit:
+        return data[:limit] + " …[truncated]"
+    if isinstance(data, dict):
+        return {k: _truncate_strings(v, limit) for k, v in data.items()}
+    if isinstance(data, list):
+        return [_truncate_strings(v, limit) for v in data]
+    return data
+
+
+def _fit_budget(data: Any, token_budget: int) -> tuple:
+    """Return (data, truncated) with the minified encoding within `token_budget` tokens."""
+    max_chars = token_budget * CHARS_PER_TOKEN
+    if len(_minify(data)) <= max_chars:
+        return data, False
+
+    data = _truncate_strings(data, MAX_STRING_CHARS)
+    if len(_minify(data)) <= max_chars:
+        return data, True
+
+    container = data
+    records = data
+    if isinstance(data, dict) and isinstance(data.get("records"), list):
+        records = data["records"]
+    if not isinstance(records, list):
+        return data, True
+
+    overhead = len(_minify(container)) - len(_minify(records)) + 64
+    kept, used = [], overhead
+    for record in records:
+        size = len(_minify(record)) + 1
+        if used + size > max_chars:
+            break
+        kept.append(record)
+        used += size
+    omitted = len(records) - len(kept)
+    kept.append({"_omitted_records": omitted, "_reason": "prompt token budget"})
+    if container is records:
+        return kept, True
+    return {**container, "records": kept}, True
+
+
+def encode_for_prompt(
+    data: Any,
+    token_budget: Optional[int] = None,
+    prune_fields: bool = True,
+    dedupe: bool = True,
+    fit_budget: bool = True,
+    record_stats: bool = True
+) -> str:
+    """
+    Serialize extracted data for embedding in a prompt.
+
+    Args:
+        data: Extracted flat-json (list of records or a dict) or other JSON-able data
+        token_budget: Approximate token ceiling for the encoded data (defaults to PROMPT_DATA_TOKEN_BUDGET)
+        prune_fields: Drop boilerplate keys, empty values and Hindi duplicates
+        dedupe: Drop duplicate records and hoist repeated page-header fields
+        fit_budget: Enforce the token budget; off for inputs that must reach the model whole
+            (analyses being consolidated), which are kept small by their callers instead
+        record_stats: Count this encoding in prompt_encoding_stats (off for sizing-only encodes)
+
+    Returns:
+        Encoded string (indent=2 JSON when PROMPT_COMPACT_ENCODING is off)
+    """
+    if not PROMPT_COMPACT_ENCODING:
+        return baseline_encoding(data)
+
+    encoded_data = prune(data) if prune_fields else data
+    if dedupe and isinstance(encoded_data, list):
+        encoded_data = dedupe_records(encoded_data)
+    truncated = False
+    if fit_budget:
+        encoded_data, truncated = _fit_budget(encoded_data, token_budget or PROMPT_DATA_TOKEN_BUDGET)
+    encoded = _minify(encoded_data)
+    if not record_stats:
+        return encoded
+
+    prompt_encoding_stats["prompts"] += 1
+    prompt_encoding_stats["baseline_chars"] += len(baseline_encoding(data))
+    prompt_encoding_stats["encoded_chars"] += len(encoded)
+    if truncated:
+        prompt_encoding_stats["truncated"] += 1
+    return encoded
+
+
+def encoding_stats() -> dict:
+    stats = dict(prompt_encoding_stats)
+    baseline = stats["baseline_chars"]
+    stats["baseline_tokens_est"] = math.ceil(baseline / CHARS_PER_TOKEN)
+    stats["encoded_tokens_est"] = math.ceil(stats["encoded_chars"] / CHARS_PER_TOKEN)
+    stats["savings_pct"] = round(100 * (1 - stats["encoded_chars"] / baseline), 1) if baseline else 0.0
+    return stats
+
+
+def corpus_report(root: str = OUTPUT_DIR) -> dict:
+    """
+    Compare baseline and compact encodings over every extraction output under `root`.
+
+    Returns:
+        {"files": [...per-file sizes...], "totals": {...}}
+    """
+    files = []
+    totals = {"files": 0, "baseline_tokens_est": 0, "compact_tokens_est": 0, "minified_only_tokens_est": 0}
+    for path in sorted(glob.glob(os.path.join(root, "**", "*.json"), recursive=True)):
+        try:
+            with open(path, "r", encoding="utf-8") as fh:
+                data = json.load(fh)
+        except (OSError, json.JSONDecodeError):
+            continue
+        baseline = estimate_tokens(baseline_encoding(data))
+        minified = estimate_tokens(_minify(data))
+        compact = estimate_tokens(encode_for_prompt(data, fit_budget=False, record_stats=False))
+        files.append({
+            "file": os.path.relpath(path, root),
+            "baseline_tokens_est": baseline,
+            "minified_only_tokens_est": minified,
+            "compact_tokens_est": compact,
+            "savings_pct": round(100 * (1 - compact / baseline), 1) if baseline else 0.0
+        })
+        totals["files"] += 1
+        totals["baseline_tokens_est"] += baseline
+        totals["minified_only_tokens_est"] += minified
+        totals["compact_tokens_est"] += compact
+    if totals["baseline_tokens_est"]:
+        totals["savings_pct"] = round(100 * (1 - totals["compact_tokens_est"] / totals["baseline_tokens_est"]), 1)
+    return {"files": files, "totals": totals}
+
+
+if __name__ == "__main__":
+    report = corpus_report(sys.argv[1] if len(sys.argv) > 1 else OUTPUT_DIR)
+    for entry in report["files"]:
+        print(f"{entry['baseline_tokens_est']:>8} -> {entry['compact_tokens_est']:>8}  ({entry['savings_pct']:>5}%)  {entry['file']}")
+    totals = report["totals"]
+    print(
+        f"📊 {totals['files']} files: {totals['baseline_tokens_est']} -> {totals['compact_tokens_est']} tokens (est.), "
+        f"minify alone {totals['minified_only_tokens_est']}, savings {totals.get('savings_pct', 0.0)}%"
+    )
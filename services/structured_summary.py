@@ -1,12 +1,30 @@
+import os
 import json
-from typing import Literal
+import hashlib
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, List, Literal, Optional, Tuple
 
-from services.analyze import analyze_with_claude, extract_json_from_response
+from config.settings import BEDROCK_MODEL_ID, DOC_TYPE_AWARE_PROMPTS
+from models.schemas import LifeSummary, PropertyCasualtySummary
+from services.analyze import analyze_structured, make_tool
+from services.prompt_encoding import encode_for_prompt
+from services.user_kyc import APPLICANT_KEY_VARIANTS
+from services.summary_prefill import (
+    prefill_summary,
+    trim_for_prompt,
+    record_prefill,
+    SUMMARY_KEY_VARIANTS,
+    RELEVANT_SECTIONS,
+    PREFILL_SECTIONS
+)
 
+# Illustrative schema type -> JSON Schema type for partial summary tools
+_SPEC_JSON_TYPES = {"string": "string", "int": "integer", "bool": "boolean", "object": "object"}
 
-def build_structured_prompt(insurance_type: Literal["life", "property_casualty"], extracted_data: dict) -> str:
-    data_str = json.dumps(extracted_data, indent=2)
 
+def get_summary_spec(insurance_type: Literal["life", "property_casualty"]) -> tuple:
+    """Return (instructions, schema) of the per-file structured summary for an insurance type."""
     if insurance_type == "life":
         schema = {
             "applicant": {
@@ -74,6 +92,34 @@ def build_structured_prompt(insurance_type: Literal["life", "property_casualty"]
             "Extract the requested property & casualty applicant, property details, property features, "
             "and risk factors from the provided data. If a field is not found, use null."
         )
+    return instructions, schema
+
+
+def _restrict_schema(schema: dict, fields: List[str]) -> dict:
+    """Only the "section.field" paths in `fields`, keeping the schema's section order."""
+    wanted = set(fields)
+    restricted = {}
+    for section, section_fields in schema.items():
+        kept = {k: v for k, v in section_fields.items() if f"{section}.{k}" in wanted}
+        if kept:
+            restricted[section] = kept
+    return restricted
+
+
+def build_structured_prompt(
+    insurance_type: Literal["life", "property_casualty"],
+    extracted_data: dict,
+    fields: Optional[List[str]] = None
+) -> str:
+    """
+    Args:
+        fields: "section.field" paths to ask for; None asks for the whole summary
+    """
+    data_str = encode_for_prompt(extracted_data)
+    instructions, schema = get_summary_spec(insurance_type)
+    if fields is not None:
+        schema = _restrict_schema(schema, fields)
+        instructions += " Only the fields below are still needed; the others were already filled."
 
     return (
         f"You are an expert underwriter assistant. {instructions}\n\n"
@@ -83,13 +129,189 @@ def build_structured_prompt(insurance_type: Literal["life", "property_casualty"]
     )
 
 
-async def run_structured_summary_prompt(insurance_type: Literal["life", "property_casualty"], extracted_data: dict) -> dict:
-    prompt = build_structured_prompt(insurance_type, extracted_data)
-    result = await analyze_with_claude(prompt)
+def partial_summary_tool(insurance_type: Literal["life", "property_casualty"], fields: List[str]) -> dict:
+    """Forced-call tool asking only for the given "section.field" paths."""
+    _, schema = get_summary_spec(insurance_type)
+    properties = {
+        section: {
+            "type": "object",
+            "properties": {
+                field: {"type": [_SPEC_JSON_TYPES[spec.split()[0]], "null"]}
+                for field, spec in section_fields.items()
+            }
+        }
+        for section, section_fields in _restrict_schema(schema, fields).items()
+    }
+    return make_tool(
+        "record_structured_summary",
+        "Record the requested structured summary fields; use null for anything not found.",
+        {"type": "object", "properties": properties, "required": list(properties)}
+    )
+
+
+def _fill_missing(prefilled: dict, answer: Any) -> dict:
+    """Pre-filled summary with the model's answer for the fields still None."""
+    merged = {section: dict(fields) for section, fields in prefilled.items()}
+    if isinstance(answer, dict):
+        for section, fields in answer.items():
+            if section in merged and isinstance(fields, dict):
+                for field, value in fields.items():
+                    if field in merged[section] and merged[section][field] is None:
+                        merged[section][field] = value
+    return merged
+
+
+async def run_structured_summary_prompt(
+    insurance_type: Literal["life", "property_casualty"],
+    extracted_data: dict,
+    use_cache: bool = True,
+    doc_type: Optional[str] = None
+) -> dict:
+    """
+    Structured summary of one document.
+
+    Fields found under known extraction keys are pre-filled locally; only the missing
+    ones are asked from Claude, over the data without the consumed keys. When nothing
+    relevant to the document type is missing, no call is made.
+    """
+    prefilled, missing, consumed = prefill_summary(insurance_type, extracted_data, doc_type)
+    filled = sum(value is not None for fields in prefilled.values() for value in fields.values())
+    if not missing:
+        record_prefill(filled, 0, skipped_call=True)
+        print(f"🧩 Structured summary pre-filled locally ({filled} fields), no Claude call")
+        return normalize_summary(insurance_type, prefilled)
+
+    record_prefill(filled, len(missing), skipped_call=False)
+    # the open-ended extras of a prompted section travel with it
+    prompted_sections = dict.fromkeys(path.split(".")[0] for path in missing)
+    fields = missing + [f"{section}.extras" for section in prompted_sections if "extras" in prefilled.get(section, {})]
+    if filled:
+        print(f"🧩 {filled} summary fields pre-filled, asking Claude for {len(missing)}")
+    prompt = build_structured_prompt(insurance_type, trim_for_prompt(extracted_data, consumed, fields), fields)
+    result = await analyze_structured(
+        prompt,
+        partial_summary_tool(insurance_type, fields),
+        lambda data: validate_summary(insurance_type, _fill_missing(prefilled, data)),
+        use_cache=use_cache
+    )
     if not result.get("success"):
         raise RuntimeError(result.get("error", "Claude analysis failed"))
-    parsed = extract_json_from_response(result["analysis"])
-    return parsed
+    return normalize_summary(insurance_type, _fill_missing(prefilled, result["analysis"]))
+
+
+def summary_model(insurance_type: str):
+    return LifeSummary if insurance_type == "life" else PropertyCasualtySummary
+
+
+def summary_tool(insurance_type: Literal["life", "property_casualty"]) -> dict:
+    """Forced-call tool whose input schema is the Pydantic summary model."""
+    return make_tool(
+        "record_structured_summary",
+        "Record the structured summary fields; use null for anything not found.",
+        summary_model(insurance_type).model_json_schema()
+    )
+
+
+def normalize_summary(insurance_type: Literal["life", "property_casualty"], parsed: dict) -> dict:
+    """Validate/normalize a parsed summary against the Pydantic schemas for consistent output."""
+    return summary_model(insurance_type)(**parsed).model_dump()
+
+
+def validate_summary(insurance_type: Literal["life", "property_casualty"], parsed: Any) -> Tuple[bool, str]:
+    try:
+        normalize_summary(insurance_type, parsed)
+        return True, ""
+    except Exception as e:
+        return False, f"Summary validation failed: {str(e)}"
+
+
+# Bump when summaries change in a way the spec, pre-fill tables and model do not show
+# (prompt wording, normalization) so stored summaries are recomputed
+SUMMARY_REVISION = 1
+
+
+@lru_cache(maxsize=None)
+def summary_version(insurance_type: str, producer: str = "prompt", document_type: Optional[str] = None) -> str:
+    """
+    Fingerprint of what produced a stored summary; the producer is part of it.
+
+    Args:
+        producer: "prompt" (per-file summary prompt with rule-based pre-fill) or "fused"
+            (summary half of services.fused_analysis)
+        document_type: Detected document type; selects the fused prompt, unused for "prompt"
+    """
+    if producer == "fused":
+        # imported here: fused_analysis builds on this module
+        from services.fused_analysis import fused_prompt_version
+        return fused_prompt_version(insurance_type, document_type if DOC_TYPE_AWARE_PROMPTS else None)
+    material = json.dumps([
+        SUMMARY_REVISION,
+        BEDROCK_MODEL_ID,
+        get_summary_spec(insurance_type),
+        summary_model(insurance_type).model_json_schema(),
+        SUMMARY_KEY_VARIANTS,
+        RELEVANT_SECTIONS,
+        PREFILL_SECTIONS,
+        APPLICANT_KEY_VARIANTS
+    ], sort_keys=True)
+    return f"prompt-{SUMMARY_REVISION}-{hashlib.sha256(material.encode('utf-8')).hexdigest()[:16]}"
+
+
+def summary_file_path(output_dir: str, source_file: str, insurance_type: str) -> str:
+    """Where the per-file summary of `source_file` is stored, next to its analysis."""
+    base_name = os.path.splitext(os.path.basename(source_file))[0]
+    return os.path.join(output_dir, f"{base_name}_summary_{insurance_type}.json")
+
+
+def save_file_summary(
+    output_dir: str,
+    source_file: str,
+    insurance_type: str,
+    summary: dict,
+    source_sha256: str,
+    document_type: Optional[str] = None,
+    producer: str = "prompt"
+) -> str:
+    """
+    Persist one file's normalized summary; returns the local path.
+
+    Args:
+        producer: "prompt" or "fused", see summary_version
+    """
+    path = summary_file_path(output_dir, source_file, insurance_type)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            "source_file": os.path.basename(source_file),
+            "source_sha256": source_sha256,
+            "summary_timestamp": datetime.now().isoformat(),
+            "insurance_type": insurance_type,
+            "summary_producer": producer,
+            "summary_version": summary_version(insurance_type, producer, document_type),
+            "document_type": document_type,
+            "summary": summary
+        }, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def load_stored_summary(path: str, source_sha256: str, insurance_type: str) -> Optional[dict]:
+    """
+    Return the stored record ("summary", "document_type", ...) at `path` if it was produced
+    from the same source content by the current version of the prompt that produced it.
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            stored = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    if stored.get("source_sha256") != source_sha256 or not isinstance(stored.get("summary"), dict):
+        return None
+    producer = stored.get("summary_producer")
+    if producer not in ("prompt", "fused") or stored.get("summary_version") != summary_version(
+        insurance_type, producer, stored.get("document_type")
+    ):
+        print(f"🔁 Stored summary {os.path.basename(path)} predates the current summary version, recomputing")
+        return None
+    return stored
 
 
 def build_consolidation_prompt(
@@ -177,13 +399,15 @@ def build_consolidation_prompt(
 
 async def consolidate_structured_summaries(
     insurance_type: Literal["life", "property_casualty"],
-    per_file_summaries: list[dict]
+    per_file_summaries: list[dict],
+    use_cache: bool = True
 ) -> dict:
     prompt = build_consolidation_prompt(insurance_type, per_file_summaries)
-    result = await analyze_with_claude(prompt)
+    result = await analyze_structured(
+        prompt, summary_tool(insurance_type), lambda data: validate_summary(insurance_type, data), use_cache=use_cache
+    )
     if not result.get("success"):
         raise RuntimeError(result.get("error", "Claude consolidation failed"))
-    parsed = extract_json_from_response(result["analysis"])
-    return parsed
+    return result["analysis"]
 
 
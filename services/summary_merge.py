@@ -0,0 +1,187 @@
+"""
+Deterministic merge of per-file structured summaries.
+
+Most fields of LifeSummary / PropertyCasualtySummary are filled by at most one
+document, or by several documents that agree, so the merge is done locally:
+values are normalized (whitespace, null-like strings, ints, booleans), null
+values are ignored, and when documents disagree the value from the document
+type with the highest priority for that section wins. Only fields where the
+top-priority documents still disagree are sent to Claude, as a small
+{field: candidates} payload instead of every summary.
+"""
+import re
+import json
+from typing import Any, Dict, List, Optional, Tuple
+from services.analyze import analyze_structured, make_tool
+from services.structured_summary import normalize_summary, summary_model
+from services.summary_prefill import field_kind, normalize_value
+
+# Per summary section (or "section.field"), the document types to trust first; unlisted types rank after these
+FIELD_SOURCE_PRIORITY = {
+    "applicant": ["id_document", "proposal_form", "acord_form", "bank_statement", "salary_slip", "lab_report", "invoice"],
+    "applicant.address": ["proposal_form", "acord_form", "id_document", "bank_statement", "salary_slip", "invoice"],
+    "policyDetails": ["proposal_form", "acord_form"],
+    "medicalDisclosure": ["lab_report", "proposal_form"],
+    "lifestyleAssessment": ["proposal_form", "lab_report"],
+    "propertyDetails": ["acord_form", "proposal_form", "invoice"],
+    "propertyFeatures": ["acord_form", "proposal_form", "invoice"],
+    "riskFactors": ["acord_form", "proposal_form"],
+}
+
+_NUMERIC_LIKE = re.compile(r"^\d[\d ]*(?: [a-z]+)?$")
+# Extra words that reverse a value instead of completing it ("smoker" vs "non smoker")
+_NEGATION_WORDS = {"no", "non", "not", "never", "none", "nil", "ex", "former", "without"}
+
+
+def _comparable(value: Any) -> str:
+    if isinstance(value, str):
+        return re.sub(r"[^\w]+", " ", value.lower()).strip()
+    return json.dumps(value, sort_keys=True)
+
+
+def _priority_order(path: str) -> List[str]:
+    return FIELD_SOURCE_PRIORITY.get(path) or FIELD_SOURCE_PRIORITY.get(path.split(".")[0], [])
+
+
+def _priority(path: str, doc_type: Optional[str]) -> int:
+    """Rank of a document type for a field; lower is better."""
+    order = _priority_order(path)
+    return order.index(doc_type) if doc_type in order else len(order)
+
+
+def _is_numeric_like(text: str) -> bool:
+    """A number with at most one unit word ("70", "5 lakh", "1 50 000") in _comparable form."""
+    return bool(_NUMERIC_LIKE.match(text))
+
+
+def _resolve_locally(path: str, kind: str, candidates: List[Dict[str, Any]]) -> Tuple[bool, Any]:
+    """
+    (resolved, value) for one field's non-null candidates, best priority first.
+
+    Agreeing values, a single top-priority value, or (for non-numeric text) a value
+    whose words include every other value's words (e.g. a fuller name) resolve
+    locally, unless the extra words negate it; anything else is a conflict.
+    """
+    if kind == "dict":
+        merged: Dict[str, Any] = {}
+        for candidate in reversed(candidates):
+            merged.update(candidate["value"])
+        return True, merged
+
+    distinct: Dict[str, Dict[str, Any]] = {}
+    for candidate in candidates:
+        distinct.setdefault(_comparable(candidate["value"]), candidate)
+    if len(distinct) == 1:
+        return True, candidates[0]["value"]
+
+    best = candidates[0]["priority"]
+    top = {_comparable(c["value"]) for c in candidates if c["priority"] == best}
+    if len(top) == 1 and best < len(_priority_order(path)):
+        return True, candidates[0]["value"]
+
+    if kind == "str" and not any(_is_numeric_like(key) for key in distinct):
+        tokens = {key: set(key.split()) for key in distinct}
+        fullest = max(distinct, key=lambda key: len(tokens[key]))
+        if all(
+            tokens[key] <= tokens[fullest] and not (tokens[fullest] - tokens[key]) & _NEGATION_WORDS
+            for key in distinct
+        ):
+            return True, distinct[fullest]["value"]
+    return False, None
+
+
+def get_conflict_prompt(insurance_type: str, conflicts: Dict[str, List[Dict[str, Any]]]) -> str:
+    return f"""You consolidate structured {insurance_type.replace('_', ' ')} insurance data for ONE case. The documents of the case disagree on the fields below; each field lists the candidate values with the document type and file they came from.
+
+<conflicts>
+{json.dumps(conflicts, ensure_ascii=False, separators=(",", ":"))}
+</conflicts>
+
+For every field, return the single most reliable, specific and consistent value (you may normalize its format, but do not invent data). Use null only if none of the candidates is usable.
+Return ONLY a JSON object whose keys are exactly the field names above."""
+
+
+def _conflict_tool(conflicts: Dict[str, List[Dict[str, Any]]]) -> dict:
+    return make_tool(
+        "record_resolved_fields",
+        "Record the chosen value for each conflicting field.",
+        {"type": "object", "properties": {path: {} for path in conflicts}, "required": list(conflicts)}
+    )
+
+
+async def merge_structured_summaries(
+    insurance_type: str,
+    entries: List[Dict[str, Any]],
+    use_cache: bool = True
+) -> Tuple[dict, dict]:
+    """
+    Merge per-file summaries field by field, asking Claude only about true conflicts.
+
+    Args:
+        entries: [{"source_file", "summary", "document_type"}] with normalized summaries
+
+    Returns:
+        (merged summary, stats) where stats counts fields merged locally and by the model
+    """
+    model: type = summary_model(insurance_type)
+    merged: Dict[str, Dict[str, Any]] = {}
+    kinds: Dict[str, str] = {}
+    conflicts: Dict[str, List[Dict[str, Any]]] = {}
+    stats = {"fields": 0, "empty": 0, "local": 0, "model": 0, "model_calls": 0, "model_fallback": 0, "conflicts": []}
+
+    for section, section_field in model.model_fields.items():
+        section_model: type = section_field.annotation
+        merged[section] = {}
+        for field, field_info in section_model.model_fields.items():
+            path = f"{section}.{field}"
+            kind = kinds[path] = field_kind(field_info.annotation)
+            stats["fields"] += 1
+            candidates = []
+            for entry in entries:
+                value = normalize_value(((entry.get("summary") or {}).get(section) or {}).get(field), kind)
+                if value is not None:
+                    candidates.append({
+                        "value": value,
+                        "document_type": entry.get("document_type"),
+                        "source_file": entry.get("source_file"),
+                        "priority": _priority(path, entry.get("document_type"))
+                    })
+            candidates.sort(key=lambda c: c["priority"])
+            if not candidates:
+                merged[section][field] = None
+                stats["empty"] += 1
+                continue
+            resolved, value = _resolve_locally(path, kind, candidates)
+            if resolved:
+                merged[section][field] = value
+                stats["local"] += 1
+            else:
+                conflicts[path] = candidates
+
+    if conflicts:
+        stats["conflicts"] = list(conflicts)
+        payload = {
+            path: [{k: c[k] for k in ("value", "document_type", "source_file")} for c in candidates]
+            for path, candidates in conflicts.items()
+        }
+        print(f"⚖️ {len(conflicts)} conflicting summary fields sent to Claude: {', '.join(conflicts)}")
+        stats["model_calls"] += 1
+        result = await analyze_structured(
+            get_conflict_prompt(insurance_type, payload),
+            _conflict_tool(payload),
+            lambda data: (True, "") if all(path in data for path in payload) else (False, f"Missing fields: {[p for p in payload if p not in data]}"),
+            use_cache=use_cache
+        )
+        chosen = result["analysis"] if result.get("success") else {}
+        for path, candidates in conflicts.items():
+            section, field = path.split(".", 1)
+            value = normalize_value(chosen.get(path), kinds[path]) if path in chosen else None
+            if value is None:
+                # the model failed or gave nothing usable: keep the best-priority candidate
+                value = candidates[0]["value"]
+                stats["model_fallback"] += 1
+            else:
+                stats["model"] += 1
+            merged[section][field] = value
+
+    return normalize_summary(insurance_type, merged), stats
@@ -0,0 +1,204 @@
+"""
+Rule-based pre-fill of structured summary fields.
+
+Many LifeSummary / PropertyCasualtySummary fields sit verbatim in the
+extraction under a predictable key: applicant name, date of birth, father's
+name and address on ID documents (the key variants user_kyc already uses), and
+snake_case keys such as year_built or flood_zone elsewhere. Those are filled
+here without a model call, but only for document types where those keys are
+unambiguous (PREFILL_SECTIONS). Only the still-missing fields go to Claude,
+with the consumed keys removed from the data; a document whose relevant fields
+are all filled locally needs no call at all.
+"""
+import re
+from typing import Any, Dict, List, Optional, Set, Tuple, get_args, get_origin
+from models.schemas import LifeSummary, PropertyCasualtySummary
+from services.user_kyc import APPLICANT_KEY_VARIANTS, normalize_records, _extract_father_from_aadhaar_address
+from services.prompt_encoding import prune
+
+# Summary field -> extraction keys (lower-case) besides the field's own snake_case name
+SUMMARY_KEY_VARIANTS = {
+    "policyDetails.policyType": ["policy_type", "type_of_policy", "plan_type"],
+    "policyDetails.coverageAmount": ["sum_assured", "sum_insured", "coverage_amount", "cover_amount"],
+    "policyDetails.planName": ["plan_name", "product_name"],
+    "policyDetails.policyTerms": ["policy_term", "policy_terms"],
+    "medicalDisclosure.weight": ["weight", "weight_kg"],
+    "medicalDisclosure.height": ["height", "height_cm"],
+    "lifestyleAssessment.smokingStatus": ["smoking_status", "smoker", "tobacco_use"],
+    "lifestyleAssessment.alcoholConsumption": ["alcohol_consumption", "alcohol"],
+    "propertyDetails.propertyAddress": ["property_address", "risk_address", "location_address"],
+    "propertyDetails.propertyType": ["property_type", "occupancy_type"],
+    "propertyDetails.numberOfStories": ["number_of_stories", "no_of_stories", "no_of_floors", "number_of_floors"],
+    "propertyDetails.yearBuilt": ["year_built", "year_of_construction"],
+    "propertyFeatures.hasCentralAir": ["central_air", "has_central_air"],
+    "propertyFeatures.hasFireExtinguisher": ["fire_extinguisher", "fire_extinguishers", "has_fire_extinguisher"],
+    "propertyFeatures.hasSwimmingPool": ["swimming_pool", "has_swimming_pool"],
+    "riskFactors.hasPreviousClaim": ["previous_claim", "previous_claims", "prior_claims", "has_previous_claim"],
+}
+
+# Summary sections a document type can inform; other types may inform every section
+RELEVANT_SECTIONS = {
+    "id_document": ["applicant"],
+}
+
+# Sections pre-filled from extraction keys, per document type whose keys are unambiguous
+# there (a "weight" on an invoice is not the applicant's). Other types are left to the model.
+PREFILL_SECTIONS = {
+    "id_document": ["applicant"],
+    "proposal_form": ["policyDetails", "medicalDisclosure", "lifestyleAssessment"],
+    "lab_report": ["medicalDisclosure"],
+    "acord_form": ["propertyDetails", "propertyFeatures", "riskFactors"],
+}
+
+# Open-ended fields that are never required for a summary to count as complete
+_OPTIONAL_FIELDS = {"extras"}
+
+_NULL_STRINGS = {"", "null", "none", "n/a", "na", "nil", "not available", "not found", "unknown", "-"}
+_TRUE_STRINGS = {"true", "yes", "y", "1", "present", "available"}
+_FALSE_STRINGS = {"false", "no", "n", "0", "absent", "not present"}
+
+# Cumulative pre-fill outcomes for /metrics
+summary_prefill_stats = {"files": 0, "fields_prefilled": 0, "fields_prompted": 0, "model_calls_skipped": 0}
+
+
+def field_kind(annotation: Any) -> str:
+    """'int', 'bool', 'dict' or 'str' for an Optional[...] model field annotation."""
+    args = [a for a in get_args(annotation) if a is not type(None)] or [annotation]
+    base = args[0]
+    if get_origin(base) in (dict, Dict) or base in (dict, Dict):
+        return "dict"
+    if base is bool:
+        return "bool"
+    if base is int:
+        return "int"
+    return "str"
+
+
+def normalize_value(value: Any, kind: str) -> Any:
+    """Normalized value for one field, or None when it carries no information."""
+    if value is None:
+        return None
+    if kind == "dict":
+        return value if isinstance(value, dict) and value else None
+    if isinstance(value, str):
+        value = re.sub(r"\s+", " ", value).strip()
+        if value.lower() in _NULL_STRINGS:
+            return None
+    if kind == "bool":
+        if isinstance(value, bool):
+            return value
+        text = str(value).strip().lower()
+        if text in _TRUE_STRINGS:
+            return True
+        if text in _FALSE_STRINGS:
+            return False
+        return None
+    if kind == "int":
+        if isinstance(value, bool):
+            return None
+        if isinstance(value, (int, float)):
+            return int(value)
+        match = re.search(r"-?\d+", str(value).replace(",", ""))
+        return int(match.group(0)) if match else None
+    if isinstance(value, (dict, list)):
+        return None
+    return str(value)
+
+
+def summary_fields(insurance_type: str) -> List[Tuple[str, str, str]]:
+    """(section, field, kind) for every leaf field of the insurance type's summary model."""
+    model = LifeSummary if insurance_type == "life" else PropertyCasualtySummary
+    return [
+        (section, field, field_kind(info.annotation))
+        for section, section_info in model.model_fields.items()
+        for field, info in section_info.annotation.model_fields.items()
+    ]
+
+
+def _snake_case(name: str) -> str:
+    return re.sub(r"(?<!^)(?=[A-Z])", "_", name).lower()
+
+
+def _candidate_keys(path: str) -> List[str]:
+    """Extraction keys that can carry the value of one "section.field" path."""
+    section, field = path.split(".", 1)
+    if section == "applicant":
+        return APPLICANT_KEY_VARIANTS.get(field, [])
+    snake = _snake_case(field)
+    return [snake] + [v for v in SUMMARY_KEY_VARIANTS.get(path, []) if v != snake]
+
+
+def _first_with_key(records: List[Dict[str, Any]], variants: List[str], kind: str) -> Tuple[Any, Optional[str]]:
+    for record in records:
+        for key in variants:
+            value = normalize_value(record.get(key), kind)
+            if value is not None:
+                return value, key
+    return None, None
+
+
+def prefill_summary(
+    insurance_type: str,
+    extracted_data: Any,
+    doc_type: Optional[str] = None
+) -> Tuple[Dict[str, Dict[str, Any]], List[str], Set[str]]:
+    """
+    Fill summary fields from known extraction keys.
+
+    Only the sections in PREFILL_SECTIONS for the document type are pre-filled (applicant
+    fields from ID documents only); everything else is left to the model.
+
+    Returns:
+        (partial summary with None for unfilled fields, missing "section.field" paths
+         relevant to the document type, extraction keys consumed by the pre-fill)
+    """
+    records = normalize_records(extracted_data)
+    relevant = RELEVANT_SECTIONS.get(doc_type)
+    prefillable = PREFILL_SECTIONS.get(doc_type, [])
+    summary: Dict[str, Dict[str, Any]] = {}
+    missing: List[str] = []
+    consumed: Set[str] = set()
+    for section, field, kind in summary_fields(insurance_type):
+        summary.setdefault(section, {})[field] = None
+        if relevant is not None and section not in relevant:
+            continue
+        path = f"{section}.{field}"
+        value, key = None, None
+        if section in prefillable and kind != "dict":
+            if field == "fathersName" and doc_type == "id_document":
+                # S/O on the Aadhaar address first, as generate_user_kyc does
+                value = normalize_value(_extract_father_from_aadhaar_address(records), kind)
+            if value is None:
+                value, key = _first_with_key(records, _candidate_keys(path), kind)
+        summary[section][field] = value
+        if key:
+            consumed.add(key)
+        if value is None and field not in _OPTIONAL_FIELDS:
+            missing.append(path)
+    return summary, missing, consumed
+
+
+def trim_for_prompt(extracted_data: Any, consumed_keys: Set[str], prompted_fields: List[str]) -> Any:
+    """
+    Pruned extraction without the keys whose values were already pre-filled.
+
+    Keys that can also carry one of the prompted fields are kept for the model.
+    """
+    needed = {key for path in prompted_fields for key in _candidate_keys(path)}
+    dropped = consumed_keys - needed
+
+    def drop(record: Any) -> Any:
+        if isinstance(record, dict):
+            return {k: v for k, v in record.items() if str(k).lower() not in dropped}
+        return record
+
+    data = extracted_data if isinstance(extracted_data, list) else [extracted_data]
+    return prune([drop(record) for record in data])
+
+
+def record_prefill(filled: int, prompted: int, skipped_call: bool) -> None:
+    summary_prefill_stats["files"] += 1
+    summary_prefill_stats["fields_prefilled"] += filled
+    summary_prefill_stats["fields_prompted"] += prompted
+    if skipped_call:
+        summary_prefill_stats["model_calls_skipped"] += 1
@@ -0,0 +1,108 @@
+"""
+Local parsing of CSV and Excel uploads into flat-json records.
+
+Rows are read and yielded one at a time (csv module / openpyxl read-only
+mode), so large loss-run spreadsheets are never held in memory whole.
+"""
+import csv
+import json
+import re
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+# Extensions parsed locally; legacy .xls still goes through Nanonets
+TABULAR_EXTENSIONS = {".csv", ".xlsx"}
+
+
+def _normalize_header(value: Any, index: int, seen: dict) -> str:
+    """snake_case a header cell the way flat-json keys look; de-duplicate repeats."""
+    key = re.sub(r"[^0-9a-zA-Z]+", "_", str(value if value is not None else "")).strip("_").lower()
+    if not key:
+        key = f"column_{index + 1}"
+    count = seen.get(key, 0) + 1
+    seen[key] = count
+    return key if count == 1 else f"{key}_{count}"
+
+
+def _cell_value(value: Any) -> Any:
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _rows_to_records(rows: Iterable[Tuple[Any, ...]], extra: Optional[dict] = None) -> Iterator[dict]:
+    """First non-empty row is the header; every later non-empty row becomes one record."""
+    header: Optional[List[str]] = None
+    for row in rows:
+        cells = [_cell_value(v) for v in row]
+        if not any(c is not None for c in cells):
+            continue
+        if header is None:
+            seen: dict = {}
+            header = [_normalize_header(c, i, seen) for i, c in enumerate(cells)]
+            continue
+        record = dict(extra) if extra else {}
+        for index, cell in enumerate(cells):
+            if cell is None:
+                continue
+            if index >= len(header):
+                header.append(f"column_{index + 1}")
+            record[header[index]] = cell
+        yield record
+
+
+def iter_csv_records(file_path: str) -> Iterator[dict]:
+    with open(file_path, "r", encoding="utf-8-sig", errors="replace", newline="") as fh:
+        sample = fh.read(8192)
+        fh.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+        except csv.Error:
+            dialect = csv.excel
+        yield from _rows_to_records(csv.reader(fh, dialect))
+
+
+def iter_xlsx_records(file_path: str) -> Iterator[dict]:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        multiple_sheets = len(workbook.sheetnames) > 1
+        for sheet in workbook.worksheets:
+            extra = {"sheet_name": sheet.title} if multiple_sheets else None
+            yield from _rows_to_records(sheet.iter_rows(values_only=True), extra)
+    finally:
+        workbook.close()
+
+
+def iter_tabular_records(file_path: str) -> Iterator[dict]:
+    if file_path.lower().endswith(".csv"):
+        return iter_csv_records(file_path)
+    return iter_xlsx_records(file_path)
+
+
+def write_records_json(records: Iterable[dict], out_path: str, preview_rows: int) -> Tuple[int, List[dict]]:
+    """
+    Stream records into a JSON array file, formatted like json.dump(..., indent=2).
+
+    Returns:
+        (record count, first `preview_rows` records)
+    """
+    count = 0
+    preview: List[dict] = []
+    with open(out_path, "w", encoding="utf-8") as fh:
+        fh.write("[")
+        for record in records:
+            fh.write(",\n  " if count else "\n  ")
+            fh.write(json.dumps(record, ensure_ascii=False, indent=2, default=str).replace("\n", "\n  "))
+            if count < preview_rows:
+                preview.append(record)
+            count += 1
+        fh.write("\n]" if count else "]")
+    return count, preview
@@ -3,6 +3,7 @@ import json
 import re
 from typing import List, Dict, Any
 from config.settings import OUTPUT_DIR
+from services.doc_classification import classify_verification_documents, verification_dir_for
 
 
 # key variants used across the function (lower-case)
@@ -54,6 +55,24 @@ _KEY_VARIANTS = {
 }
 
 
+def _variants(*groups: str) -> List[str]:
+    merged: List[str] = []
+    for group in groups:
+        for key in _KEY_VARIANTS[group]:
+            if key not in merged:
+                merged.append(key)
+    return merged
+
+
+# Structured-summary applicant fields -> ID document keys, in generate_user_kyc priority order
+APPLICANT_KEY_VARIANTS = {
+    "name": _variants("aadhaar_name", "voter_name", "pan_name", "dl_name", "passport_name"),
+    "fathersName": _variants("aadhaar_father", "voter_father", "pan_father", "dl_father") + ["father_legal_guardian_name"],
+    "dateOfBirth": _variants("passport_dob", "voter_dob", "pan_dob") + ["birth_date"],
+    "address": _variants("aadhaar_address", "voter_address", "dl_address"),
+}
+
+
 
 def _load_records(path: str) -> List[Dict[str, Any]]:
     """Load JSON file and return list of dict records (each with lower-cased keys)."""
@@ -64,6 +83,11 @@ def _load_records(path: str) -> List[Dict[str, Any]]:
             data = json.load(fh)
     except Exception:
         return []
+    return normalize_records(data)
+
+
+def normalize_records(data: Any) -> List[Dict[str, Any]]:
+    """Extracted flat-json (a record or a list of them) as dict records with lower-cased keys."""
     records: List[Dict[str, Any]] = []
     if isinstance(data, dict):
         data = [data]
@@ -107,9 +131,9 @@ def _extract_father_from_aadhaar_address(records: List[Dict[str, Any]]):
     return _first_from_records(records, _KEY_VARIANTS["aadhaar_father"])
 
 
-def generate_user_kyc(base_dir: str | None = None, submission_id: str | None = None) -> None:
+def build_user_kyc(records_by_type: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
     """
-    Consolidate KYC fields from documents in verification_documents into user_kyc.json.
+    Consolidate KYC fields from classified identity document records.
 
     Priority:
       Full Name: Aadhaar > Voter > PAN > DL > Passport
@@ -119,26 +143,19 @@ def generate_user_kyc(base_dir: str | None = None, submission_id: str | None = N
       DL No.: Driving Licence only
       DOB: Passport > Aadhaar > Voter > PAN > DL
       Address: Aadhaar > Voter > PAN > DL > Passport
-    
-    Args:
-        base_dir: Directory containing verification documents (aadhaar.json, pan.json, etc.)
-        submission_id: Optional submission ID to use submission-specific directory
-    """
-    if base_dir is None:
-        base_root = os.path.abspath(os.path.join(OUTPUT_DIR, os.pardir))
-        if submission_id:
-            base_dir = os.path.join(base_root, "verification_documents", submission_id)
-        else:
-            base_dir = os.path.join(base_root, "verification_documents")
 
-    os.makedirs(base_dir, exist_ok=True)
+    Args:
+        records_by_type: Doc type ("aadhaar", "voter", "pan", "driving_licence", "passport")
+            -> records with lower-cased keys (see normalize_records)
 
-    # Load records (normalized lower-case keys)
-    aadhaar_records = _load_records(os.path.join(base_dir, "aadhaar.json"))
-    voter_records = _load_records(os.path.join(base_dir, "voter.json"))
-    pan_records = _load_records(os.path.join(base_dir, "pan.json"))
-    dl_records = _load_records(os.path.join(base_dir, "driving_licence.json"))
-    passport_records = _load_records(os.path.join(base_dir, "passport.json"))
+    Returns:
+        The user_kyc.json object
+    """
+    aadhaar_records = records_by_type.get("aadhaar", [])
+    voter_records = records_by_type.get("voter", [])
+    pan_records = records_by_type.get("pan", [])
+    dl_records = records_by_type.get("driving_licence", [])
+    passport_records = records_by_type.get("passport", [])
 
     # Helper to assemble passport full name
     def _passport_fullname():
@@ -217,6 +234,11 @@ def generate_user_kyc(base_dir: str | None = None, submission_id: str | None = N
         "Address": address,
     }
 
+    return kyc
+
+
+def _write_user_kyc(kyc: Dict[str, Any], base_dir: str) -> None:
+    os.makedirs(base_dir, exist_ok=True)
     # Persist user_kyc.json (silent)
     out_path = os.path.join(base_dir, "user_kyc.json")
     try:
@@ -225,3 +247,52 @@ def generate_user_kyc(base_dir: str | None = None, submission_id: str | None = N
     except Exception:
         # keep function silent on error as requested
         pass
+
+
+def generate_user_kyc(base_dir: str | None = None, submission_id: str | None = None) -> None:
+    """
+    Consolidate KYC fields from documents in verification_documents into user_kyc.json.
+
+    See build_user_kyc for the field priorities.
+    
+    Args:
+        base_dir: Directory containing verification documents (aadhaar.json, pan.json, etc.)
+        submission_id: Optional submission ID to use submission-specific directory
+    """
+    if base_dir is None:
+        base_root = os.path.abspath(os.path.join(OUTPUT_DIR, os.pardir))
+        if submission_id:
+            base_dir = os.path.join(base_root, "verification_documents", submission_id)
+        else:
+            base_dir = os.path.join(base_root, "verification_documents")
+
+    # Load records (normalized lower-case keys)
+    records_by_type = {
+        doc_type: _load_records(os.path.join(base_dir, f"{doc_type}.json"))
+        for doc_type in ("aadhaar", "voter", "pan", "driving_licence", "passport")
+    }
+    _write_user_kyc(build_user_kyc(records_by_type), base_dir)
+
+
+def run_kyc_pipeline(submission_id: str | None = None) -> Dict[str, Any]:
+    """
+    Classify the extraction outputs and build user_kyc.json in one pass.
+
+    Each output is parsed at most once (files already classified as they were
+    extracted are not re-read); identity documents are copied, not moved, into
+    verification_documents/[{submission_id}/] and the KYC record is built from
+    the parsed content in memory.
+
+    Returns:
+        {"verification_dir", "documents": doc type -> source file name, "kyc": KYC object}
+    """
+    base_dir = os.path.join(OUTPUT_DIR, submission_id) if submission_id else OUTPUT_DIR
+    verification_dir = verification_dir_for(submission_id, base_dir)
+    documents = classify_verification_documents(base_dir, verification_dir)
+    kyc = build_user_kyc({doc_type: normalize_records(doc["data"]) for doc_type, doc in documents.items()})
+    _write_user_kyc(kyc, verification_dir)
+    return {
+        "verification_dir": verification_dir,
+        "documents": {doc_type: doc["file"] for doc_type, doc in documents.items()},
+        "kyc": kyc
+    }
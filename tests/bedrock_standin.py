@@ -0,0 +1,146 @@
+"""
+Local Bedrock stand-in that checks the shape of InvokeModel requests.
+
+It serves POST /model/{modelId}/invoke over plain HTTP, so the real boto3
+client reaches it through BEDROCK_ENDPOINT_URL. Every request body is checked
+against what build_request_body must send:
+- the user content is a plain string, or exactly two text blocks: the static
+  prefix carrying cache_control {"type": "ephemeral"} and the variable suffix
+  without it;
+- when a tool is given, "tools" holds exactly that tool and "tool_choice"
+  forces it by name.
+Malformed requests get a 400 ValidationException. Well-formed ones get a
+response whose usage reports cache_creation_input_tokens the first time a
+prefix is seen and cache_read_input_tokens afterwards, like Bedrock's prompt
+cache.
+
+tests/test_bedrock_standin.py points a boto3 client at it and asserts the
+round trip of analyze_with_claude.
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+ANTHROPIC_VERSION = "bedrock-2023-05-31"
+
+
+def check_request_shape(body: Dict[str, Any]) -> List[str]:
+    """Problems with one InvokeModel request body; empty when it is well-formed."""
+    problems = []
+    if body.get("anthropic_version") != ANTHROPIC_VERSION:
+        problems.append(f"anthropic_version must be {ANTHROPIC_VERSION!r}")
+    if not isinstance(body.get("max_tokens"), int):
+        problems.append("max_tokens must be an int")
+    messages = body.get("messages")
+    if not (isinstance(messages, list) and len(messages) == 1 and messages[0].get("role") == "user"):
+        return problems + ["messages must be exactly one user turn"]
+
+    content = messages[0].get("content")
+    if isinstance(content, list):
+        if len(content) != 2 or any(block.get("type") != "text" or not block.get("text") for block in content):
+            problems.append("block content must be two non-empty text blocks: prefix, then suffix")
+        elif content[0].get("cache_control") != {"type": "ephemeral"}:
+            problems.append("the prefix block must carry cache_control {'type': 'ephemeral'}")
+        elif "cache_control" in content[1]:
+            problems.append("only the prefix block may carry cache_control")
+    elif not isinstance(content, str) or not content:
+        problems.append("content must be a non-empty string or a list of text blocks")
+
+    tools = body.get("tools")
+    tool_choice = body.get("tool_choice")
+    if tools is not None or tool_choice is not None:
+        if not (isinstance(tools, list) and len(tools) == 1):
+            problems.append("tools must hold exactly the one forced tool")
+        else:
+            tool = tools[0]
+            if not tool.get("name") or not isinstance(tool.get("input_schema"), dict):
+                problems.append("the tool needs a name and an input_schema object")
+            if tool_choice != {"type": "tool", "name": tool.get("name")}:
+                problems.append("tool_choice must force the tool by name")
+    return problems
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class BedrockStandIn:
+    """
+    InvokeModel stand-in on 127.0.0.1.
+
+    Args:
+        respond: Builds the tool input for a tool request (default: {}); text requests get "{}"
+    """
+
+    def __init__(self, respond: Optional[Callable[[dict], Any]] = None, port: int = 0):
+        self.respond = respond or (lambda body: {})
+        self.requests: List[dict] = []
+        self._seen_prefixes = set()
+        self._lock = threading.Lock()
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except json.JSONDecodeError:
+                    body = {}
+                if not self.path.endswith("/invoke"):
+                    return self._send(404, {"message": f"Unsupported operation {self.path}"}, "UnknownOperationException")
+                problems = check_request_shape(body)
+                with standin._lock:
+                    standin.requests.append({"body": body, "problems": problems})
+                if problems:
+                    return self._send(400, {"message": "; ".join(problems)}, "ValidationException")
+                self._send(200, standin._response(body))
+
+            def _send(self, status: int, payload: dict, error_type: Optional[str] = None):
+                raw = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                if error_type:
+                    self.send_header("x-amzn-ErrorType", error_type)
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.endpoint_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def _response(self, body: dict) -> dict:
+        content = body["messages"][0]["content"]
+        usage = {"input_tokens": 0, "output_tokens": 16, "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0}
+        if isinstance(content, list):
+            prefix, suffix = content[0]["text"], content[1]["text"]
+            with self._lock:
+                seen = prefix in self._seen_prefixes
+                self._seen_prefixes.add(prefix)
+            usage["cache_read_input_tokens" if seen else "cache_creation_input_tokens"] = _estimate_tokens(prefix)
+            usage["input_tokens"] = _estimate_tokens(suffix)
+        else:
+            usage["input_tokens"] = _estimate_tokens(content)
+        if body.get("tools"):
+            tool = body["tools"][0]
+            blocks = [{"type": "tool_use", "id": "toolu_standin", "name": tool["name"], "input": self.respond(body)}]
+            stop_reason = "tool_use"
+        else:
+            blocks = [{"type": "text", "text": "{}"}]
+            stop_reason = "end_turn"
+        return {
+            "id": "msg_standin", "type": "message", "role": "assistant", "model": "standin",
+            "content": blocks, "stop_reason": stop_reason, "usage": usage
+        }
+
+    def start(self) -> "BedrockStandIn":
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
@@ -0,0 +1,22 @@
+"""
+Shared test setup.
+
+config.settings requires credentials and builds the module-level caches and
+clients on import, so dummy credentials and throwaway cache directories are
+set before any service module is imported. Bedrock and S3 are never reached:
+tests replace services.analyze.bedrock_client, and the extraction cache has
+no S3 tier.
+"""
+import os
+import tempfile
+
+_scratch = tempfile.mkdtemp(prefix="lnh-tests-")
+
+os.environ.setdefault("NANONETS_API_KEY", "test")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "test")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "test")
+os.environ.setdefault("AWS_REGION", "us-east-1")
+os.environ["LLM_CACHE_DIR"] = os.path.join(_scratch, "llm_cache")
+os.environ["EXTRACTION_CACHE_DIR"] = os.path.join(_scratch, "extraction_cache")
+os.environ["EXTRACTION_CACHE_S3_PREFIX"] = ""
+os.environ["JOBS_DIR"] = os.path.join(_scratch, "jobs")
@@ -0,0 +1,64 @@
+import json
+import asyncio
+
+import boto3
+import pytest
+
+import services.analyze as analyze
+from bedrock_standin import BedrockStandIn, check_request_shape
+
+TOOL = analyze.make_tool("record_check", "Record the check.", {"type": "object", "properties": {"ok": {"type": "boolean"}}})
+PREFIX = "Static instructions shared by every document. " * 40
+
+
+@pytest.fixture
+def standin(monkeypatch):
+    standin = BedrockStandIn(respond=lambda body: {"ok": True}).start()
+    client = boto3.client(
+        "bedrock-runtime",
+        aws_access_key_id="test",
+        aws_secret_access_key="test",
+        region_name="us-east-1",
+        endpoint_url=standin.endpoint_url
+    )
+    monkeypatch.setattr(analyze, "bedrock_client", client)
+    monkeypatch.setattr(analyze, "BEDROCK_PROMPT_CACHING", True)
+    yield standin
+    standin.stop()
+
+
+def test_requests_are_well_formed_and_prefix_is_cached(standin):
+    async def calls():
+        return [
+            await analyze.analyze_with_claude("document one", use_cache=False, cacheable_prefix=PREFIX, tool=TOOL),
+            await analyze.analyze_with_claude("document two", use_cache=False, cacheable_prefix=PREFIX, tool=TOOL),
+            await analyze.analyze_with_claude("plain prompt", use_cache=False),
+        ]
+
+    first, second, plain = asyncio.run(calls())
+
+    assert [r["success"] for r in (first, second, plain)] == [True, True, True]
+    assert [r["problems"] for r in standin.requests] == [[], [], []]
+    assert first["tool_use"] and json.loads(first["analysis"]) == {"ok": True}
+    assert first["usage"]["cache_creation_input_tokens"] > 0
+    assert first["usage"]["cache_read_input_tokens"] == 0
+    assert second["usage"]["cache_read_input_tokens"] > 0
+    assert second["usage"]["cache_creation_input_tokens"] == 0
+    assert plain["analysis"] == "{}" and not plain["tool_use"]
+
+
+def test_build_request_body_passes_shape_check():
+    assert check_request_shape(analyze.build_request_body("suffix", 16, 0.0, cacheable_prefix="prefix", tool=TOOL)) == []
+    assert check_request_shape(analyze.build_request_body("suffix", 16, 0.0)) == []
+
+
+def test_cache_marker_on_suffix_is_rejected():
+    body = analyze.build_request_body("suffix", 16, 0.0, cacheable_prefix="prefix", tool=TOOL)
+    body["messages"][0]["content"][1]["cache_control"] = {"type": "ephemeral"}
+    assert check_request_shape(body)
+
+
+def test_unforced_tool_choice_is_rejected():
+    body = analyze.build_request_body("suffix", 16, 0.0, tool=TOOL)
+    body["tool_choice"] = {"type": "auto"}
+    assert check_request_shape(body)
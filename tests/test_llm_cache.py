@@ -0,0 +1,77 @@
+import json
+
+from services.llm_cache import LLMResponseCache, make_cache_key, normalize_prompt
+
+MODEL = "model-id"
+
+
+def make_cache(tmp_path, ttl_seconds=3600):
+    return LLMResponseCache(str(tmp_path), ttl_seconds, memory_entries=8, max_bytes=1024 * 1024)
+
+
+def test_normalize_prompt_drops_only_surrounding_whitespace():
+    assert normalize_prompt("\n  first line   \r\nsecond\t\n\n") == "first line\nsecond"
+    assert normalize_prompt("a  b") == "a  b"
+
+
+def test_whitespace_variants_share_a_key():
+    key = make_cache_key(MODEL, "Analyze this.\nData: {}", 4096, 0.0)
+    assert make_cache_key(MODEL, "Analyze this.   \r\nData: {}\n\n", 4096, 0.0) == key
+    assert make_cache_key(MODEL, "Analyze this.\nData: {}", 4096, 0) == key
+
+
+def test_key_covers_model_and_parameters():
+    key = make_cache_key(MODEL, "prompt", 4096, 0.0)
+    assert make_cache_key("other-model", "prompt", 4096, 0.0) != key
+    assert make_cache_key(MODEL, "prompt", 2048, 0.0) != key
+    assert make_cache_key(MODEL, "prompt", 4096, 0.5) != key
+    assert make_cache_key(MODEL, "Prompt", 4096, 0.0) != key
+
+
+def test_hit_from_memory_and_from_disk(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put("k", "response", latency_ms=120.0)
+    assert cache.get("k")["text"] == "response"
+
+    reopened = make_cache(tmp_path)
+    assert reopened.get("k")["text"] == "response"
+    stats = reopened.stats()
+    assert stats["disk_hits"] == 1 and stats["saved_latency_ms"] == 120.0
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = make_cache(tmp_path, ttl_seconds=0)
+    cache.put("k", "response", latency_ms=1.0)
+    assert cache.get("k") is None
+    assert not (tmp_path / "k.json").exists()
+    stats = cache.stats()
+    assert stats["expired"] == 1 and stats["misses"] == 1
+
+
+def test_expired_disk_entry_is_removed(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put("k", "response", latency_ms=1.0)
+    path = tmp_path / "k.json"
+    entry = json.loads(path.read_text())
+    entry["expires_at"] = 0
+    path.write_text(json.dumps(entry))
+
+    reopened = make_cache(tmp_path)
+    assert reopened.get("k") is None
+    assert not path.exists()
+    assert reopened.stats()["expired"] == 1
+
+
+def test_invalidate_drops_both_tiers(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put("k", "response", latency_ms=1.0)
+    cache.invalidate("k")
+    assert cache.get("k") is None
+    assert not (tmp_path / "k.json").exists()
+
+
+def test_disabled_cache_stores_nothing(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "off"), 3600, memory_entries=8, max_bytes=1024, enabled=False)
+    cache.put("k", "response", latency_ms=1.0)
+    assert cache.get("k") is None
+    assert not (tmp_path / "off").exists()
@@ -0,0 +1,81 @@
+import threading
+
+import pytest
+
+import services.manifest as manifest
+
+
+@pytest.fixture(autouse=True)
+def dirs(monkeypatch, tmp_path):
+    monkeypatch.setattr(manifest, "OUTPUT_DIR", str(tmp_path / "outputs"))
+    monkeypatch.setattr(manifest, "ANALYSIS_OUTPUT_DIR", str(tmp_path / "analysis_outputs"))
+    return tmp_path
+
+
+def extracted(dirs, filename, sha256):
+    output = dirs / "outputs" / "sub" / f"{filename}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text("[]")
+    return {"success": True, "filename": filename, "sha256": sha256, "saved_to": str(output), "s3_key": None}
+
+
+def test_classify_new_changed_and_unchanged(dirs):
+    manifest.record_batch(
+        [extracted(dirs, "a.pdf", "aaa"), extracted(dirs, "b.pdf", "bbb")], {}, "sub"
+    )
+    statuses = manifest.classify_uploads({"a.pdf": "aaa", "b.pdf": "changed", "c.pdf": "ccc"}, "sub")
+    assert statuses == {"a.pdf": "unchanged", "b.pdf": "changed", "c.pdf": "new"}
+
+
+def test_missing_output_is_changed(dirs):
+    result = extracted(dirs, "a.pdf", "aaa")
+    manifest.record_batch([result], {}, "sub")
+    (dirs / "outputs" / "sub" / "a.pdf.json").unlink()
+    assert manifest.classify_uploads({"a.pdf": "aaa"}, "sub") == {"a.pdf": "changed"}
+
+
+def test_record_batch_skips_failures_and_summarizes(dirs):
+    results = [
+        extracted(dirs, "a.pdf", "aaa"),
+        {"success": False, "filename": "bad.pdf", "error": "boom"},
+        extracted(dirs, "b.pdf", "bbb"),
+    ]
+    batch = manifest.record_batch(results, {"a.pdf": "new", "b.pdf": "changed", "bad.pdf": "new"}, "sub")
+    assert (batch["new"], batch["changed"], batch["failed"]) == (["a.pdf"], ["b.pdf"], ["bad.pdf"])
+    files = manifest.load_manifest("sub")["files"]
+    assert set(files) == {"a.pdf", "b.pdf"}
+    assert files["a.pdf"]["sha256"] == "aaa"
+    assert manifest.unchanged_result("a.pdf", "sub")["skipped"] is True
+
+
+def test_concurrent_batches_keep_every_entry(dirs):
+    threads = [
+        threading.Thread(target=manifest.record_batch, args=([extracted(dirs, f"f{n}.pdf", str(n))], {}, "sub"))
+        for n in range(20)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(manifest.load_manifest("sub")["files"]) == 20
+
+
+def test_remove_stale_analyses_and_summaries(dirs):
+    analysis_dir = dirs / "analysis_outputs" / "sub"
+    analysis_dir.mkdir(parents=True)
+    names = [
+        "report_analysis_20250101.json",
+        "report_summary_20250101.json",
+        "report2_analysis_20250101.json",
+        "other_analysis_20250101.json",
+    ]
+    for name in names:
+        (analysis_dir / name).write_text("{}")
+
+    removed = manifest.remove_stale_analyses(["report.pdf"], "sub")
+    assert sorted(removed) == ["report_analysis_20250101.json", "report_summary_20250101.json"]
+    assert sorted(p.name for p in analysis_dir.iterdir()) == sorted(names[2:])
+
+
+def test_remove_stale_analyses_without_directory():
+    assert manifest.remove_stale_analyses(["report.pdf"], "missing") == []
@@ -0,0 +1,91 @@
+import json
+
+import services.prompt_encoding as pe
+from services.prompt_encoding import dedupe_records, encode_for_prompt, estimate_tokens, prune
+
+
+def page(n, **fields):
+    return {"page": n, "insurer": "Acme Life", "form": "Proposal", **fields}
+
+
+def test_prune_drops_boilerplate_empty_values_and_hindi_duplicates():
+    record = {"name": "Asha", "name_hindi": "आशा", "website": "acme.example", "notes": "", "tags": [None, {}]}
+    assert prune(record) == {"name": "Asha"}
+    assert prune({"name_hindi": "आशा"}) == {"name_hindi": "आशा"}
+
+
+def test_dedupe_without_repeats_returns_the_list():
+    records = [{"a": 1}, {"a": 2}, {"b": 3}]
+    assert dedupe_records(records) == records
+
+
+def test_dedupe_drops_exact_duplicates():
+    assert dedupe_records([{"a": 1}, {"a": 1}, {"a": 2}]) == [{"a": 1}, {"a": 2}]
+
+
+def test_dedupe_hoists_fields_repeated_on_most_records():
+    records = [page(n, value=n) for n in range(1, 5)]
+    result = dedupe_records(records)
+    assert result["repeated_fields"] == {"insurer": "Acme Life", "form": "Proposal"}
+    assert result["records"] == [{"page": n, "value": n} for n in range(1, 5)]
+
+
+def test_dedupe_keeps_fields_with_differing_values():
+    records = [page(n) for n in range(1, 4)] + [page(4, insurer="Other")]
+    result = dedupe_records(records)
+    assert "insurer" not in result["repeated_fields"]
+    assert [r["insurer"] for r in result["records"]] == ["Acme Life"] * 3 + ["Other"]
+
+
+def test_dedupe_needs_three_repeats():
+    records = [page(1), page(2)]
+    assert dedupe_records(records) == records
+
+
+def test_encoding_within_budget_is_lossless():
+    records = [{"page": n, "text": f"line {n}"} for n in range(10)]
+    assert json.loads(encode_for_prompt(records, token_budget=10_000, record_stats=False)) == records
+
+
+def test_budget_truncates_long_strings_first():
+    records = [{"text": "x" * 5000}]
+    encoded = json.loads(encode_for_prompt(records, token_budget=1000, record_stats=False))
+    assert len(encoded) == 1
+    assert encoded[0]["text"].endswith("…[truncated]")
+    assert len(encoded[0]["text"]) < pe.MAX_STRING_CHARS + 20
+
+
+def test_budget_drops_trailing_records_with_a_marker():
+    records = [{"page": n, "text": f"{n} " + "y" * 400} for n in range(50)]
+    encoded_text = encode_for_prompt(records, token_budget=1000, record_stats=False)
+    encoded = json.loads(encoded_text)
+    assert estimate_tokens(encoded_text) <= 1000
+    assert encoded[:-1] == records[:len(encoded) - 1]
+    assert encoded[-1] == {"_omitted_records": 50 - (len(encoded) - 1), "_reason": "prompt token budget"}
+
+
+def test_budget_keeps_hoisted_fields():
+    records = [page(n, text=f"{n} " + "z" * 400) for n in range(50)]
+    encoded = json.loads(encode_for_prompt(records, token_budget=1000, record_stats=False))
+    assert encoded["repeated_fields"] == {"insurer": "Acme Life", "form": "Proposal"}
+    assert "_omitted_records" in encoded["records"][-1]
+
+
+def test_fit_budget_off_never_truncates():
+    records = [{"page": n, "text": f"{n} " + "y" * 4000} for n in range(20)]
+    encoded = json.loads(encode_for_prompt(records, token_budget=100, fit_budget=False, record_stats=False))
+    assert encoded == records
+
+
+def test_stats_are_recorded_only_when_asked(monkeypatch):
+    stats = {"prompts": 0, "baseline_chars": 0, "encoded_chars": 0, "truncated": 0}
+    monkeypatch.setattr(pe, "prompt_encoding_stats", stats)
+    records = [{"page": n, "text": f"{n} " + "y" * 400} for n in range(50)]
+
+    encode_for_prompt(records, token_budget=1000, record_stats=False)
+    assert stats["prompts"] == 0
+
+    encoded = encode_for_prompt(records, token_budget=1000)
+    assert stats["prompts"] == 1 and stats["truncated"] == 1
+    assert stats["encoded_chars"] == len(encoded)
+    assert stats["baseline_chars"] == len(json.dumps(records, indent=2))
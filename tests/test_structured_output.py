@@ -0,0 +1,101 @@
+import io
+import json
+import asyncio
+
+import pytest
+
+import services.analyze as analyze
+from services.llm_cache import LLMResponseCache
+
+TOOL = analyze.make_tool(
+    "record_person", "Record the person.",
+    {"type": "object", "properties": {"name": {"type": "string"}}, "required": ["name"]}
+)
+
+
+def validate(data):
+    return (True, "") if isinstance(data.get("name"), str) else (False, "Missing required field: name")
+
+
+class FakeBedrock:
+    """Answers invoke_model with the queued tool inputs (or raw text), one per call."""
+
+    def __init__(self, *outputs):
+        self.outputs = list(outputs)
+        self.prompts = []
+
+    def invoke_model(self, body, **kwargs):
+        request = json.loads(body)
+        content = request["messages"][0]["content"]
+        self.prompts.append(content if isinstance(content, str) else "".join(b["text"] for b in content))
+        output = self.outputs.pop(0)
+        if isinstance(output, str):
+            blocks = [{"type": "text", "text": output}]
+        else:
+            blocks = [{"type": "tool_use", "id": "toolu_1", "name": TOOL["name"], "input": output}]
+        return {"body": io.BytesIO(json.dumps({"content": blocks, "usage": {}}).encode("utf-8"))}
+
+
+@pytest.fixture
+def stats(monkeypatch, tmp_path):
+    monkeypatch.setattr(analyze, "llm_cache", LLMResponseCache(str(tmp_path), 3600, 8, 1024 * 1024))
+    monkeypatch.setattr(analyze, "STRUCTURED_OUTPUT_TOOLS", True)
+    monkeypatch.setattr(analyze, "STRUCTURED_OUTPUT_MAX_REPAIRS", 1)
+    counters = dict.fromkeys(analyze.structured_output_stats, 0)
+    monkeypatch.setattr(analyze, "structured_output_stats", counters)
+    return counters
+
+
+def run(fake, monkeypatch, prompt="Extract the person from: Asha Rao, 34", use_cache=False):
+    monkeypatch.setattr(analyze, "bedrock_client", fake)
+    return asyncio.run(analyze.analyze_structured(prompt, TOOL, validate, use_cache=use_cache))
+
+
+def test_valid_output_needs_no_repair(stats, monkeypatch):
+    result = run(FakeBedrock({"name": "Asha Rao"}), monkeypatch)
+    assert result["success"] and result["analysis"] == {"name": "Asha Rao"} and result["repairs"] == 0
+    assert stats == {
+        "responses": 1, "tool_responses": 1, "parse_failures": 0, "validation_failures": 0,
+        "repair_calls": 0, "repaired": 0, "failed": 0
+    }
+
+
+def test_invalid_output_is_repaired_once(stats, monkeypatch):
+    fake = FakeBedrock({"full_name": "Asha Rao"}, {"name": "Asha Rao"})
+    result = run(fake, monkeypatch)
+
+    assert result["success"] and result["analysis"] == {"name": "Asha Rao"} and result["repairs"] == 1
+    assert stats == {
+        "responses": 2, "tool_responses": 2, "parse_failures": 0, "validation_failures": 1,
+        "repair_calls": 1, "repaired": 1, "failed": 0
+    }
+    # the repair call carries the invalid output and its error, not the source document
+    assert "Asha Rao, 34" not in fake.prompts[1]
+    assert '"full_name"' in fake.prompts[1] and "Missing required field: name" in fake.prompts[1]
+
+
+def test_unparseable_output_counts_a_parse_failure(stats, monkeypatch):
+    result = run(FakeBedrock("not json at all", {"name": "Asha Rao"}), monkeypatch)
+    assert result["success"] and result["repairs"] == 1
+    assert stats["parse_failures"] == 1 and stats["tool_responses"] == 1 and stats["repaired"] == 1
+
+
+def test_gives_up_after_max_repairs(stats, monkeypatch):
+    result = run(FakeBedrock({"full_name": "A"}, {"full_name": "B"}), monkeypatch)
+    assert not result["success"] and result["repairs"] == 1
+    assert "Missing required field: name" in result["error"]
+    assert stats["validation_failures"] == 2 and stats["repair_calls"] == 1 and stats["failed"] == 1
+    assert stats["repaired"] == 0
+
+
+def test_only_valid_outputs_are_cached(stats, monkeypatch):
+    run(FakeBedrock({"full_name": "Asha Rao"}, {"name": "Asha Rao"}), monkeypatch)
+
+    # the original prompt's invalid answer was not stored, so it is asked again
+    fake = FakeBedrock({"name": "Asha Rao"})
+    result = run(fake, monkeypatch, use_cache=True)
+    assert result["success"] and not result["cached"] and len(fake.prompts) == 1
+
+    replay = run(FakeBedrock(), monkeypatch, use_cache=True)
+    assert replay["success"] and replay["cached"] and replay["analysis"] == {"name": "Asha Rao"}
+    assert stats["responses"] == 4
@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+import services.summary_merge as summary_merge
+
+
+class FakeModel:
+    """Stands in for analyze_structured and records the conflicts it was asked about."""
+
+    def __init__(self, answer=None):
+        self.answer = answer
+        self.tools = []
+
+    async def __call__(self, prompt, tool, validate, **kwargs):
+        self.tools.append(tool)
+        if self.answer is None:
+            return {"success": False, "error": "model unavailable"}
+        return {"success": True, "analysis": self.answer, "repairs": 0}
+
+    @property
+    def asked(self):
+        return [sorted(tool["input_schema"]["properties"]) for tool in self.tools]
+
+
+@pytest.fixture
+def model(monkeypatch):
+    fake = FakeModel()
+    monkeypatch.setattr(summary_merge, "analyze_structured", fake)
+    return fake
+
+
+def entry(doc_type, source_file, **sections):
+    return {"document_type": doc_type, "source_file": source_file, "summary": sections}
+
+
+def merge(*entries):
+    return asyncio.run(summary_merge.merge_structured_summaries("life", list(entries), use_cache=False))
+
+
+def test_agreeing_values_merge_locally(model):
+    summary, stats = merge(
+        entry("proposal_form", "a.pdf", applicant={"name": "Asha Rao"}),
+        entry("bank_statement", "b.pdf", applicant={"name": "  asha   RAO "}),
+    )
+    assert summary["applicant"]["name"] == "Asha Rao"
+    assert stats["local"] == 1 and stats["model_calls"] == 0 and model.tools == []
+
+
+def test_empty_fields_are_counted(model):
+    summary, stats = merge(entry("proposal_form", "a.pdf", applicant={"name": "Asha Rao", "fathersName": "N/A"}))
+    assert summary["applicant"]["fathersName"] is None
+    assert stats["local"] == 1 and stats["empty"] == stats["fields"] - 1
+
+
+def test_top_priority_document_wins(model):
+    summary, stats = merge(
+        entry("bank_statement", "b.pdf", applicant={"dateOfBirth": "02/01/1990"}),
+        entry("id_document", "id.pdf", applicant={"dateOfBirth": "01/02/1990"}),
+    )
+    assert summary["applicant"]["dateOfBirth"] == "01/02/1990"
+    assert stats["conflicts"] == [] and model.tools == []
+
+
+def test_section_field_priority_overrides_section(model):
+    summary, _ = merge(
+        entry("id_document", "id.pdf", applicant={"address": "12 MG Road"}),
+        entry("proposal_form", "p.pdf", applicant={"address": "Flat 4, 12 MG Road, Pune"}),
+    )
+    assert summary["applicant"]["address"] == "Flat 4, 12 MG Road, Pune"
+
+
+def test_fuller_text_wins_between_equal_priorities(model):
+    summary, stats = merge(
+        entry(None, "a.pdf", applicant={"fathersName": "Ravi Rao"}),
+        entry(None, "b.pdf", applicant={"fathersName": "Ravi Kumar Rao"}),
+    )
+    assert summary["applicant"]["fathersName"] == "Ravi Kumar Rao"
+    assert model.tools == []
+
+
+def test_numeric_disagreement_goes_to_the_model(model):
+    model.answer = {"policyDetails.coverageAmount": "10 lakh"}
+    summary, stats = merge(
+        entry("proposal_form", "p1.pdf", policyDetails={"coverageAmount": "5 lakh"}),
+        entry("proposal_form", "p2.pdf", policyDetails={"coverageAmount": "10 lakh"}),
+    )
+    assert model.asked == [["policyDetails.coverageAmount"]]
+    assert summary["policyDetails"]["coverageAmount"] == "10 lakh"
+    assert stats["conflicts"] == ["policyDetails.coverageAmount"]
+    assert (stats["model_calls"], stats["model"], stats["model_fallback"]) == (1, 1, 0)
+
+
+def test_negated_text_is_a_conflict(model):
+    model.answer = {"lifestyleAssessment.smokingStatus": "Non-smoker"}
+    summary, _ = merge(
+        entry(None, "a.pdf", lifestyleAssessment={"smokingStatus": "Smoker"}),
+        entry(None, "b.pdf", lifestyleAssessment={"smokingStatus": "Non-smoker"}),
+    )
+    assert model.asked == [["lifestyleAssessment.smokingStatus"]]
+    assert summary["lifestyleAssessment"]["smokingStatus"] == "Non-smoker"
+
+
+def test_model_failure_keeps_the_best_candidate(model):
+    summary, stats = merge(
+        entry("bank_statement", "b.pdf", lifestyleAssessment={"alcoholConsumption": "Daily"}),
+        entry("lab_report", "lab.pdf", lifestyleAssessment={"alcoholConsumption": "Occasional"}),
+        entry("lab_report", "lab2.pdf", lifestyleAssessment={"alcoholConsumption": "Weekly"}),
+    )
+    assert model.asked == [["lifestyleAssessment.alcoholConsumption"]]
+    assert summary["lifestyleAssessment"]["alcoholConsumption"] == "Occasional"
+    assert (stats["model_calls"], stats["model"], stats["model_fallback"]) == (1, 0, 1)
+
+
+def test_one_model_call_for_all_conflicts(model):
+    model.answer = {"applicant.name": "Asha Rao", "policyDetails.planName": "Term Plus"}
+    _, stats = merge(
+        entry(None, "a.pdf", applicant={"name": "Asha Rao"}, policyDetails={"planName": "Term Plus"}),
+        entry(None, "b.pdf", applicant={"name": "Usha Rao"}, policyDetails={"planName": "Term Max"}),
+    )
+    assert model.asked == [["applicant.name", "policyDetails.planName"]]
+    assert stats["model"] == 2
@@ -15,6 +15,10 @@ class S3Service:
             region_name=AWS_REGION
         )
         self.bucket = LN_H_SUBMISSION_S3_BUCKET
+
+    def url_for(self, s3_key: str) -> str:
+        """Public URL of an object in the submissions bucket"""
+        return f"https://{self.bucket}.s3.{AWS_REGION}.amazonaws.com/{s3_key}"
     
     def upload_file(self, file_path: str, s3_key: str, content_type: Optional[str] = None) -> str:
         """
@@ -40,8 +44,7 @@ class S3Service:
         )
         
         # Return public URL
-        url = f"https://{self.bucket}.s3.{AWS_REGION}.amazonaws.com/{s3_key}"
-        return url
+        return self.url_for(s3_key)
     
     def upload_fileobj(self, file_obj, s3_key: str, content_type: Optional[str] = None) -> str:
         """
@@ -67,8 +70,7 @@ class S3Service:
         )
         
         # Return public URL
-        url = f"https://{self.bucket}.s3.{AWS_REGION}.amazonaws.com/{s3_key}"
-        return url
+        return self.url_for(s3_key)
     
     def download_file(self, s3_key: str, local_path: str) -> bool:
         """
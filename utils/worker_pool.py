@@ -0,0 +1,98 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+from config.settings import BEDROCK_MAX_CONCURRENCY, EXTRACTION_MAX_CONCURRENCY
+
+
+class WorkerPool:
+    """
+    Long-lived thread pool for blocking upstream calls (Bedrock, Nanonets, S3).
+
+    Handlers await `run()` instead of creating their own executors, so the number
+    of in-flight upstream calls is capped process-wide by `max_workers` and the
+    pool threads are reused across requests.
+    """
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-pool")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._peak_queued = 0
+        self._completed = 0
+        self._failed = 0
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run a blocking callable on the pool and await its result.
+
+        Args:
+            func: Blocking callable to execute
+            *args, **kwargs: Arguments forwarded to `func`
+
+        Returns:
+            Whatever `func` returns; exceptions raised by `func` propagate to the caller
+        """
+        loop = asyncio.get_running_loop()
+        state = {"started": False, "cancelled": False}
+
+        def job():
+            with self._lock:
+                if state["cancelled"]:
+                    return None
+                state["started"] = True
+                self._queued -= 1
+                self._running += 1
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+        with self._lock:
+            self._queued += 1
+            self._peak_queued = max(self._peak_queued, self._queued)
+        try:
+            result = await loop.run_in_executor(self._executor, job)
+        except asyncio.CancelledError:
+            # A job cancelled before it started never leaves the queue on its own
+            with self._lock:
+                if not state["started"]:
+                    state["cancelled"] = True
+                    self._queued -= 1
+            raise
+        except Exception:
+            with self._lock:
+                self._failed += 1
+            raise
+        with self._lock:
+            self._completed += 1
+        return result
+
+    def stats(self) -> dict:
+        """Snapshot of queue depth and throughput counters for this pool."""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "queued": self._queued,
+                "running": self._running,
+                "peak_queued": self._peak_queued,
+                "completed": self._completed,
+                "failed": self._failed,
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Global pools: Bedrock calls and Nanonets extraction are kept apart so long
+# OCR polling cannot starve LLM calls of worker threads.
+bedrock_pool = WorkerPool("bedrock", BEDROCK_MAX_CONCURRENCY)
+extraction_pool = WorkerPool("extraction", EXTRACTION_MAX_CONCURRENCY)
+
+
+def pool_stats() -> dict:
+    return {pool.name: pool.stats() for pool in (bedrock_pool, extraction_pool)}